@@ -0,0 +1,89 @@
+"""
+Synthetic Datasets - Deterministic sales-like result sets for the benchmarks
+"""
+import random
+from datetime import date, timedelta
+
+TABLE = 'tabBenchmark Sales'
+
+REGIONS = ('North', 'South', 'East', 'West', 'Central', 'Export', 'Online', 'Retail')
+STATUSES = ('Paid', 'Unpaid', 'Overdue', 'Cancelled')
+ITEM_GROUPS = 50
+
+# Share of rows whose amount is empty, to exercise the null handling paths
+NULL_RATIO = 0.02
+
+COLUMNS = [
+	{'field_name': 'region', 'display_label': 'Region', 'field_type': 'Data'},
+	{'field_name': 'customer', 'display_label': 'Customer', 'field_type': 'Data'},
+	{'field_name': 'item_group', 'display_label': 'Item Group', 'field_type': 'Data'},
+	{'field_name': 'posting_date', 'display_label': 'Posting Date', 'field_type': 'Date'},
+	{'field_name': 'status', 'display_label': 'Status', 'field_type': 'Data'},
+	{'field_name': 'qty', 'display_label': 'Qty', 'field_type': 'Int'},
+	{'field_name': 'rate', 'display_label': 'Rate', 'field_type': 'Currency', 'format': '#,##0.00'},
+	{'field_name': 'amount', 'display_label': 'Amount', 'field_type': 'Currency', 'format': '#,##0.00'},
+	{'field_name': 'remarks', 'display_label': 'Remarks', 'field_type': 'Data'}
+]
+
+GROUPING_FIELDS = ['region', 'customer']
+SUBTOTAL_FIELDS = [
+	{'field': 'qty', 'operation': 'SUM'},
+	{'field': 'amount', 'operation': 'SUM'},
+	{'field': 'rate', 'operation': 'AVG'}
+]
+
+def generate_rows(rows, cardinality=100, seed=42):
+	"""
+	Return rows sales records with cardinality distinct customers
+	The same arguments always produce the same data.
+	"""
+	rng = random.Random(seed)
+	customers = [f"CUST-{index:07d}" for index in range(max(int(cardinality), 1))]
+	item_groups = [f"Item Group {index:02d}" for index in range(ITEM_GROUPS)]
+	start = date(2024, 1, 1)
+	dates = [(start + timedelta(days=day)).isoformat() for day in range(366)]
+	remarks = [f"Order remark {index} " + 'x' * (index % 24) for index in range(64)]
+
+	data = []
+	for _ in range(int(rows)):
+		qty = rng.randint(1, 500)
+		rate = round(rng.uniform(1, 2500), 2)
+		data.append({
+			'region': rng.choice(REGIONS),
+			'customer': rng.choice(customers),
+			'item_group': rng.choice(item_groups),
+			'posting_date': rng.choice(dates),
+			'status': rng.choice(STATUSES),
+			'qty': qty,
+			'rate': rate,
+			'amount': None if rng.random() < NULL_RATIO else round(qty * rate, 2),
+			'remarks': rng.choice(remarks)
+		})
+	return data
+
+def load_table(db, data):
+	"""
+	Create the benchmark table on a stub database and insert data into it
+	"""
+	fields = [col['field_name'] for col in COLUMNS]
+	db.sql(f"DROP TABLE IF EXISTS `{TABLE}`")
+	db.sql(f"CREATE TABLE `{TABLE}` ({', '.join(f'`{field}`' for field in fields)})")
+	db.executemany(
+		f"INSERT INTO `{TABLE}` VALUES ({', '.join(['%s'] * len(fields))})",
+		([record[field] for field in fields] for record in data)
+	)
+	db.commit()
+
+def get_query():
+	return f"SELECT region, customer, item_group, posting_date, status, qty, rate, amount FROM `{TABLE}`"
+
+def get_filters():
+	"""
+	Filters selecting roughly a third of the rows, one of each operator family
+	"""
+	return [
+		{'field': 'region', 'operator': 'IN', 'value': ','.join(REGIONS[:4])},
+		{'field': 'status', 'operator': '!=', 'value': 'Cancelled'},
+		{'field': 'posting_date', 'operator': '>=', 'value': '2024-04-01'},
+		{'field': 'qty', 'operator': '<=', 'value': 400}
+	]
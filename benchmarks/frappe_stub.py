@@ -0,0 +1,207 @@
+"""
+Frappe Stub - Minimal frappe module for running the benchmarks without a site
+frappe.db is an in-memory SQLite database, the cache is a dict and File
+records are not stored, so the benchmarks time this app's code rather
+than a database server or a bench.
+"""
+import atexit
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import ModuleType, SimpleNamespace
+
+class _Dict(dict):
+	def __getattr__(self, key):
+		return self.get(key)
+
+	def __setattr__(self, key, value):
+		self[key] = value
+
+class ValidationError(Exception):
+	pass
+
+class DoesNotExistError(ValidationError):
+	pass
+
+class PermissionError(Exception):
+	pass
+
+class Database:
+	"""
+	frappe.db backed by a SQLite connection, in memory by default
+	%s placeholders and backtick quoting are accepted as on MariaDB.
+	"""
+	db_type = 'sqlite'
+
+	def __init__(self, path=':memory:'):
+		self.conn = sqlite3.connect(path, check_same_thread=False)
+		self._cursor = None
+
+	def sql(self, query, values=None, as_dict=False, as_list=False, as_iterator=False, **kwargs):
+		query = query.replace('%s', '?').replace('%%', '%')
+		cursor = self._cursor = self.conn.execute(query, tuple(values or ()))
+		if as_dict:
+			keys = [column[0] for column in cursor.description or ()]
+			rows = (dict(zip(keys, row)) for row in cursor)
+		else:
+			rows = iter(cursor)
+		return rows if as_iterator else list(rows)
+
+	def executemany(self, query, rows):
+		self.conn.executemany(query.replace('%s', '?'), rows)
+
+	@contextmanager
+	def unbuffered_cursor(self):
+		yield
+
+	def get_value(self, *args, **kwargs):
+		return None
+
+	def set_value(self, *args, **kwargs):
+		pass
+
+	def count(self, *args, **kwargs):
+		return 0
+
+	def commit(self):
+		self.conn.commit()
+
+	def rollback(self):
+		self.conn.rollback()
+
+	def close(self):
+		self.conn.close()
+
+class ReplicaDatabase(Database):
+	"""
+	A SQLite stand-in for a read replica with a fixed replication lag
+	"""
+	def __init__(self, path=':memory:', lag=0):
+		super().__init__(path)
+		self.lag = lag
+
+	def get_replication_lag(self):
+		return self.lag
+
+def connect_replica(replica):
+	"""
+	Replica connector for jmit_report_replica_connector
+	Replica entries name a SQLite file as "path" and may set a simulated "lag".
+	"""
+	return ReplicaDatabase(replica.get('path') or ':memory:', float(replica.get('lag') or 0))
+
+class LocalProxy:
+	"""Forwards to an attribute of frappe.local, as frappe.db does"""
+	def __init__(self, local, name):
+		object.__setattr__(self, '_local', local)
+		object.__setattr__(self, '_name', name)
+
+	def __getattr__(self, key):
+		return getattr(getattr(self._local, self._name), key)
+
+	def __setattr__(self, key, value):
+		setattr(getattr(self._local, self._name), key, value)
+
+class Cache:
+	def __init__(self):
+		self.data = {}
+
+	def get_value(self, key, *args, **kwargs):
+		return self.data.get(key)
+
+	def set_value(self, key, value, expires_in_sec=None, *args, **kwargs):
+		self.data[key] = value
+
+	def delete_value(self, key, *args, **kwargs):
+		self.data.pop(key, None)
+
+class Document(_Dict):
+	def insert(self, *args, **kwargs):
+		self.setdefault('name', uuid.uuid4().hex[:10])
+		return self
+
+	def save(self, *args, **kwargs):
+		return self
+
+def install(site_path=None):
+	"""
+	Register the stub as the frappe package and return it
+	Files written by exports go under site_path, a temporary directory by default.
+	"""
+	if not site_path:
+		site_path = tempfile.mkdtemp(prefix='jmit_bench_site_')
+		atexit.register(shutil.rmtree, site_path, ignore_errors=True)
+	os.makedirs(os.path.join(site_path, 'private', 'files'), exist_ok=True)
+	cache = Cache()
+
+	frappe = ModuleType('frappe')
+	frappe.__path__ = []
+	frappe.ValidationError = ValidationError
+	frappe.DoesNotExistError = DoesNotExistError
+	frappe.PermissionError = PermissionError
+	frappe.conf = _Dict(jmit_report_execution_log=0)
+	frappe.flags = _Dict()
+	frappe.local = SimpleNamespace(site='benchmark', sites_path=site_path, conf=frappe.conf, response=_Dict(), db=Database())
+	frappe.session = SimpleNamespace(user='Administrator')
+	frappe.db = LocalProxy(frappe.local, 'db')
+	frappe.cache = lambda: cache
+	frappe.logger = lambda *args, **kwargs: logging.getLogger('frappe')
+	frappe.as_json = lambda obj, indent=1, separators=None: json.dumps(obj, default=str, indent=indent, separators=separators)
+	frappe.generate_hash = lambda *args, length=10, **kwargs: uuid.uuid4().hex[:length]
+	frappe.get_site_path = lambda *parts: os.path.join(site_path, *parts)
+	frappe.get_roles = lambda *args: ['System Manager']
+	frappe.get_request_header = lambda key, default=None: default
+	frappe.get_all = lambda *args, **kwargs: []
+	frappe.get_doc = lambda doc, *args: Document(doc) if isinstance(doc, dict) else Document(doctype=doc, name=args[0] if args else None)
+	frappe.msgprint = lambda *args, **kwargs: None
+	frappe.publish_realtime = lambda *args, **kwargs: None
+	frappe._ = lambda text: text
+	frappe.only_for = lambda *args, **kwargs: None
+	frappe.has_permission = lambda *args, **kwargs: True
+
+	def get_attr(path):
+		module, _, name = path.rpartition('.')
+		return getattr(sys.modules.get(module) or __import__(module, fromlist=[name]), name)
+	frappe.get_attr = get_attr
+
+	def throw(message, exc=ValidationError, *args, **kwargs):
+		raise exc(message)
+	frappe.throw = throw
+
+	def whitelist(*args, **kwargs):
+		if args and callable(args[0]):
+			return args[0]
+		return lambda fn: fn
+
+	decorators = ModuleType('frappe.decorators')
+	decorators.whitelist = whitelist
+	frappe.whitelist = whitelist
+
+	utils = ModuleType('frappe.utils')
+	utils.now_datetime = datetime.now
+	utils.now = lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+	utils.add_days = lambda date, days: date + timedelta(days=days)
+	utils.cint = lambda value: int(value or 0)
+	utils.flt = lambda value, precision=None: float(value or 0)
+
+	deferred_insert = ModuleType('frappe.deferred_insert')
+	deferred_insert.deferred_insert = lambda doctype, records: None
+
+	modules = {
+		'frappe': frappe,
+		'frappe.decorators': decorators,
+		'frappe.utils': utils,
+		'frappe.deferred_insert': deferred_insert
+	}
+	for name, module in modules.items():
+		sys.modules[name] = module
+		if name != 'frappe':
+			setattr(frappe, name.split('.', 1)[1], module)
+	return frappe
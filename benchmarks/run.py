@@ -0,0 +1,293 @@
+"""
+Benchmark Runner - Times the query engine and exporters on synthetic data
+
+	python benchmarks/run.py run --rows 10000,100000 --cardinality 10,1000 --output results.json
+	python benchmarks/run.py compare baseline.json results.json --threshold 0.15
+	python benchmarks/run.py run --compare baseline.json
+
+Results are written as JSON. compare exits with status 1 when a benchmark got
+slower than the baseline by more than the threshold, so it can gate CI.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import frappe_stub
+
+frappe = frappe_stub.install()
+
+import datasets
+import jmit_report_builder
+from jmit_report_builder.api import export, query_engine
+from jmit_report_builder.api.columnar import is_available as columnar_available
+from jmit_report_builder.utils import get_report_statistics
+
+RESULT_FORMAT = 1
+DEFAULT_ROWS = '10000,100000'
+DEFAULT_CARDINALITY = '10,1000'
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.15
+# Differences below this many seconds are treated as noise by compare
+DEFAULT_MIN_DELTA = 0.005
+
+def bench_apply_filters(dataset):
+	"""Compile the filters into the query and fetch the matching rows"""
+	query, filters = datasets.get_query(), datasets.get_filters()
+	def run():
+		sql, values = query_engine.apply_filters(query, filters, 'benchmark')
+		return frappe.db.sql(sql, values, as_dict=True)
+	return run
+
+def bench_apply_grouping_and_subtotals(dataset):
+	return lambda: query_engine.apply_grouping_and_subtotals(
+		dataset['data'], datasets.GROUPING_FIELDS, datasets.SUBTOTAL_FIELDS
+	)
+
+def bench_apply_grouping_columnar(dataset):
+	return lambda: query_engine.group_records(
+		dataset['data'], datasets.GROUPING_FIELDS, datasets.SUBTOTAL_FIELDS, backend='columnar'
+	)
+
+def bench_get_report_statistics(dataset):
+	return lambda: get_report_statistics(dataset['data'])
+
+def bench_export_to_csv(dataset):
+	return lambda: check_export(export.export_to_csv('Benchmark', dataset['data']))
+
+def bench_export_to_excel(dataset):
+	def run():
+		result = check_export(export.export_to_excel('Benchmark', dataset['data'], datasets.COLUMNS))
+		os.remove(frappe.get_site_path('private', 'files', result['file_url'].rsplit('/', 1)[1]))
+	return run
+
+def bench_generate_html_from_data(dataset):
+	return lambda: export.generate_html_from_data('Benchmark', dataset['data'], datasets.COLUMNS)
+
+def check_export(result):
+	if not result.get('success'):
+		raise RuntimeError(result.get('message'))
+	return result
+
+# name: (factory, whether the rows must be loaded into the stub database, requirement)
+BENCHMARKS = {
+	'apply_filters': (bench_apply_filters, True, None),
+	'apply_grouping_and_subtotals': (bench_apply_grouping_and_subtotals, False, None),
+	'apply_grouping_columnar': (bench_apply_grouping_columnar, False, 'numpy'),
+	'get_report_statistics': (bench_get_report_statistics, False, None),
+	'export_to_csv': (bench_export_to_csv, False, None),
+	'export_to_excel': (bench_export_to_excel, False, 'openpyxl'),
+	'generate_html_from_data': (bench_generate_html_from_data, False, None)
+}
+
+def is_requirement_met(requirement):
+	if requirement == 'numpy':
+		return columnar_available()
+	if requirement:
+		try:
+			__import__(requirement)
+		except ImportError:
+			return False
+	return True
+
+def run_benchmarks(rows_list, cardinalities, names, repeat=DEFAULT_REPEAT, seed=42, log=print):
+	"""
+	Run the named benchmarks over every rows x cardinality dataset
+	Returns the results document.
+	"""
+	results = {}
+	skipped = []
+	for name in names:
+		requirement = BENCHMARKS[name][2]
+		if not is_requirement_met(requirement):
+			skipped.append(name)
+			log(f"skip {name}: {requirement} is not installed")
+
+	for rows in rows_list:
+		for cardinality in cardinalities:
+			log(f"generating {rows} rows, {cardinality} customers")
+			dataset = {'data': datasets.generate_rows(rows, cardinality, seed), 'loaded': False}
+
+			for name in names:
+				if name in skipped:
+					continue
+				factory, needs_table, _ = BENCHMARKS[name]
+				if needs_table and not dataset['loaded']:
+					datasets.load_table(frappe.db, dataset['data'])
+					dataset['loaded'] = True
+
+				timings = time_function(factory(dataset), repeat)
+				key = get_result_key(name, rows, cardinality)
+				results[key] = {
+					'benchmark': name,
+					'rows': rows,
+					'cardinality': cardinality,
+					'repeat': repeat,
+					'min': round(min(timings), 6),
+					'median': round(statistics.median(timings), 6),
+					'mean': round(statistics.mean(timings), 6),
+					'rows_per_sec': round(rows / min(timings)) if min(timings) else None
+				}
+				log(f"  {key:<64} min {results[key]['min']:>10.4f}s  median {results[key]['median']:>10.4f}s")
+
+			del dataset
+			gc.collect()
+
+	return {
+		'format': RESULT_FORMAT,
+		'created': datetime.now().isoformat(timespec='seconds'),
+		'environment': get_environment(),
+		'settings': {'repeat': repeat, 'seed': seed},
+		'skipped': skipped,
+		'results': results
+	}
+
+def time_function(fn, repeat):
+	"""Return the wall time of repeat calls, collecting garbage before each one"""
+	timings = []
+	for _ in range(repeat):
+		gc.collect()
+		start = time.perf_counter()
+		fn()
+		timings.append(time.perf_counter() - start)
+	return timings
+
+def get_result_key(name, rows, cardinality):
+	return f"{name}[rows={rows},cardinality={cardinality}]"
+
+def get_environment():
+	return {
+		'app_version': jmit_report_builder.__version__,
+		'git_commit': get_git_commit(),
+		'python': platform.python_version(),
+		'implementation': platform.python_implementation(),
+		'platform': platform.platform(),
+		'machine': platform.machine(),
+		'numpy': columnar_available()
+	}
+
+def get_git_commit():
+	try:
+		return subprocess.run(
+			['git', 'rev-parse', '--short', 'HEAD'],
+			cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True
+		).stdout.strip()
+	except Exception:
+		return None
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD, min_delta=DEFAULT_MIN_DELTA, stat='min'):
+	"""
+	Compare two results documents
+	Returns a list of rows with the baseline and current time, the ratio and a
+	status of 'regression', 'improvement', 'same', 'new' or 'missing'.
+	"""
+	comparison = []
+	baseline_results = baseline.get('results') or {}
+	current_results = current.get('results') or {}
+
+	for key in sorted(set(baseline_results) | set(current_results)):
+		before = baseline_results.get(key, {}).get(stat)
+		after = current_results.get(key, {}).get(stat)
+		row = {'key': key, 'baseline': before, 'current': after, 'ratio': None}
+		if before is None:
+			row['status'] = 'new'
+		elif after is None:
+			row['status'] = 'missing'
+		else:
+			row['ratio'] = round(after / before, 3) if before else None
+			if abs(after - before) < min_delta:
+				row['status'] = 'same'
+			elif after > before * (1 + threshold):
+				row['status'] = 'regression'
+			elif after < before * (1 - threshold):
+				row['status'] = 'improvement'
+			else:
+				row['status'] = 'same'
+		comparison.append(row)
+	return comparison
+
+def print_comparison(comparison, stat):
+	print(f"{'benchmark':<64} {'baseline':>10} {'current':>10} {'ratio':>7}  status  ({stat})")
+	for row in comparison:
+		before = f"{row['baseline']:.4f}" if row['baseline'] is not None else '-'
+		after = f"{row['current']:.4f}" if row['current'] is not None else '-'
+		ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else '-'
+		print(f"{row['key']:<64} {before:>10} {after:>10} {ratio:>7}  {row['status']}")
+
+def report_comparison(baseline, current, args):
+	comparison = compare_results(baseline, current, args.threshold, args.min_delta, args.stat)
+	print_comparison(comparison, args.stat)
+	regressions = [row for row in comparison if row['status'] == 'regression']
+	if regressions:
+		print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+		return 1
+	return 0
+
+def load_results(path):
+	with open(path) as f:
+		results = json.load(f)
+	if results.get('format') != RESULT_FORMAT:
+		raise SystemExit(f"{path}: unsupported results format {results.get('format')}")
+	return results
+
+def parse_int_list(value):
+	return [int(float(item)) for item in value.split(',') if item.strip()]
+
+def add_compare_arguments(parser):
+	parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+		help='relative slowdown that counts as a regression (default 0.15)')
+	parser.add_argument('--min-delta', type=float, default=DEFAULT_MIN_DELTA,
+		help='ignore differences smaller than this many seconds')
+	parser.add_argument('--stat', choices=('min', 'median', 'mean'), default='min',
+		help='timing statistic to compare')
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmark the JMIT Report Builder query engine and exporters')
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	run = commands.add_parser('run', help='run the benchmarks')
+	run.add_argument('--rows', default=DEFAULT_ROWS, help='comma-separated dataset sizes, e.g. 10000,1000000,5000000')
+	run.add_argument('--cardinality', default=DEFAULT_CARDINALITY, help='comma-separated distinct group counts')
+	run.add_argument('--benchmarks', default=','.join(BENCHMARKS), help='comma-separated benchmark names')
+	run.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+	run.add_argument('--seed', type=int, default=42)
+	run.add_argument('--output', help='write the results JSON to this file')
+	run.add_argument('--compare', metavar='BASELINE', help='compare against a baseline results file')
+	add_compare_arguments(run)
+
+	compare = commands.add_parser('compare', help='compare two results files')
+	compare.add_argument('baseline')
+	compare.add_argument('current')
+	add_compare_arguments(compare)
+
+	args = parser.parse_args(argv)
+
+	if args.command == 'compare':
+		return report_comparison(load_results(args.baseline), load_results(args.current), args)
+
+	names = [name.strip() for name in args.benchmarks.split(',') if name.strip()]
+	unknown = [name for name in names if name not in BENCHMARKS]
+	if unknown:
+		parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+	results = run_benchmarks(parse_int_list(args.rows), parse_int_list(args.cardinality), names, args.repeat, args.seed)
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent=1)
+		print(f"results written to {args.output}")
+
+	if args.compare:
+		return report_comparison(load_results(args.compare), results, args)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
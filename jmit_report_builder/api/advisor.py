@@ -0,0 +1,401 @@
+"""
+Query Advisor - Explains report queries and suggests indexes
+"""
+import frappe
+from frappe.decorators import whitelist
+import json
+from jmit_report_builder.api.filters import normalize_operator
+from jmit_report_builder.api.grouping import quote_identifier
+from jmit_report_builder.api.sql_parser import ParsedQuery, SIMPLE_REFERENCE, split_field, unquote
+
+# Full scans of tables estimated below this many rows are reported as minor
+SMALL_TABLE_ROWS = 1000
+
+# Estimated rows growth between two plans that counts as a regression
+ROWS_REGRESSION_FACTOR = 2
+
+EQUALITY_OPERATORS = ('=', 'IN')
+RANGE_OPERATORS = ('>', '<', '>=', '<=')
+
+# Words that end a table reference in FROM/JOIN instead of naming its alias
+TABLE_TERMINATORS = (
+	'ON', 'USING', 'WHERE', 'JOIN', 'LEFT', 'RIGHT', 'INNER', 'OUTER', 'CROSS',
+	'NATURAL', 'STRAIGHT_JOIN', 'GROUP', 'ORDER', 'HAVING', 'LIMIT', 'UNION', 'WINDOW',
+	'FORCE', 'USE', 'IGNORE', 'FOR', 'LOCK'
+)
+
+@whitelist()
+def explain_report(report_name, filters=None, analyze=0):
+	"""
+	Explain the filtered query of a saved report and store the advice
+	analyze=1 runs EXPLAIN ANALYZE (ANALYZE on MariaDB), which executes the query.
+	Flags full table scans, filesorts and temporary tables, suggests composite
+	indexes on the report's filter and grouping columns, and compares the plan
+	with the previous one stored for the report.
+	"""
+	try:
+		from jmit_report_builder.api.query_engine import apply_filters, get_report_config, get_select_query
+
+		report = frappe.get_doc('JMIT Report', report_name)
+		config = get_report_config(report_name, filters)
+		if config['query_type'] not in ('SQL', 'VIEW'):
+			return {
+				'success': False,
+				'message': 'Only SQL queries and views can be explained'
+			}
+
+		query, values = apply_filters(
+			get_select_query(config['query'], config['query_type']),
+			config['filters'],
+			config['report_name']
+		)
+		db_type = getattr(frappe.db, 'db_type', 'mariadb')
+		analyze = bool(int(analyze or 0))
+		plan = get_query_plan(query, values, db_type, analyze)
+
+		parsed = ParsedQuery(query)
+		aliases = get_table_aliases(parsed)
+		columns = get_report_columns(report, config, parsed, aliases)
+		findings = get_plan_findings(plan) + get_filter_findings(columns)
+		suggestions = suggest_indexes(plan, findings, columns, aliases, db_type)
+		previous = get_previous_plan(report.name)
+		regressions = compare_plans(previous, plan) if previous else []
+
+		plan_doc = frappe.get_doc({
+			'doctype': 'JMIT Report Query Plan',
+			'report_name': report.name,
+			'db_type': db_type,
+			'analyzed': int(analyze),
+			'estimated_rows': sum(step['rows'] or 0 for step in plan),
+			'full_scans': sum(1 for f in findings if f['issue'] == 'full_scan'),
+			'filesorts': sum(1 for f in findings if f['issue'] == 'filesort'),
+			'temporary_tables': sum(1 for f in findings if f['issue'] == 'temporary'),
+			'regression': int(bool(regressions)),
+			'query': query,
+			'plan': json.dumps(plan, default=str, indent=1),
+			'findings': json.dumps(findings + regressions, default=str, indent=1),
+			'suggested_indexes': '\n'.join(s['sql'] for s in suggestions)
+		})
+		plan_doc.insert(ignore_permissions=True)
+
+		return {
+			'success': True,
+			'plan_id': plan_doc.name,
+			'plan': plan,
+			'findings': findings,
+			'suggested_indexes': suggestions,
+			'regressions': regressions
+		}
+	except Exception as e:
+		frappe.logger().error(f"Explain error: {str(e)}")
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+def get_query_plan(query, values, db_type='mariadb', analyze=False):
+	"""
+	Run EXPLAIN and return one normalized step per table access or sort
+	Each step has table, alias, access, rows, actual_rows, filesort, temporary.
+	"""
+	if db_type == 'postgres':
+		options = 'FORMAT JSON, ANALYZE' if analyze else 'FORMAT JSON'
+		result = frappe.db.sql(f"EXPLAIN ({options}) {query}", values or None)
+		document = result[0][0]
+		document = json.loads(document) if isinstance(document, str) else document
+		steps = []
+		_walk_postgres_plan(document[0]['Plan'], steps)
+		return steps
+
+	rows = frappe.db.sql(f"{'ANALYZE' if analyze else 'EXPLAIN'} {query}", values or None, as_dict=True)
+	steps = []
+	for row in rows:
+		extra = row.get('Extra') or ''
+		steps.append({
+			'table': row.get('table'),
+			'alias': row.get('table'),
+			'access': row.get('type'),
+			'key': row.get('key'),
+			'rows': int(row.get('rows') or 0),
+			'actual_rows': row.get('r_rows'),
+			'full_scan': row.get('type') == 'ALL',
+			'filesort': 'Using filesort' in extra,
+			'temporary': 'Using temporary' in extra
+		})
+	return steps
+
+def _walk_postgres_plan(node, steps):
+	"""Flatten a Postgres JSON plan into steps"""
+	node_type = node.get('Node Type', '')
+	if node.get('Relation Name') or node_type in ('Sort', 'Incremental Sort', 'HashAggregate', 'Materialize'):
+		steps.append({
+			'table': node.get('Relation Name'),
+			'alias': node.get('Alias') or node.get('Relation Name'),
+			'access': node_type,
+			'key': node.get('Index Name'),
+			'rows': int(node.get('Plan Rows') or 0),
+			'actual_rows': node.get('Actual Rows'),
+			'full_scan': node_type == 'Seq Scan',
+			'filesort': node_type in ('Sort', 'Incremental Sort'),
+			'temporary': node_type in ('HashAggregate', 'Materialize') or node.get('Sort Space Type') == 'Disk'
+		})
+	for child in node.get('Plans', []):
+		_walk_postgres_plan(child, steps)
+
+def get_plan_findings(plan):
+	"""
+	Return the full scans, filesorts and temporary tables of a plan
+	"""
+	findings = []
+	for step in plan:
+		name = step['alias'] or step['table'] or 'query'
+		rows = step['rows']
+		if step['full_scan']:
+			findings.append({
+				'issue': 'full_scan',
+				'alias': step['alias'],
+				'severity': 'high' if rows >= SMALL_TABLE_ROWS else 'low',
+				'message': f"Full table scan on {name} (about {rows} rows)"
+			})
+		if step['filesort']:
+			findings.append({
+				'issue': 'filesort',
+				'alias': step['alias'],
+				'severity': 'medium',
+				'message': f"Rows from {name} are sorted without an index"
+			})
+		if step['temporary']:
+			findings.append({
+				'issue': 'temporary',
+				'alias': step['alias'],
+				'severity': 'medium',
+				'message': f"A temporary table is built while reading {name}"
+			})
+	return findings
+
+def get_filter_findings(columns):
+	"""
+	Flag LIKE filters, which are bound as %value% and cannot use an index
+	"""
+	return [
+		{
+			'issue': 'leading_wildcard',
+			'alias': alias,
+			'severity': 'low',
+			'message': f"LIKE filter on {alias}.{column} matches anywhere in the value and cannot use an index"
+		}
+		for alias, column, role in columns if role == 'like'
+	]
+
+def get_report_columns(report, config, parsed, aliases):
+	"""
+	Resolve the filter and grouping fields of a report to (alias, column, role)
+	role is 'equality', 'range', 'like' or 'grouping'. Fields computed from
+	expressions cannot use an index and are left out.
+	"""
+	operators = {f['field']: normalize_operator(f.get('operator')) for f in config['filters']}
+	for flt in report.filters:
+		operators.setdefault(flt.field_name, normalize_operator(flt.operator))
+
+	columns = []
+	for field, operator in operators.items():
+		if operator in EQUALITY_OPERATORS:
+			role = 'equality'
+		elif operator in RANGE_OPERATORS:
+			role = 'range'
+		elif operator == 'LIKE':
+			role = 'like'
+		else:
+			continue
+		resolved = resolve_column(field, parsed, aliases)
+		if resolved:
+			columns.append(resolved + (role,))
+
+	for grp in report.grouping_fields:
+		resolved = resolve_column(grp.field_name, parsed, aliases)
+		if resolved:
+			columns.append(resolved + ('grouping',))
+	return columns
+
+def get_table_aliases(parsed):
+	"""
+	Map each alias (or table name) in the outermost FROM clause to its table
+	"""
+	aliases = {}
+	if 'FROM' not in parsed.clauses:
+		return aliases
+
+	_, body_start, body_end = parsed.clauses['FROM']
+	tokens = [t for t in parsed.tokens if t.depth == 0 and body_start <= t.start < body_end]
+	expect_table = True
+	for index, token in enumerate(tokens):
+		if expect_table and token.kind in ('word', 'quoted'):
+			table = unquote(token.text)
+			alias = table
+			following = tokens[index + 1:index + 3]
+			if following and following[0].upper == 'AS' and len(following) > 1:
+				alias = unquote(following[1].text)
+			elif following and following[0].kind in ('word', 'quoted') and following[0].upper not in TABLE_TERMINATORS:
+				alias = unquote(following[0].text)
+			aliases[alias] = table
+			expect_table = False
+		elif token.upper == 'JOIN' or token.text == ',':
+			expect_table = True
+	return aliases
+
+def resolve_column(field, parsed, aliases):
+	"""
+	Return (alias, column) for a filter or grouping field, or None
+	Output aliases are followed to their expression when it is a plain column.
+	"""
+	qualifier, column = split_field(field)
+	if qualifier is None:
+		item = parsed.select_items.get(column.lower())
+		if item is not None:
+			if not SIMPLE_REFERENCE.match(item.expression.strip()):
+				return None
+			qualifier, column = split_field(item.expression.strip())
+
+	if qualifier is None:
+		if len(aliases) != 1:
+			return None
+		qualifier = next(iter(aliases))
+	if qualifier not in aliases:
+		return None
+	return qualifier, column
+
+def suggest_indexes(plan, findings, columns, aliases, db_type='mariadb'):
+	"""
+	Suggest composite indexes for tables with scans, sorts or temporary tables
+	Equality columns come first, then one range column, or the grouping
+	columns when the problem is a sort or temporary table.
+	"""
+	flagged = {}
+	for finding in findings:
+		flagged.setdefault(finding['alias'], set()).add(finding['issue'])
+	tables = dict(aliases)
+	if db_type == 'postgres':
+		tables.update({step['alias']: step['table'] for step in plan if step['alias'] and step['table']})
+
+	suggestions = []
+	for alias, issues in flagged.items():
+		table_columns = [(column, role) for column_alias, column, role in columns if column_alias == alias]
+		equality = _unique(column for column, role in table_columns if role == 'equality')
+		ranges = _unique(column for column, role in table_columns if role == 'range')
+		grouping = _unique(column for column, role in table_columns if role == 'grouping')
+		table = tables.get(alias)
+		if not table:
+			continue
+
+		candidates = []
+		if equality or ranges:
+			candidates.append(equality + ranges[:1])
+		if grouping and issues & {'filesort', 'temporary'}:
+			candidates.append(equality + [c for c in grouping if c not in equality])
+
+		existing = get_existing_indexes(table, db_type)
+		for index_columns in candidates:
+			if not index_columns or _is_covered(index_columns, existing):
+				continue
+			suggestions.append(build_index_suggestion(table, index_columns, db_type))
+	return suggestions
+
+def build_index_suggestion(table, columns, db_type='mariadb'):
+	"""Return the CREATE INDEX statement for a suggested index"""
+	index_name = f"jmit_{'_'.join(columns)}"[:60]
+	column_list = ', '.join(quote_identifier(column, db_type) for column in columns)
+	return {
+		'table': table,
+		'columns': columns,
+		'sql': (
+			f"CREATE INDEX {quote_identifier(index_name, db_type)} "
+			f"ON {quote_identifier(table, db_type)} ({column_list})"
+		)
+	}
+
+def get_existing_indexes(table, db_type='mariadb'):
+	"""
+	Return the column lists of the indexes on a table
+	"""
+	try:
+		if db_type == 'postgres':
+			rows = frappe.db.sql("""
+				SELECT i.relname, a.attname
+				FROM pg_index x
+				JOIN pg_class t ON t.oid = x.indrelid
+				JOIN pg_class i ON i.oid = x.indexrelid
+				JOIN LATERAL unnest(x.indkey) WITH ORDINALITY AS k(attnum, position) ON true
+				JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+				WHERE t.relname = %s
+				ORDER BY i.relname, k.position
+			""", (table,))
+		else:
+			rows = [
+				(row['Key_name'], row['Column_name'])
+				for row in frappe.db.sql(f"SHOW INDEX FROM {quote_identifier(table, db_type)}", as_dict=True)
+			]
+	except Exception:
+		return []
+
+	indexes = {}
+	for index_name, column in rows:
+		indexes.setdefault(index_name, []).append(column)
+	return list(indexes.values())
+
+def _is_covered(columns, existing):
+	"""Check whether an existing index starts with the given columns"""
+	return any(index[:len(columns)] == columns for index in existing)
+
+def _unique(values):
+	result = []
+	for value in values:
+		if value not in result:
+			result.append(value)
+	return result
+
+def get_previous_plan(report_name):
+	"""Return the steps of the last plan stored for a report"""
+	previous = frappe.get_all(
+		'JMIT Report Query Plan',
+		filters={'report_name': report_name},
+		fields=['plan'],
+		order_by='creation desc',
+		limit=1
+	)
+	if not previous or not previous[0].plan:
+		return None
+	return json.loads(previous[0].plan)
+
+def compare_plans(previous, current):
+	"""
+	Return regressions of a plan against the previous plan of the same report
+	"""
+	regressions = []
+	before = {step['alias']: step for step in previous if step.get('alias')}
+	for step in current:
+		old = before.get(step['alias'])
+		if not old:
+			continue
+		name = step['alias']
+		if step['full_scan'] and not old.get('full_scan'):
+			regressions.append({
+				'issue': 'regression',
+				'alias': name,
+				'severity': 'high',
+				'message': f"{name} was read with {old.get('access')} and is now fully scanned"
+			})
+		elif old.get('key') and step['key'] != old.get('key'):
+			regressions.append({
+				'issue': 'regression',
+				'alias': name,
+				'severity': 'medium',
+				'message': f"{name} now uses index {step['key'] or 'none'} instead of {old.get('key')}"
+			})
+		if old.get('rows') and step['rows'] > old['rows'] * ROWS_REGRESSION_FACTOR:
+			regressions.append({
+				'issue': 'regression',
+				'alias': name,
+				'severity': 'medium',
+				'message': f"Estimated rows read from {name} grew from {old['rows']} to {step['rows']}"
+			})
+	return regressions
@@ -0,0 +1,272 @@
+"""
+Batch Runner - Runs many saved reports concurrently
+"""
+import frappe
+from frappe.decorators import whitelist
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from multiprocessing import get_context
+from jmit_report_builder.api.rows import as_dicts
+
+DEFAULT_BATCH_CONNECTIONS = 4
+
+# Worker processes shared by all batches of this process, created on first use
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+# Export formats a batch can write; PDF rendering needs a site context
+BATCH_EXPORT_TYPES = ('Excel', 'CSV')
+
+@whitelist()
+def run_report_batch(reports, export=None, max_connections=None, processes=None):
+	"""
+	Run a list of saved reports concurrently
+	reports: [{'report_name': 'Sales Summary', 'filters': {...}}, 'Stock Ledger', ...]
+	export: None to return the data, or 'Excel' / 'CSV' to write one private
+	file per report and return its file_url.
+	A 'jmit_report_batch' realtime event is published as each report finishes.
+	max_connections and processes can only lower the site settings.
+	site_config.json:
+		"jmit_report_batch_connections": 4
+		"jmit_report_batch_processes": 4
+	"""
+	try:
+		reports = json.loads(reports) if isinstance(reports, str) else reports
+		batch_id = frappe.generate_hash(length=10)
+		results = []
+		for result in iter_report_batch(reports, export, max_connections, processes):
+			results.append(result)
+			frappe.publish_realtime('jmit_report_batch', {
+				'batch_id': batch_id,
+				'report_name': result['report_name'],
+				'success': result['success'],
+				'count': result.get('count'),
+				'file_url': result.get('file_url'),
+				'done': len(results),
+				'total': len(reports)
+			}, user=frappe.session.user)
+
+		return {
+			'success': True,
+			'batch_id': batch_id,
+			'results': results
+		}
+	except Exception as e:
+		frappe.logger().error(f"Report batch error: {str(e)}")
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+def iter_report_batch(reports, export=None, max_connections=None, processes=None):
+	"""
+	Run reports concurrently and yield each result as soon as it is ready
+	Queries run on a bounded set of threads, each holding one database
+	connection for all the reports it picks up. Grouping, subtotals and export
+	writing run on a process pool so they are not serialized by the GIL; the
+	pool is shared by all batches and processes caps the reports of this batch
+	on it at a time.
+	"""
+	if export and export not in BATCH_EXPORT_TYPES:
+		frappe.throw(f"Unsupported batch export: {export}")
+
+	specs = [normalize_report_spec(spec) for spec in reports or []]
+	if not specs:
+		return
+
+	site_connections, site_processes = get_batch_settings()
+	max_connections = clamp_setting(max_connections, site_connections)
+	processes = clamp_setting(processes, site_processes)
+
+	tasks = queue.Queue()
+	for index, spec in enumerate(specs):
+		tasks.put((index, spec))
+	results = queue.Queue()
+	context = {
+		'site': frappe.local.site,
+		'sites_path': getattr(frappe.local, 'sites_path', '.'),
+		'user': frappe.session.user
+	}
+
+	pool = BoundedPool(get_process_pool(site_processes), processes)
+	threads = [
+		threading.Thread(target=connection_worker, args=(context, tasks, results, pool, export), daemon=True)
+		for _ in range(min(max_connections, len(specs)))
+	]
+	for thread in threads:
+		thread.start()
+
+	for _ in specs:
+		yield results.get()
+
+	for thread in threads:
+		thread.join()
+
+def get_batch_settings():
+	"""Return the site's (connections, processes) for batches"""
+	conf = frappe.conf or {}
+	return (
+		int(conf.get('jmit_report_batch_connections') or DEFAULT_BATCH_CONNECTIONS),
+		int(conf.get('jmit_report_batch_processes') or os.cpu_count() or 1)
+	)
+
+def clamp_setting(requested, limit):
+	"""Apply a requested value that can only lower the site's setting"""
+	if not requested or int(requested) <= 0:
+		return limit
+	return min(int(requested), limit)
+
+def get_process_pool(processes):
+	"""
+	Return the worker process pool, created once per process
+	spawn keeps worker processes free of the parent's threads and connections.
+	The pool keeps the size it was created with and is only replaced when a
+	worker died and broke it.
+	"""
+	global _process_pool
+	with _process_pool_lock:
+		if _process_pool is None or _process_pool._broken:
+			_process_pool = ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'))
+		return _process_pool
+
+class BoundedPool:
+	"""
+	Runs the tasks of one batch on the shared pool, at most `limit` at a time
+	"""
+	def __init__(self, pool, limit):
+		self.pool = pool
+		self.slots = threading.BoundedSemaphore(limit)
+
+	def run(self, fn, *args):
+		with self.slots:
+			return self.pool.submit(fn, *args).result()
+
+def normalize_report_spec(spec):
+	"""Accept a report name or a {'report_name', 'filters'} dict"""
+	if isinstance(spec, str):
+		return {'report_name': spec, 'filters': None}
+	return {'report_name': spec.get('report_name'), 'filters': spec.get('filters')}
+
+def connection_worker(context, tasks, results, pool, export):
+	"""
+	Thread body: open one site connection and run reports until the queue is empty
+	"""
+	try:
+		frappe.init(site=context['site'], sites_path=context['sites_path'])
+		frappe.connect()
+		frappe.set_user(context['user'])
+		while True:
+			try:
+				index, spec = tasks.get_nowait()
+			except queue.Empty:
+				break
+			results.put(run_batch_report(index, spec, pool, export))
+	except Exception as e:
+		# Without a connection this thread cannot run anything; fail what is left
+		while True:
+			try:
+				index, spec = tasks.get_nowait()
+			except queue.Empty:
+				break
+			results.put(batch_error(index, spec, e))
+	finally:
+		frappe.destroy()
+
+def run_batch_report(index, spec, pool, export=None):
+	"""
+	Fetch the rows of one report on this thread's connection, then group and
+	export them on the process pool
+	The query runs under the report's limits, on a read replica unless the
+	result is exported.
+	"""
+	from jmit_report_builder.api.export import get_private_file_path, attach_private_file
+	from jmit_report_builder.api.jobs import JOB_EXTENSIONS
+	from jmit_report_builder.api.query_engine import get_report_config, run_governed
+	from jmit_report_builder.api.routing import read_replica
+
+	started = time.monotonic()
+	try:
+		config = get_report_config(spec['report_name'], spec['filters'])
+		grouping_fields = config.get('grouping_fields') or []
+
+		if config.get('summary_only'):
+			# The database already aggregates, there is nothing left to offload
+			grouping_fields = []
+		else:
+			config = dict(config, grouping_fields=[])
+		with nullcontext() if export else read_replica(config.get('max_replica_lag')):
+			fetched = run_governed(config)
+		rows = fetched['data']
+
+		path = file_name = None
+		if export:
+			filename = f"{spec['report_name']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{JOB_EXTENSIONS[export]}"
+			file_name, path = get_private_file_path(filename)
+
+		data, count = pool.run(
+			process_report_rows,
+			rows,
+			grouping_fields,
+			config.get('subtotal_fields') or [],
+			bool(config.get('presorted')),
+			config.get('aggregation_backend'),
+			export,
+			spec['report_name'],
+			path,
+			config.get('columns')
+		)
+
+		result = {
+			'index': index,
+			'report_name': spec['report_name'],
+			'success': True,
+			'count': count,
+			'elapsed': round(time.monotonic() - started, 3)
+		}
+		if fetched.get('partial'):
+			result.update(partial=True, limit=fetched['limit'])
+		if export:
+			result['file_url'] = attach_private_file(file_name, path).file_url
+			frappe.db.commit()
+		else:
+			result['data'] = as_dicts(data)
+		return result
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.logger().error(f"Batch report {spec['report_name']} failed: {str(e)}")
+		return batch_error(index, spec, e)
+
+def process_report_rows(rows, grouping_fields, subtotal_fields, presorted=False,
+		backend=None, export=None, title=None, path=None, columns=None):
+	"""
+	Process pool body: group the rows of a report and optionally write its export
+	Runs without a site connection, so it only uses the pure grouping and
+	writer functions. Returns (data or None when exported, row count).
+	"""
+	from jmit_report_builder.api.query_engine import group_records
+
+	if grouping_fields:
+		rows = group_records(rows, grouping_fields, subtotal_fields, presorted, backend)
+
+	if not export:
+		return rows, len(rows)
+
+	from jmit_report_builder.api.jobs import write_job_artifact
+	with open(path, 'wb') as f:
+		write_job_artifact(export, title, [rows] if rows else [], f, columns)
+	return None, len(rows)
+
+def batch_error(index, spec, error):
+	"""Result entry of a report that failed"""
+	return {
+		'index': index,
+		'report_name': spec['report_name'],
+		'success': False,
+		'message': str(error)
+	}
@@ -0,0 +1,272 @@
+"""
+Result Cache - Caches report execution results keyed by query and filters
+"""
+import frappe
+from frappe.decorators import whitelist
+import hashlib
+import json
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+KEY_PREFIX = "jmit_report_cache"
+
+_backends = {}
+_backend_lock = threading.Lock()
+
+class LocalCacheBackend:
+	"""
+	In-process LRU cache with per-entry expiry
+	"""
+	def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+		self.max_entries = max_entries
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None:
+				return None
+			expires_at, value = entry
+			if expires_at < time.time():
+				del self.entries[key]
+				return None
+			self.entries.move_to_end(key)
+			return value
+
+	def set(self, key, value, ttl):
+		with self.lock:
+			self.entries[key] = (time.time() + ttl, value)
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
+
+	def delete_prefix(self, prefix):
+		with self.lock:
+			for key in [k for k in self.entries if k.startswith(prefix)]:
+				del self.entries[key]
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+class RedisCacheBackend:
+	"""
+	Cache stored in a Redis-compatible server
+	Entries expire through Redis TTLs. A sorted set of last-access times bounds
+	the number of entries, evicting the least recently used ones. The server may
+	be shared by every site of a bench, so each site keeps its own sorted set.
+	"""
+	def __init__(self, client, max_entries=DEFAULT_MAX_ENTRIES, prefix=KEY_PREFIX):
+		self.client = client
+		self.max_entries = max_entries
+		self.lru_key = f"{prefix}:lru"
+
+	def get(self, key):
+		value = self.client.get(key)
+		if value is None:
+			self.client.zrem(self.lru_key, key)
+			return None
+		self.client.zadd(self.lru_key, {key: time.time()})
+		return pickle.loads(value)
+
+	def set(self, key, value, ttl):
+		self.client.set(key, pickle.dumps(value), ex=int(ttl))
+		self.client.zadd(self.lru_key, {key: time.time()})
+		excess = self.client.zcard(self.lru_key) - self.max_entries
+		if excess > 0:
+			evicted = [k for k, _ in self.client.zpopmin(self.lru_key, excess)]
+			if evicted:
+				self.client.delete(*evicted)
+
+	def delete_prefix(self, prefix):
+		# Stale entries are unreachable after a generation bump and expire on their own
+		pass
+
+	def clear(self):
+		keys = [k for k, _ in self.client.zpopmin(self.lru_key, self.client.zcard(self.lru_key))]
+		if keys:
+			self.client.delete(*keys)
+
+class FakeRedis:
+	"""
+	Minimal in-memory stand-in for the Redis commands used by RedisCacheBackend
+	"""
+	def __init__(self):
+		self.values = {}
+		self.sorted_sets = {}
+
+	def get(self, name):
+		entry = self.values.get(name)
+		if entry is None:
+			return None
+		value, expires_at = entry
+		if expires_at is not None and expires_at < time.time():
+			del self.values[name]
+			return None
+		return value
+
+	def set(self, name, value, ex=None):
+		self.values[name] = (value, time.time() + ex if ex else None)
+		return True
+
+	def delete(self, *names):
+		return sum(1 for name in names if self.values.pop(name, None) is not None)
+
+	def zadd(self, name, mapping):
+		self.sorted_sets.setdefault(name, {}).update(mapping)
+
+	def zrem(self, name, *members):
+		members_map = self.sorted_sets.get(name, {})
+		return sum(1 for member in members if members_map.pop(member, None) is not None)
+
+	def zcard(self, name):
+		return len(self.sorted_sets.get(name, {}))
+
+	def zpopmin(self, name, count=1):
+		members_map = self.sorted_sets.get(name, {})
+		popped = sorted(members_map.items(), key=lambda item: item[1])[:count]
+		for member, _ in popped:
+			del members_map[member]
+		return popped
+
+def get_backend():
+	"""
+	Return the cache backend of the current site
+	Workers serve several sites, so each site gets a backend built from its own
+	site config.
+	site_config.json:
+		"jmit_report_cache_backend": "local" | "redis"
+		"jmit_report_cache_redis_url": "redis://localhost:13000"
+		"jmit_report_cache_max_entries": 256
+	"""
+	site = frappe.local.site
+	backend = _backends.get(site)
+	if backend is None:
+		with _backend_lock:
+			backend = _backends.get(site)
+			if backend is None:
+				backend = _backends[site] = _create_backend()
+	return backend
+
+def set_backend(backend):
+	"""
+	Replace the cache backend of the current site, e.g. with
+	RedisCacheBackend(FakeRedis()) in tests; None rebuilds it from the site config
+	"""
+	with _backend_lock:
+		if backend is None:
+			_backends.pop(frappe.local.site, None)
+		else:
+			_backends[frappe.local.site] = backend
+
+def _create_backend():
+	conf = frappe.conf or {}
+	max_entries = int(conf.get('jmit_report_cache_max_entries') or DEFAULT_MAX_ENTRIES)
+
+	if conf.get('jmit_report_cache_backend') == 'redis':
+		from redis import Redis
+		url = conf.get('jmit_report_cache_redis_url') or conf.get('redis_cache')
+		return RedisCacheBackend(Redis.from_url(url), max_entries, get_key_prefix())
+
+	return LocalCacheBackend(max_entries)
+
+def get_key_prefix():
+	"""
+	Return the prefix of the current site's cache keys
+	"""
+	return f"{KEY_PREFIX}:{frappe.local.site}"
+
+def make_cache_key(config):
+	"""
+	Build a cache key from everything that determines a report's result
+	The query is normalized so whitespace-only edits share the same entry.
+	"""
+	report_name = config.get('report_name') or ''
+	payload = {
+		'query': normalize_query(config.get('query', '')),
+		'query_type': config.get('query_type', 'SQL'),
+		'filters': config.get('filters', []),
+		'grouping_fields': config.get('grouping_fields', []),
+		'subtotal_fields': config.get('subtotal_fields', []),
+		'summary_only': bool(config.get('summary_only')),
+		'presorted': bool(config.get('presorted')),
+		'aggregation_backend': config.get('aggregation_backend') or 'python'
+	}
+	digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+	return f"{get_key_prefix()}:{report_name}:{get_generation(report_name)}:{digest}"
+
+def normalize_query(query):
+	"""
+	Collapse whitespace and trailing semicolons in a query
+	"""
+	return re.sub(r'\s+', ' ', str(query or '')).strip().rstrip(';').strip()
+
+def get_generation(report_name):
+	"""
+	Return the invalidation counter of a report, shared by all workers
+	"""
+	if not report_name:
+		return 0
+	return frappe.cache().get_value(get_generation_key(report_name)) or 0
+
+def get_generation_key(report_name):
+	return f"{KEY_PREFIX}_generation:{frappe.local.site}:{report_name}"
+
+def get_cached_result(cache_key):
+	"""
+	Return the cached result for a cache key, or None
+	"""
+	return get_backend().get(cache_key)
+
+def set_cached_result(cache_key, result, ttl):
+	"""
+	Store a successful result for ttl seconds
+	"""
+	if ttl and result.get('success'):
+		get_backend().set(cache_key, result, ttl)
+
+def get_report_cache_ttl(report_name):
+	"""
+	Return the cache TTL in seconds configured on a JMIT Report
+	"""
+	if not report_name:
+		return 0
+	return int(frappe.db.get_value('JMIT Report', report_name, 'cache_ttl') or 0)
+
+def invalidate_report(report_name):
+	"""
+	Drop all cached results of a report
+	Bumping the shared generation makes entries unreachable in every worker.
+	"""
+	generation_key = get_generation_key(report_name)
+	frappe.cache().set_value(generation_key, (frappe.cache().get_value(generation_key) or 0) + 1)
+	get_backend().delete_prefix(f"{get_key_prefix()}:{report_name}:")
+
+@whitelist()
+def clear_report_cache(report_name=None):
+	"""
+	Clear cached results of one report, or of all reports
+	Clearing a report needs write permission on it, clearing every report the
+	System Manager role.
+	"""
+	try:
+		if report_name:
+			frappe.has_permission('JMIT Report', 'write', report_name, throw=True)
+			invalidate_report(report_name)
+		else:
+			frappe.only_for('System Manager')
+			get_backend().clear()
+		return {
+			'success': True,
+			'message': 'Report cache cleared'
+		}
+	except Exception as e:
+		return {
+			'success': False,
+			'message': str(e)
+		}
@@ -4,19 +4,76 @@ Export API - Export reports to various formats
 import frappe
 from frappe.decorators import whitelist
 import json
+import os
 from datetime import datetime
+import html
+from itertools import chain
+from jmit_report_builder.api.profiler import profiled, profile_stage
+from jmit_report_builder.api.rows import is_record
+
+# Rows sampled to estimate column widths when no width is configured
+WIDTH_SAMPLE_ROWS = 500
+
+# Characters across a landscape page, used to turn Width (%) into Excel widths
+PAGE_WIDTH_CHARS = 150
+MAX_COLUMN_WIDTH = 50
+
+# Table rows per HTML document handed to the PDF renderer
+HTML_ROWS_PER_CHUNK = 1000
+
+# Key suffix of the subtotal values in SUBTOTAL rows
+SUBTOTAL_SUFFIX = '_subtotal'
+
+# Excel fills of the group rows, matching the .group-header and .subtotal HTML styles
+MARKER_FILLS = {'GROUP_HEADER': 'D9E1F2', 'SUBTOTAL': 'E8E8E8'}
+
+HTML_HEAD = """
+	<html>
+	<head>
+		<style>
+			body {{ font-family: Arial, sans-serif; margin: 20px; }}
+			h1 {{ color: #333; border-bottom: 2px solid #333; padding-bottom: 10px; }}
+			table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
+			th {{ background-color: #4472C4; color: white; padding: 10px; text-align: left; border: 1px solid #999; }}
+			td {{ padding: 8px; border: 1px solid #ddd; }}
+			tr:nth-child(even) {{ background-color: #f2f2f2; }}
+			.subtotal {{ background-color: #e8e8e8; font-weight: bold; }}
+			.group-header {{ background-color: #d9e1f2; font-weight: bold; }}
+		</style>
+	</head>
+	<body>
+		<h1>{title}</h1>
+		<table>
+	"""
+
+HTML_FOOT = """
+		</table>
+	</body>
+	</html>
+	"""
 
 @whitelist()
-def export_to_pdf(report_name, data):
+def export_to_pdf(report_name, data, columns=None):
 	"""
 	Export report to PDF format
+	Large reports are rendered in page-sized HTML chunks that are converted and
+	appended to the PDF one at a time.
 	"""
 	try:
 		data = json.loads(data) if isinstance(data, str) else data
+		columns = json.loads(columns) if isinstance(columns, str) else columns
+		
+		from pypdf import PdfWriter
+		from frappe.utils.pdf import get_pdf, get_file_data_from_writer
 		
 		# Generate PDF using frappe's PDF generation
-		html = generate_html_from_data(report_name, data)
-		pdf_data = frappe.utils.pdf_lib.get_pdf(html)
+		batches = [data] if isinstance(data, list) else []
+		with profiled(report_name, 'export_pdf'), profile_stage('render', rows_in=len(data or [])) as stage:
+			writer = PdfWriter()
+			for chunk in iter_html_chunks(report_name, batches, columns):
+				get_pdf(chunk, output=writer)
+			pdf_data = get_file_data_from_writer(writer)
+			stage['bytes'] = len(pdf_data)
 		
 		return {
 			'success': True,
@@ -30,95 +87,82 @@ def export_to_pdf(report_name, data):
 		}
 
 @whitelist()
-def export_to_excel(report_name, data):
+def export_to_excel(report_name, data, columns=None):
 	"""
 	Export report to Excel format
 	"""
 	try:
 		data = json.loads(data) if isinstance(data, str) else data
+		columns = json.loads(columns) if isinstance(columns, str) else columns
 		
-		from openpyxl import Workbook
-		from openpyxl.styles import Font, PatternFill, Alignment
-		
-		wb = Workbook()
-		ws = wb.active
-		ws.title = "Report"
+		filename = f"{report_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+		batches = [data] if isinstance(data, list) and len(data) > 0 else []
+		with profiled(report_name, 'export_excel'), profile_stage('render') as stage:
+			file_doc, stage['rows_out'] = create_private_file(filename, lambda f: write_xlsx(report_name, batches, f, columns))
+			stage['bytes'] = file_doc.file_size
 		
-		# Add report title
-		ws['A1'] = report_name
-		ws['A1'].font = Font(bold=True, size=14)
-		ws['A1'].fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-		ws['A1'].font = Font(bold=True, size=14, color="FFFFFF")
+		return {
+			'success': True,
+			'file_type': 'xlsx',
+			'filename': filename,
+			'file_url': file_doc.file_url
+		}
+	except Exception as e:
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+@whitelist()
+def export_report_to_excel(report_name, filters=None):
+	"""
+	Run a saved JMIT Report and stream its rows into an Excel file
+	Rows go from the query cursor to a write-only workbook in batches, so
+	memory stays bounded by the batch size rather than the report size.
+	"""
+	try:
+		from jmit_report_builder.api.query_engine import get_report_config, iter_config_batches
 		
-		# Write data
-		row = 3
-		if isinstance(data, list) and len(data) > 0:
-			# Write headers
-			if isinstance(data[0], dict):
-				headers = list(data[0].keys())
-				for col, header in enumerate(headers, 1):
-					cell = ws.cell(row=row, column=col, value=header)
-					cell.font = Font(bold=True)
-					cell.fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-				
-				row += 1
-				
-				# Write data rows
-				for record in data:
-					for col, header in enumerate(headers, 1):
-						ws.cell(row=row, column=col, value=record.get(header, ''))
-					row += 1
-		
-		# Auto-adjust column widths
-		for column in ws.columns:
-			max_length = 0
-			column_letter = column[0].column_letter
-			for cell in column:
-				try:
-					if len(str(cell.value)) > max_length:
-						max_length = len(str(cell.value))
-				except:
-					pass
-			adjusted_width = min(max_length + 2, 50)
-			ws.column_dimensions[column_letter].width = adjusted_width
-		
-		# Save to bytes
-		from io import BytesIO
-		output = BytesIO()
-		wb.save(output)
-		output.seek(0)
+		with profiled(report_name, 'export_excel'):
+			config = get_report_config(report_name, filters)
+			filename = f"{report_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+			# Fetching and rendering interleave, so they are timed as one stage
+			with profile_stage('export') as stage:
+				file_doc, count = create_private_file(
+					filename,
+					lambda f: write_xlsx(report_name, iter_config_batches(config), f, config.get('columns'))
+				)
+				stage.update(rows_out=count, bytes=file_doc.file_size)
 		
 		return {
 			'success': True,
 			'file_type': 'xlsx',
-			'filename': f"{report_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+			'filename': filename,
+			'file_url': file_doc.file_url,
+			'count': count
 		}
 	except Exception as e:
+		frappe.logger().error(f"Excel export error: {str(e)}")
 		return {
 			'success': False,
 			'message': str(e)
 		}
 
 @whitelist()
-def export_to_csv(report_name, data):
+def export_to_csv(report_name, data, columns=None):
 	"""
 	Export report to CSV format
 	"""
 	try:
 		data = json.loads(data) if isinstance(data, str) else data
+		columns = json.loads(columns) if isinstance(columns, str) else columns
 		
-		import csv
 		from io import StringIO
 		
 		output = StringIO()
 		
 		if isinstance(data, list) and len(data) > 0:
-			if isinstance(data[0], dict):
-				fieldnames = list(data[0].keys())
-				writer = csv.DictWriter(output, fieldnames=fieldnames)
-				
-				writer.writeheader()
-				writer.writerows(data)
+			write_csv([data], output, columns)
 		
 		csv_content = output.getvalue()
 		
@@ -134,55 +178,432 @@ def export_to_csv(report_name, data):
 			'message': str(e)
 		}
 
-def generate_html_from_data(report_name, data):
+@whitelist()
+def export_report_to_csv(report_name, filters=None, compress=1):
+	"""
+	Run a saved JMIT Report and stream its rows into a CSV file
+	Rows are written batch by batch from the query cursor into a gzip-compressed
+	private File, so the data never travels to the client and back as JSON and
+	is never held as one CSV string.
+	"""
+	try:
+		from jmit_report_builder.api.query_engine import get_report_config, iter_config_batches
+		
+		with profiled(report_name, 'export_csv'):
+			config = get_report_config(report_name, filters)
+			compress = int(compress or 0)
+			filename = f"{report_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+			if compress:
+				filename += '.gz'
+			
+			with profile_stage('export') as stage:
+				file_doc, count = create_private_file(
+					filename,
+					lambda f: write_csv_file(iter_config_batches(config), f, compress, config.get('columns'))
+				)
+				stage.update(rows_out=count, bytes=file_doc.file_size)
+		
+		return {
+			'success': True,
+			'file_type': 'csv',
+			'filename': filename,
+			'file_url': file_doc.file_url,
+			'count': count
+		}
+	except Exception as e:
+		frappe.logger().error(f"CSV export error: {str(e)}")
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+def write_csv_file(batches, fileobj, compress=True, columns=None):
+	"""
+	Write batches of records as UTF-8 CSV to a binary file, optionally gzipped
+	"""
+	import gzip
+	from io import TextIOWrapper
+	
+	target = gzip.GzipFile(fileobj=fileobj, mode='wb') if compress else fileobj
+	text = TextIOWrapper(target, encoding='utf-8', newline='')
+	try:
+		return write_csv(batches, text, columns)
+	finally:
+		text.flush()
+		text.detach()
+		if compress:
+			target.close()
+
+def write_csv(batches, output, columns=None):
+	"""
+	Write batches of records to a file-like object as CSV
+	The header comes from the visible report columns or the first detail
+	record, so batches can come straight from query_engine.iter_query_batches
+	without materializing the result. GROUP_HEADER and SUBTOTAL rows are
+	written as rows holding their group values and subtotals. When the detail
+	records of a batch have other fields than the previous ones, as in the
+	next result set of a stored procedure, a blank line and a new header start
+	a new section.
+	Returns the number of records written.
+	"""
+	import csv
+	
+	sample, batches = sample_batches(batches)
+	headers, labels = get_export_headers(sample, columns)
+	if not headers:
+		return 0
+	
+	writer = csv.writer(output)
+	writer.writerow(labels)
+	
+	count = 0
+	section_fields = get_detail_fields(sample)
+	for batch in batches:
+		fields = get_detail_fields(batch)
+		if fields and section_fields and fields != section_fields:
+			headers = fields
+			output.write('\r\n')
+			writer.writerow(headers)
+		section_fields = fields or section_fields
+		
+		writer.writerows(get_row_values(record, headers) for record in batch)
+		count += len(batch)
+	
+	return count
+
+def write_xlsx(report_name, batches, output, columns=None):
+	"""
+	Write batches of records to an .xlsx file using a write-only workbook
+	Styles are registered once as named styles. Column widths come from the
+	Width (%) of the report columns or are estimated from a sampled prefix,
+	since a write-only sheet cannot be resized after rows are written.
+	Returns the number of records written.
+	"""
+	from openpyxl import Workbook
+	from openpyxl.cell import WriteOnlyCell
+	from openpyxl.styles import Font, NamedStyle, PatternFill
+	from openpyxl.utils import get_column_letter
+	
+	wb = Workbook(write_only=True)
+	wb.add_named_style(NamedStyle(
+		name='jmit_title',
+		font=Font(bold=True, size=14, color="FFFFFF"),
+		fill=PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+	))
+	wb.add_named_style(NamedStyle(
+		name='jmit_header',
+		font=Font(bold=True),
+		fill=PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
+	))
+	for row_type, color in MARKER_FILLS.items():
+		wb.add_named_style(NamedStyle(
+			name=f'jmit_{row_type.lower()}',
+			font=Font(bold=True),
+			fill=PatternFill(start_color=color, end_color=color, fill_type="solid")
+		))
+	ws = wb.create_sheet("Report")
+	
+	sample, batches = sample_batches(batches)
+	headers, labels = get_export_headers(sample, columns)
+	widths = estimate_column_widths(headers, labels, sample[:WIDTH_SAMPLE_ROWS], columns)
+	for index, width in enumerate(widths, 1):
+		ws.column_dimensions[get_column_letter(index)].width = width
+	
+	title = WriteOnlyCell(ws, value=report_name)
+	title.style = 'jmit_title'
+	ws.append([title])
+	ws.append([])
+	
+	count = 0
+	if headers:
+		ws.append(make_header_cells(ws, labels))
+		
+		section_fields = get_detail_fields(sample)
+		for batch in batches:
+			# The next result set of a stored procedure starts a new section
+			fields = get_detail_fields(batch)
+			if fields and section_fields and fields != section_fields:
+				headers = fields
+				ws.append([])
+				ws.append(make_header_cells(ws, headers))
+			section_fields = fields or section_fields
+			
+			for record in batch:
+				row_type = record.get('_type')
+				if row_type:
+					ws.append(make_marker_cells(ws, row_type, get_row_values(record, headers)))
+				else:
+					ws.append([excel_value(record.get(header, '')) for header in headers])
+			count += len(batch)
+	
+	wb.save(output)
+	return count
+
+def make_marker_cells(ws, row_type, values):
+	"""Return the cells of a GROUP_HEADER or SUBTOTAL row, styled like the HTML export"""
+	from openpyxl.cell import WriteOnlyCell
+	
+	cells = []
+	for value in values:
+		cell = WriteOnlyCell(ws, value=excel_value(value))
+		cell.style = f'jmit_{row_type.lower()}'
+		cells.append(cell)
+	return cells
+
+def make_header_cells(ws, labels):
+	"""Return styled header cells of a write-only sheet"""
+	from openpyxl.cell import WriteOnlyCell
+	
+	cells = []
+	for label in labels:
+		cell = WriteOnlyCell(ws, value=label)
+		cell.style = 'jmit_header'
+		cells.append(cell)
+	return cells
+
+def get_detail_fields(batch):
+	"""Return the fields of the first detail record of a batch, skipping GROUP_HEADER and SUBTOTAL rows"""
+	for record in batch:
+		if is_record(record) and '_type' not in record:
+			return list(record.keys())
+	return None
+
+def sample_batches(batches, size=WIDTH_SAMPLE_ROWS):
+	"""
+	Read the first batches of a stream until they hold size records
+	Returns (sample, batches) where batches still yields every batch, the
+	sampled ones included.
+	"""
+	batches = iter(batches)
+	sample = []
+	sampled_batches = []
+	for batch in batches:
+		sampled_batches.append(batch)
+		sample.extend(batch)
+		if len(sample) >= size:
+			break
+	return sample, chain(sampled_batches, batches)
+
+def get_export_headers(sample, columns=None):
+	"""
+	Return (field names, labels) for an export
+	Visible report columns are used when configured, otherwise the keys of the
+	first detail record, skipping GROUP_HEADER and SUBTOTAL rows. A summary
+	without detail records exports its grouping and subtotalled fields.
+	"""
+	visible = [col for col in columns or [] if col.get('visible', 1) and col.get('field_name')]
+	if visible:
+		return (
+			[col['field_name'] for col in visible],
+			[col.get('display_label') or col['field_name'] for col in visible]
+		)
+	
+	for record in sample:
+		if is_record(record) and '_type' not in record:
+			headers = list(record.keys())
+			return headers, headers
+	
+	headers = []
+	for record in sample:
+		if not is_record(record):
+			break
+		fields = chain(record.get('_group_key') or {}, (
+			key[:-len(SUBTOTAL_SUFFIX)] for key in record if key.endswith(SUBTOTAL_SUFFIX)
+		))
+		headers.extend(field for field in fields if field not in headers)
+	return headers, headers
+
+def get_row_values(record, headers):
+	"""
+	Return the values of any result row in header order
+	GROUP_HEADER and SUBTOTAL rows put their group values in the grouping
+	columns and <field>_subtotal in the <field> column. A group header whose
+	grouping fields are not exported shows its group key in the first column.
+	"""
+	if not record.get('_type'):
+		return [record.get(header) for header in headers]
+	
+	group_key = record.get('_group_key') or {}
+	values = [record.get(f'{header}{SUBTOTAL_SUFFIX}', group_key.get(header)) for header in headers]
+	if record['_type'] == 'GROUP_HEADER' and headers and not any(header in group_key for header in headers):
+		values[0] = ", ".join(f"{field}: {value}" for field, value in group_key.items())
+	return values
+
+def estimate_column_widths(headers, labels, sample, columns=None):
+	"""
+	Return an Excel width per column from Width (%) or from sampled values
+	"""
+	configured = {col.get('field_name'): col.get('width') for col in columns or []}
+	widths = []
+	for header, label in zip(headers, labels):
+		if configured.get(header):
+			width = int(configured[header]) * PAGE_WIDTH_CHARS / 100
+		else:
+			width = max([len(str(label))] + [len(str(record.get(header, ''))) for record in sample]) + 2
+		widths.append(min(max(width, 8), MAX_COLUMN_WIDTH))
+	return widths
+
+def excel_value(value):
+	"""Convert values openpyxl cannot store, such as group keys, to text"""
+	if isinstance(value, (dict, list, tuple)):
+		return json.dumps(value, default=str)
+	return value
+
+def create_private_file(filename, write):
+	"""
+	Write an export straight into the site's private files and attach a File record
+	write(fileobj) streams the content, so the export is never held in memory.
+	Returns (file_doc, value returned by write).
+	"""
+	file_name, path = get_private_file_path(filename)
+	try:
+		with open(path, 'wb') as f:
+			result = write(f)
+	except Exception:
+		os.remove(path)
+		raise
+	
+	return attach_private_file(file_name, path), result
+
+def get_private_file_path(filename):
+	"""
+	Return (file_name, path) for a new file in the site's private files
+	"""
+	file_name = f"{frappe.generate_hash(length=8)}_{filename}"
+	return file_name, frappe.get_site_path('private', 'files', file_name)
+
+def attach_private_file(file_name, path):
+	"""
+	Insert the File record of a file already written to the site's private files
+	"""
+	import hashlib
+	
+	content_hash = hashlib.md5()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b''):
+			content_hash.update(chunk)
+	
+	file_doc = frappe.get_doc({
+		'doctype': 'File',
+		'file_name': file_name,
+		'file_url': f"/private/files/{file_name}",
+		'is_private': 1,
+		'file_size': os.path.getsize(path),
+		'content_hash': content_hash.hexdigest()
+	})
+	file_doc.insert(ignore_permissions=True)
+	return file_doc
+
+def generate_html_from_data(report_name, data, columns=None):
 	"""
 	Generate HTML representation of report data
 	"""
-	html = f"""
-	<html>
-	<head>
-		<style>
-			body {{ font-family: Arial, sans-serif; margin: 20px; }}
-			h1 {{ color: #333; border-bottom: 2px solid #333; padding-bottom: 10px; }}
-			table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
-			th {{ background-color: #4472C4; color: white; padding: 10px; text-align: left; border: 1px solid #999; }}
-			td {{ padding: 8px; border: 1px solid #ddd; }}
-			tr:nth-child(even) {{ background-color: #f2f2f2; }}
-			.subtotal {{ background-color: #e8e8e8; font-weight: bold; }}
-			.group-header {{ background-color: #d9e1f2; font-weight: bold; }}
-		</style>
-	</head>
-	<body>
-		<h1>{report_name}</h1>
-		<table>
+	batches = [data] if isinstance(data, list) else []
+	return "".join(iter_html_chunks(report_name, batches, columns, rows_per_chunk=None))
+
+def iter_html_chunks(report_name, batches, columns=None, rows_per_chunk=HTML_ROWS_PER_CHUNK):
+	"""
+	Render batches of records as complete HTML documents of rows_per_chunk rows
+	Cells are formatted by per-column closures resolved once from the report
+	columns, values are escaped, and each document is built with a list join.
+	The next result set of a stored procedure starts a new table, as in
+	write_csv. With rows_per_chunk=None a single document is produced.
 	"""
+	sample, batches = sample_batches(batches)
+	if not sample or not is_record(sample[0]):
+		yield render_html_document(report_name, [], [])
+		return
+	
+	headers, labels = get_export_headers(sample, columns)
+	formatters = build_column_formatters(headers, columns)
+	header_html = render_html_header(labels)
+	row_classes = {'SUBTOTAL': ' class="subtotal"', 'GROUP_HEADER': ' class="group-header"'}
 	
-	if isinstance(data, list) and len(data) > 0:
-		# Write headers
-		if isinstance(data[0], dict):
-			headers = list(data[0].keys())
-			html += "<tr>"
-			for header in headers:
-				html += f"<th>{header}</th>"
-			html += "</tr>"
+	rows = []
+	# The header of the result set the current chunk starts in
+	chunk_header = header_html
+	section_fields = get_detail_fields(sample)
+	for batch in batches:
+		fields = get_detail_fields(batch)
+		if fields and section_fields and fields != section_fields:
+			headers = fields
+			formatters = build_column_formatters(headers, columns)
+			header_html = render_html_header(headers)
+			if rows:
+				rows.append(f"</table><table>{header_html}")
+			else:
+				chunk_header = header_html
+		section_fields = fields or section_fields
+		
+		for record in batch:
+			row_type = record.get('_type')
+			if row_type:
+				cells = "".join(f"<td>{fmt(value)}</td>" for value, fmt in zip(get_row_values(record, headers), formatters))
+			else:
+				cells = "".join(f"<td>{fmt(record.get(header))}</td>" for header, fmt in zip(headers, formatters))
+			rows.append(f"<tr{row_classes.get(row_type, '')}>{cells}</tr>")
 			
-			# Write data rows
-			for record in data:
-				row_class = ""
-				if record.get('_type') == 'SUBTOTAL':
-					row_class = 'class="subtotal"'
-				elif record.get('_type') == 'GROUP_HEADER':
-					row_class = 'class="group-header"'
-				
-				html += f"<tr {row_class}>"
-				for header in headers:
-					html += f"<td>{record.get(header, '')}</td>"
-				html += "</tr>"
-	
-	html += """
-		</table>
-	</body>
-	</html>
+			if rows_per_chunk and len(rows) >= rows_per_chunk:
+				yield render_html_document(report_name, chunk_header, rows)
+				rows = []
+				chunk_header = header_html
+	
+	if rows or not rows_per_chunk:
+		yield render_html_document(report_name, chunk_header, rows)
+
+def render_html_header(labels):
+	"""Render the header row of a table"""
+	return "<tr>" + "".join(f"<th>{escape_html(label)}</th>" for label in labels) + "</tr>"
+
+def render_html_document(report_name, header_html, rows):
 	"""
+	Wrap rendered table rows in the report HTML document
+	"""
+	return "".join([
+		HTML_HEAD.format(title=escape_html(report_name)),
+		header_html or "",
+		"".join(rows),
+		HTML_FOOT
+	])
+
+def build_column_formatters(headers, columns=None):
+	"""
+	Return one formatter closure per header, resolved from the column field types
+	Currency, Percent and Date use utils.format_*; everything is HTML-escaped.
+	"""
+	from jmit_report_builder.utils import format_currency, format_percentage, format_date
 	
-	return html
+	column_map = {col.get('field_name'): col for col in columns or []}
+	formatters = []
+	for header in headers:
+		col = column_map.get(header) or {}
+		field_type = col.get('field_type')
+		precision = get_format_precision(col.get('format'))
+		
+		if field_type == 'Currency':
+			formatter = lambda value, p=precision: format_currency(value, p)
+		elif field_type == 'Percent':
+			formatter = lambda value, p=precision: format_percentage(value, p)
+		elif field_type == 'Date':
+			formatter = format_date
+		else:
+			formatter = None
+		
+		formatters.append(make_cell_formatter(formatter))
+	return formatters
+
+def make_cell_formatter(formatter):
+	"""Wrap a value formatter so empty values render blank and output is escaped"""
+	if formatter is None:
+		return lambda value: "" if value is None else escape_html(value)
+	return lambda value: "" if value is None or value == "" else escape_html(formatter(value))
+
+def get_format_precision(number_format, default=2):
+	"""Return the decimal places of a format such as ###,##0.00"""
+	if not number_format or '.' not in number_format:
+		return default
+	return len(number_format.rsplit('.', 1)[1].rstrip('%'))
+
+def escape_html(value):
+	"""Escape a cell value for HTML"""
+	return html.escape(str(value), quote=False)
@@ -0,0 +1,154 @@
+"""
+Filter Compiler - Compiles report filters into parameterized SQL
+"""
+import frappe
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from functools import partial
+from jmit_report_builder.api.sql_parser import ParsedQuery, add_conditions
+
+# Operators offered by the JMIT Report Filter doctype
+FILTER_OPERATORS = ('=', '!=', '>', '<', '>=', '<=', 'LIKE', 'IN', 'NOT IN')
+
+# Compiled statement templates kept per process
+DEFAULT_STATEMENT_CACHE_SIZE = 512
+
+FIELD_PATTERN = re.compile(
+	r'^(`[^`]+`|[A-Za-z_][A-Za-z0-9_]*)(\.(`[^`]+`|[A-Za-z_][A-Za-z0-9_]*))?$'
+)
+
+class StatementCache:
+	"""
+	LRU cache of compiled SQL statement templates
+	"""
+	def __init__(self, max_entries=DEFAULT_STATEMENT_CACHE_SIZE):
+		self.max_entries = max_entries
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			template = self.entries.get(key)
+			if template is not None:
+				self.entries.move_to_end(key)
+			return template
+
+	def set(self, key, template):
+		with self.lock:
+			self.entries[key] = template
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
+
+	def clear(self, scope=None):
+		with self.lock:
+			if scope is None:
+				self.entries.clear()
+			else:
+				for key in [k for k in self.entries if k[0] == scope]:
+					del self.entries[key]
+
+statement_cache = StatementCache()
+parse_cache = StatementCache()
+
+def compile_query(query, filters, scope=None):
+	"""
+	Compile a query and its filters into (sql, values)
+	The SQL text only depends on the filter fields, operators and IN list
+	lengths, so templates are cached per scope (usually the report name) and
+	repeat runs with new values reuse the same statement text.
+	"""
+	filters = [f for f in (filters or []) if f.get('field')]
+	if not filters:
+		return query, ()
+
+	shape = get_filter_shape(filters)
+	key = (scope or '', hashlib.sha1(query.encode()).hexdigest(), shape)
+
+	template = statement_cache.get(key)
+	if template is None:
+		parsed = get_parsed_query(query, scope)
+		conditions = [
+			(field, partial(compile_condition, operator=operator, arity=arity))
+			for field, operator, arity in shape
+		]
+		template = add_conditions(parsed, conditions)
+		statement_cache.set(key, template)
+
+	return template, get_filter_values(filters)
+
+def get_parsed_query(query, scope=None):
+	"""
+	Return the cached parse of a query
+	Literal % is doubled before parsing because values are bound with %s
+	placeholders, so the parse is shared by every filter shape of a report.
+	"""
+	key = (scope or '', hashlib.sha1(query.encode()).hexdigest())
+	parsed = parse_cache.get(key)
+	if parsed is None:
+		parsed = ParsedQuery(query.replace('%', '%%'))
+		parse_cache.set(key, parsed)
+	return parsed
+
+def get_filter_shape(filters):
+	"""
+	Return the (field, operator, value count) tuple that determines the SQL text
+	"""
+	shape = []
+	for f in filters:
+		field = f.get('field', '')
+		operator = normalize_operator(f.get('operator'))
+
+		if not FIELD_PATTERN.match(field):
+			frappe.throw(f"Invalid filter field: {field}")
+		if operator not in FILTER_OPERATORS:
+			frappe.throw(f"Unsupported filter operator: {operator}")
+
+		arity = len(split_values(f.get('value'))) if operator in ('IN', 'NOT IN') else 1
+		shape.append((field, operator, arity))
+	return tuple(shape)
+
+def compile_condition(target, operator, arity):
+	"""
+	Build the placeholder condition SQL for one filter on a column expression
+	"""
+	if operator in ('IN', 'NOT IN'):
+		if not arity:
+			# An empty IN list matches nothing, an empty NOT IN everything
+			return '1 = 0' if operator == 'IN' else '1 = 1'
+		placeholders = ', '.join(['%s'] * arity)
+		return f"{target} {operator} ({placeholders})"
+	return f"{target} {operator} %s"
+
+def get_filter_values(filters):
+	"""
+	Return the bound parameter tuple for filters, in placeholder order
+	"""
+	values = []
+	for f in filters:
+		operator = normalize_operator(f.get('operator'))
+		value = f.get('value', '')
+
+		if operator in ('IN', 'NOT IN'):
+			values.extend(split_values(value))
+		elif operator == 'LIKE':
+			values.append(f"%{value}%")
+		else:
+			values.append(value)
+	return tuple(values)
+
+def normalize_operator(operator):
+	"""Return an operator in the canonical form used by the doctype"""
+	return re.sub(r'\s+', ' ', (operator or '=').strip().upper())
+
+def split_values(value):
+	"""
+	Split an IN filter value given as a list or a comma-separated string
+	"""
+	if value is None or value == '':
+		return []
+	if isinstance(value, (list, tuple)):
+		return list(value)
+	return [v.strip() for v in str(value).split(',')]
@@ -0,0 +1,339 @@
+"""
+Query Governor - Time, row and memory limits and cancellation of report executions
+"""
+import frappe
+from frappe.decorators import whitelist
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from jmit_report_builder.api.sql_parser import ParsedQuery, add_row_limit
+from jmit_report_builder.api.routing import get_current_replica, replica_connection
+
+LIMIT_FIELDS = ('max_execution_time', 'max_rows', 'max_memory_mb')
+
+RUNNING_QUERY_KEY = "jmit_report_running_query"
+CANCEL_KEY = "jmit_report_query_cancel"
+REGISTRATION_TTL = 3600
+
+# Rows sampled from each batch to estimate its size
+MEMORY_SAMPLE_ROWS = 8
+
+# MariaDB/MySQL errors of a statement stopped by max_statement_time or KILL QUERY
+INTERRUPTED_ERROR_CODES = (1317, 1969, 3024)
+# Postgres query_canceled, raised by statement_timeout and pg_cancel_backend
+INTERRUPTED_PGCODE = '57014'
+
+_active_governor = ContextVar('jmit_report_governor', default=None)
+
+class QueryGovernor:
+	"""
+	Enforces the limits of one execution on the rows it reads
+	Rows are admitted batch by batch; once a limit is reached the governor
+	stops admitting rows and records which limit ended the execution. The
+	statement timeout is enforced by the database as well, so a single slow
+	statement is interrupted too. With keep_batches, the admitted batches of
+	each tracked stream are kept so an interrupted execution can still return
+	the rows read before the interruption.
+	"""
+	def __init__(self, limits=None, job_id=None, keep_batches=False):
+		limits = limits or {}
+		self.max_execution_time = int(limits.get('max_execution_time') or 0)
+		self.max_rows = int(limits.get('max_rows') or 0)
+		self.max_memory_mb = int(limits.get('max_memory_mb') or 0)
+		self.job_id = job_id
+		self.started = time.monotonic()
+		self.rows = 0
+		self.memory = 0
+		self.limit = None
+		self.kept_streams = [] if keep_batches else None
+
+	@property
+	def stopped(self):
+		return self.limit is not None
+
+	def admit(self, batch):
+		"""Return the part of a batch that fits the limits, stopping when one is reached"""
+		if self.stopped:
+			return []
+		if self.job_id and is_cancel_requested(self.job_id):
+			self.stop('cancelled')
+			return []
+		if self.max_execution_time and time.monotonic() - self.started > self.max_execution_time:
+			self.stop('max_execution_time', self.max_execution_time)
+			return []
+
+		if self.max_rows and self.rows + len(batch) > self.max_rows:
+			batch = batch[:self.max_rows - self.rows]
+			self.stop('max_rows', self.max_rows)
+
+		if self.max_memory_mb and batch:
+			budget = self.max_memory_mb * 1024 * 1024
+			size = estimate_batch_size(batch)
+			if self.memory + size > budget:
+				# Keep the rows that fit, assuming the rows of a batch are of similar size
+				fitting = len(batch) * max(budget - self.memory, 0) // size
+				size = size * fitting // len(batch)
+				batch = batch[:fitting]
+				self.stop('max_memory_mb', self.max_memory_mb)
+			self.memory += size
+
+		self.rows += len(batch)
+		return batch
+
+	def track(self, batches):
+		"""Yield the admitted part of each batch until a limit is reached"""
+		kept = None
+		if self.kept_streams is not None:
+			kept = []
+			self.kept_streams.append(kept)
+		for batch in batches:
+			batch = self.admit(batch)
+			if batch:
+				if kept is not None:
+					kept.append(batch)
+				yield batch
+			if self.stopped:
+				return
+
+	def stop(self, reason, value=None):
+		if self.limit is None:
+			self.limit = {'reason': reason, 'value': value}
+
+	def interrupted(self, error):
+		"""
+		Record a statement interrupted by the database timeout or a cancellation
+		Returns False for any other error.
+		"""
+		if not is_interrupted_error(error):
+			return False
+		if self.job_id and is_cancel_requested(self.job_id):
+			self.stop('cancelled')
+		else:
+			self.stop('max_execution_time', self.max_execution_time)
+		return True
+
+	def finish(self, result):
+		"""Mark a result as partial when a limit ended the execution early"""
+		if not self.stopped or not isinstance(result, dict):
+			return result
+		return dict(result, partial=True, limit=dict(
+			self.limit,
+			rows_fetched=self.rows,
+			elapsed=round(time.monotonic() - self.started, 3)
+		))
+
+@contextmanager
+def governed(config, job_id=None, limits=None, keep_batches=False):
+	"""
+	Run the body of an execution under a governor
+	limits defaults to the effective limits of the config. With a job_id the
+	connection is registered so cancel_query can interrupt its statement.
+	keep_batches is for executions that hold their whole result anyway.
+	"""
+	governor = QueryGovernor(get_limits(config) if limits is None else limits, job_id, keep_batches)
+	token = _active_governor.set(governor)
+	try:
+		with statement_timeout(governor.max_execution_time), registered_query(job_id):
+			yield governor
+	finally:
+		_active_governor.reset(token)
+
+def get_active_governor():
+	"""Return the governor of the current execution, or None"""
+	return _active_governor.get()
+
+def govern_query(query):
+	"""
+	Cap a SELECT at the row limit of the current execution
+	One extra row is fetched so a result of exactly max_rows is not reported as cut off.
+	"""
+	governor = _active_governor.get()
+	if governor is None or not governor.max_rows:
+		return query
+	return add_row_limit(ParsedQuery(query), governor.max_rows + 1)
+
+def govern_rows(rows):
+	"""Apply the limits of the current execution to a fetched list of rows"""
+	governor = _active_governor.get()
+	return rows if governor is None else governor.admit(rows)
+
+def govern_batches(batches):
+	"""Apply the limits of the current execution to a stream of batches"""
+	governor = _active_governor.get()
+	return batches if governor is None else governor.track(batches)
+
+def is_stopped():
+	"""Check whether the current execution has reached a limit"""
+	governor = _active_governor.get()
+	return governor is not None and governor.stopped
+
+def needs_streaming():
+	"""
+	Check whether rows have to be read in batches to enforce the memory budget
+	A buffered fetch holds the whole result before it can be measured.
+	"""
+	governor = _active_governor.get()
+	return governor is not None and bool(governor.max_memory_mb)
+
+def get_limits(config):
+	"""
+	Return the effective limits of an execution; 0 means no limit
+	The site and role limits are the ceiling. The report's limits and the
+	'limits' of a query config can only lower them.
+	"""
+	limits = get_role_limits()
+	for field, value in (config.get('limits') or {}).items():
+		if field in LIMIT_FIELDS and int(value or 0) > 0:
+			limits[field] = min(limits[field], int(value)) if limits[field] else int(value)
+	return limits
+
+def get_role_limits():
+	"""
+	Return the limits of the current user from site_config.json
+	A role's entry replaces the site default; with several roles the most
+	generous one applies, and 0 lifts the limit.
+	site_config.json:
+		"jmit_report_max_execution_time": 120
+		"jmit_report_max_rows": 500000
+		"jmit_report_max_memory_mb": 512
+		"jmit_report_role_limits": {"Report Manager": {"max_execution_time": 600}}
+	"""
+	conf = frappe.conf or {}
+	limits = {field: int(conf.get(f'jmit_report_{field}') or 0) for field in LIMIT_FIELDS}
+
+	role_limits = conf.get('jmit_report_role_limits') or {}
+	if role_limits:
+		entries = [role_limits[role] for role in frappe.get_roles() if role in role_limits]
+		for field in LIMIT_FIELDS:
+			values = [int(entry.get(field) or 0) for entry in entries if field in entry]
+			if values:
+				limits[field] = 0 if 0 in values else max(values)
+	return limits
+
+def estimate_batch_size(batch):
+	"""Estimate the memory of a batch of rows from a sample of its rows and values"""
+	sample = batch[:MEMORY_SAMPLE_ROWS]
+	total = sum(
+		sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+		for row in sample
+	)
+	return total * len(batch) // len(sample)
+
+@contextmanager
+def statement_timeout(seconds):
+	"""
+	Limit the run time of each statement on the site's connection
+	The previous session value is restored afterwards.
+	"""
+	if not seconds:
+		yield
+		return
+
+	if getattr(frappe.db, 'db_type', 'mariadb') == 'postgres':
+		previous = frappe.db.sql("SHOW statement_timeout")[0][0]
+		frappe.db.sql(f"SET statement_timeout = {int(seconds) * 1000}")
+		try:
+			yield
+		finally:
+			frappe.db.sql("SET statement_timeout = %s", (previous,))
+		return
+
+	previous = frappe.db.sql("SELECT @@SESSION.max_statement_time")[0][0]
+	frappe.db.sql(f"SET SESSION max_statement_time = {int(seconds)}")
+	try:
+		yield
+	finally:
+		frappe.db.sql("SET SESSION max_statement_time = %s", (previous,))
+
+@contextmanager
+def registered_query(job_id):
+	"""
+	Publish the database connection of a job so other workers can interrupt it
+	"""
+	if not job_id:
+		yield
+		return
+
+	key = f"{RUNNING_QUERY_KEY}:{job_id}"
+	frappe.cache().set_value(key, {
+		'connection_id': get_connection_id(),
+		'replica': get_current_replica(),
+		'user': frappe.session.user
+	}, expires_in_sec=REGISTRATION_TTL)
+	try:
+		yield
+	finally:
+		frappe.cache().delete_value(key)
+		frappe.cache().delete_value(f"{CANCEL_KEY}:{job_id}")
+
+def get_connection_id():
+	if getattr(frappe.db, 'db_type', 'mariadb') == 'postgres':
+		return frappe.db.sql("SELECT pg_backend_pid()")[0][0]
+	return frappe.db.sql("SELECT CONNECTION_ID()")[0][0]
+
+@whitelist()
+def cancel_query(job_id):
+	"""
+	Cancel an execution started with a 'job_id' in its query config
+	The running statement is interrupted and the execution returns the rows
+	read so far as a partial result.
+	"""
+	try:
+		running = frappe.cache().get_value(f"{RUNNING_QUERY_KEY}:{job_id}")
+		if not running:
+			return {
+				'success': False,
+				'message': 'No running query with this job id'
+			}
+		if running.get('user') != frappe.session.user and 'System Manager' not in frappe.get_roles():
+			frappe.throw("Not permitted", frappe.PermissionError)
+
+		frappe.cache().set_value(f"{CANCEL_KEY}:{job_id}", 1, expires_in_sec=REGISTRATION_TTL)
+		kill_query(job_id)
+		return {
+			'success': True,
+			'message': 'Query cancelled'
+		}
+	except Exception as e:
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+def kill_query(job_id):
+	"""
+	Interrupt the statement running on the connection registered for a job
+	The connection itself stays open. Returns whether a connection was found.
+	"""
+	running = frappe.cache().get_value(f"{RUNNING_QUERY_KEY}:{job_id}")
+	if not running:
+		return False
+
+	# Connection ids are per server, so a replica query is killed on its replica
+	if running.get('replica'):
+		with replica_connection(running['replica']) as db:
+			interrupt_connection(db, running['connection_id'])
+	else:
+		interrupt_connection(frappe.db, running['connection_id'])
+	return True
+
+def interrupt_connection(db, connection_id):
+	if getattr(db, 'db_type', 'mariadb') == 'postgres':
+		db.sql("SELECT pg_cancel_backend(%s)", (int(connection_id),))
+	else:
+		db.sql(f"KILL QUERY {int(connection_id)}")
+
+def is_cancel_requested(job_id):
+	return bool(frappe.cache().get_value(f"{CANCEL_KEY}:{job_id}"))
+
+def is_interrupted_error(error):
+	"""Check whether an error, or the driver error it wraps, is an interrupted statement"""
+	while error is not None:
+		if getattr(error, 'pgcode', None) == INTERRUPTED_PGCODE:
+			return True
+		args = getattr(error, 'args', None) or ()
+		if args and args[0] in INTERRUPTED_ERROR_CODES:
+			return True
+		error = error.__cause__ or error.__context__
+	return False
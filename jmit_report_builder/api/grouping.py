@@ -0,0 +1,334 @@
+"""
+Grouping Engine - Single-pass grouping and subtotals for pre-sorted results
+"""
+import re
+from functools import lru_cache
+from jmit_report_builder.api.rows import get_key_getter, get_field_getter
+
+# Clauses that can follow ORDER BY at the end of a SELECT statement
+ORDER_BY_TERMINATORS = ('LIMIT', 'OFFSET', 'FOR UPDATE', 'LOCK IN SHARE MODE')
+
+class SubtotalAccumulator:
+	"""
+	Running aggregate for one subtotal field
+	Matches the semantics of query_engine.apply_grouping_and_subtotals: SUM, MAX and
+	MIN treat empty values as 0, AVG skips empty values and COUNT counts records.
+	"""
+	__slots__ = ('field', 'operation', 'total', 'count', 'value')
+
+	def __init__(self, field, operation='SUM'):
+		self.field = field
+		self.operation = operation
+		self.reset()
+
+	def reset(self):
+		self.total = 0
+		self.count = 0
+		self.value = None
+
+	def add(self, raw, number):
+		"""Add one record given its raw value and its value as a float"""
+		operation = self.operation
+		if operation == 'SUM':
+			self.total += number
+		elif operation == 'AVG':
+			if raw:
+				self.total += number
+				self.count += 1
+		elif operation == 'MAX':
+			if self.value is None or number > self.value:
+				self.value = number
+		elif operation == 'MIN':
+			if self.value is None or number < self.value:
+				self.value = number
+
+	def result(self, record_count):
+		"""Return the aggregate for a group of record_count records"""
+		operation = self.operation
+		if operation == 'SUM':
+			return self.total
+		elif operation == 'AVG':
+			return self.total / self.count if self.count else 0
+		elif operation == 'COUNT':
+			return record_count
+		return self.value
+
+def build_accumulators(subtotal_fields):
+	"""
+	Create one accumulator per supported subtotal entry
+	"""
+	accumulators = []
+	for subtotal_field in subtotal_fields or []:
+		operation = subtotal_field.get('operation', 'SUM')
+		if operation in ('SUM', 'AVG', 'COUNT', 'MAX', 'MIN'):
+			accumulators.append(SubtotalAccumulator(subtotal_field.get('field'), operation))
+	return accumulators
+
+def iter_sorted_groups(records, grouping_fields, subtotal_fields):
+	"""
+	Group records that arrive sorted by grouping_fields in a single pass
+	Yields the same GROUP_HEADER, detail and SUBTOTAL rows as
+	apply_grouping_and_subtotals, emitting each group as soon as it closes. Only
+	the current group's records are held because the header carries its count.
+	"""
+	accumulators = build_accumulators(subtotal_fields)
+	# Each distinct field is converted to float once per record
+	value_fields = []
+	for accumulator in accumulators:
+		if accumulator.operation != 'COUNT' and accumulator.field not in value_fields:
+			value_fields.append(accumulator.field)
+	field_accumulators = [
+		(field, [a for a in accumulators if a.field == field and a.operation != 'COUNT'])
+		for field in value_fields
+	]
+
+	current_key = None
+	group_records = []
+	key_of = None
+
+	for record in records:
+		if key_of is None:
+			# Accessors are resolved once; tuple records are read by position
+			key_of = get_key_getter(record, grouping_fields)
+			field_accumulators = [
+				(get_field_getter(record, field, 0), field_accs) for field, field_accs in field_accumulators
+			]
+		key = key_of(record)
+
+		if group_records and key != current_key:
+			yield from _close_group(grouping_fields, current_key, group_records, subtotal_fields, accumulators)
+			group_records = []
+
+		current_key = key
+		group_records.append(record)
+
+		for value_of, field_accs in field_accumulators:
+			raw = value_of(record)
+			number = float(raw or 0)
+			for accumulator in field_accs:
+				accumulator.add(raw, number)
+
+	if group_records:
+		yield from _close_group(grouping_fields, current_key, group_records, subtotal_fields, accumulators)
+
+def _close_group(grouping_fields, group_key, records, subtotal_fields, accumulators):
+	"""Yield the header, records and subtotal row of a finished group"""
+	yield {
+		'_type': 'GROUP_HEADER',
+		'_group_key': dict(zip(grouping_fields, group_key)),
+		'_record_count': len(records)
+	}
+
+	yield from records
+
+	if subtotal_fields:
+		subtotal_row = {
+			'_type': 'SUBTOTAL',
+			'_group_key': dict(zip(grouping_fields, group_key))
+		}
+		for accumulator in accumulators:
+			subtotal_row[f'{accumulator.field}_subtotal'] = accumulator.result(len(records))
+			accumulator.reset()
+		yield subtotal_row
+
+def is_sorted_by(query, grouping_fields):
+	"""
+	Check whether the outermost ORDER BY of a query starts with grouping_fields
+	Qualified columns (si.customer) match their bare name (customer).
+	"""
+	if not query or not grouping_fields:
+		return False
+
+	order_terms = get_order_by_terms(query)
+	if len(order_terms) < len(grouping_fields):
+		return False
+
+	for term, field in zip(order_terms, grouping_fields):
+		if term != field and term.rsplit('.', 1)[-1] != field:
+			return False
+	return True
+
+@lru_cache(maxsize=512)
+def get_order_by_terms(query):
+	"""
+	Return the column names of the outermost ORDER BY clause, without ASC/DESC
+	Parses are cached per query text, as saved reports run the same query repeatedly.
+	"""
+	matches = list(re.finditer(r'\bORDER\s+BY\b', query, re.IGNORECASE))
+	for match in reversed(matches):
+		clause = query[match.end():]
+		# An ORDER BY inside a subquery is followed by an unbalanced ')'
+		if _paren_depth(clause) < 0:
+			continue
+
+		for terminator in ORDER_BY_TERMINATORS:
+			end = re.search(r'\b' + terminator.replace(' ', r'\s+') + r'\b', clause, re.IGNORECASE)
+			if end:
+				clause = clause[:end.start()]
+
+		terms = []
+		for term in _split_top_level(clause.strip().rstrip(';')):
+			term = re.sub(r'\s+(ASC|DESC)$', '', term.strip(), flags=re.IGNORECASE)
+			terms.append(term.replace('`', '').strip())
+		return tuple(terms)
+	return ()
+
+def _paren_depth(text):
+	"""Return the lowest parenthesis depth reached while scanning text"""
+	depth = lowest = 0
+	for char in text:
+		if char == '(':
+			depth += 1
+		elif char == ')':
+			depth -= 1
+			lowest = min(lowest, depth)
+	return lowest
+
+def _split_top_level(text):
+	"""Split text on commas that are not inside parentheses"""
+	parts = []
+	depth = 0
+	start = 0
+	for index, char in enumerate(text):
+		if char == '(':
+			depth += 1
+		elif char == ')':
+			depth -= 1
+		elif char == ',' and depth == 0:
+			parts.append(text[start:index])
+			start = index + 1
+	parts.append(text[start:])
+	return [part for part in parts if part.strip()]
+
+def quote_identifier(name, db_type='mariadb'):
+	"""
+	Quote a column alias for use in generated SQL
+	"""
+	if not name or not re.match(r'^[A-Za-z_][A-Za-z0-9_ ]*$', name):
+		raise ValueError(f"Invalid field name: {name}")
+	return f'"{name}"' if db_type == 'postgres' else f'`{name}`'
+
+def _aggregate_expression(operation, column):
+	"""SQL expression matching the Python subtotal semantics of one operation"""
+	if operation == 'SUM':
+		return f"COALESCE(SUM({column}), 0)"
+	elif operation == 'AVG':
+		return f"COALESCE(AVG(NULLIF({column}, 0)), 0)"
+	elif operation == 'COUNT':
+		return "COUNT(*)"
+	elif operation == 'MAX':
+		return f"MAX(COALESCE({column}, 0))"
+	elif operation == 'MIN':
+		return f"MIN(COALESCE({column}, 0))"
+	raise ValueError(f"Unsupported subtotal operation: {operation}")
+
+def build_rollup_query(query, grouping_fields, subtotal_fields, db_type='mariadb'):
+	"""
+	Rewrite a report query so the database computes its group subtotals
+	The report query is wrapped as a derived table and aggregated with
+	GROUP BY ... WITH ROLLUP on MariaDB/MySQL or GROUPING SETS on Postgres, so
+	only one row per group (plus the rollup levels) leaves the server.
+	"""
+	q = lambda name: quote_identifier(name, db_type)
+	fields = [q(field) for field in grouping_fields]
+	aggregates = [f"COUNT(*) AS {q('_record_count')}"]
+	for index, subtotal_field in enumerate(subtotal_fields or []):
+		expression = _aggregate_expression(subtotal_field.get('operation', 'SUM'), q(subtotal_field.get('field')))
+		aggregates.append(f"{expression} AS {q(f'_jmit_agg_{index}')}")
+
+	source = f"({query.strip().rstrip(';')}) AS {q('_jmit_src')}"
+
+	if db_type == 'postgres':
+		grouping_sets = ", ".join(f"({', '.join(fields[:level])})" for level in range(len(fields), -1, -1))
+		order_by = ", ".join(f"GROUPING({field}), {field}" for field in fields)
+		return (
+			f"SELECT {', '.join(fields)}, GROUPING({', '.join(fields)}) AS {q('_jmit_grouping')}, "
+			f"{', '.join(aggregates)} FROM {source} "
+			f"GROUP BY GROUPING SETS ({grouping_sets}) ORDER BY {order_by}"
+		)
+
+	# MariaDB has no GROUPING(), so every field is preceded by an IS NULL marker
+	# that is never NULL in real data and tells rollup rows apart from NULL groups
+	columns = []
+	for index, field in enumerate(fields):
+		columns.append(f"{field} IS NULL AS {q(f'_jmit_null_{index}')}")
+		columns.append(field)
+	group_by = []
+	for index, field in enumerate(fields):
+		group_by.append(q(f'_jmit_null_{index}'))
+		group_by.append(field)
+	return (
+		f"SELECT {', '.join(columns)}, {', '.join(aggregates)} FROM {source} "
+		f"GROUP BY {', '.join(group_by)} WITH ROLLUP"
+	)
+
+def map_rollup_rows(rows, grouping_fields, subtotal_fields, db_type='mariadb'):
+	"""
+	Convert rollup query output into GROUP_HEADER/SUBTOTAL rows
+	Full groups produce the same header and subtotal rows as
+	apply_grouping_and_subtotals. Rollup levels become SUBTOTAL rows whose
+	_group_key holds the leading grouping fields only, plus a _rollup_level.
+	"""
+	depth = len(grouping_fields)
+	result = []
+	previous_key = None
+
+	for row in rows:
+		if db_type == 'postgres':
+			level = depth - int(row.get('_jmit_grouping') or 0).bit_length()
+		else:
+			level, rolled = _mariadb_rollup_level(row, grouping_fields)
+			key = tuple((row.get(f'_jmit_null_{i}'), row.get(field)) for i, field in enumerate(grouping_fields))
+			# Rolling up a NULL-only column repeats the row before it
+			if rolled or key == previous_key:
+				continue
+			previous_key = key
+
+		group_key = {field: row.get(field) for field in grouping_fields[:level]}
+		subtotals = {}
+		for index, subtotal_field in enumerate(subtotal_fields or []):
+			subtotals[f"{subtotal_field.get('field')}_subtotal"] = _subtotal_value(
+				subtotal_field.get('operation', 'SUM'), row.get(f'_jmit_agg_{index}')
+			)
+
+		if level == depth:
+			result.append({
+				'_type': 'GROUP_HEADER',
+				'_group_key': group_key,
+				'_record_count': int(row.get('_record_count') or 0)
+			})
+			if subtotal_fields:
+				result.append(dict({'_type': 'SUBTOTAL', '_group_key': dict(group_key)}, **subtotals))
+		else:
+			result.append(dict({
+				'_type': 'SUBTOTAL',
+				'_group_key': group_key,
+				'_rollup_level': level,
+				'_record_count': int(row.get('_record_count') or 0)
+			}, **subtotals))
+
+	return result
+
+def _subtotal_value(operation, value):
+	"""
+	Convert an aggregate read from the database to its Python subtotal type
+	COUNT stays an int like the record count; the other operations are floats,
+	as in the Python engines, whether the driver returns Decimal, int or float.
+	"""
+	if operation == 'COUNT':
+		return int(value or 0)
+	return float(value or 0)
+
+def _mariadb_rollup_level(row, grouping_fields):
+	"""
+	Return (level, rolled) for a MariaDB rollup row
+	level is the number of leading grouping fields the row is grouped by. rolled
+	marks the intermediate rows produced by rolling up a field but not its marker.
+	"""
+	for index, field in enumerate(grouping_fields):
+		marker = row.get(f'_jmit_null_{index}')
+		if marker is None:
+			return index, False
+		if not int(marker) and row.get(field) is None:
+			return index, True
+	return len(grouping_fields), False
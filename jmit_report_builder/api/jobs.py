@@ -0,0 +1,326 @@
+"""
+Report Jobs - Runs report executions and exports in background workers
+"""
+import frappe
+from frappe.decorators import whitelist
+from frappe.utils import now_datetime
+import json
+from datetime import datetime
+from jmit_report_builder.api.rows import Record
+from jmit_report_builder.api.governor import governed, get_limits, kill_query, is_interrupted_error
+
+DEFAULT_MAX_JOBS_PER_USER = 2
+JOB_TIMEOUT = 3600
+
+JOB_TYPES = ('Execute', 'Excel', 'CSV', 'PDF')
+ACTIVE_STATUSES = ('Queued', 'Running')
+
+JOB_EXTENSIONS = {
+	'Execute': 'json',
+	'Excel': 'xlsx',
+	'CSV': 'csv.gz',
+	'PDF': 'pdf'
+}
+
+PROGRESS_KEY = "jmit_report_job_progress"
+CANCEL_KEY = "jmit_report_job_cancel"
+
+class JobCancelled(Exception):
+	"""Raised inside a worker when a job was cancelled"""
+
+@whitelist()
+def enqueue_report_job(report_name=None, job_type='Execute', filters=None, query_config=None):
+	"""
+	Queue a saved report run, an ad-hoc query_config run or an export
+	job_type is one of Execute, Excel, CSV or PDF. The result is written to a
+	private file; poll get_report_job for progress and the file_url.
+	site_config.json:
+		"jmit_report_max_jobs_per_user": 2
+		"jmit_report_job_max_execution_time": 3600
+		"jmit_report_jobs_inline": false
+	"""
+	try:
+		if job_type not in JOB_TYPES:
+			frappe.throw(f"Unsupported job type: {job_type}")
+		if not report_name and not query_config:
+			frappe.throw("A report name or a query config is required")
+
+		limit = int(frappe.conf.get('jmit_report_max_jobs_per_user') or DEFAULT_MAX_JOBS_PER_USER)
+		active = count_active_jobs()
+		if active >= limit:
+			return too_many_jobs(active)
+
+		job = frappe.get_doc({
+			'doctype': 'JMIT Report Job',
+			'report_name': report_name,
+			'job_type': job_type,
+			'status': 'Queued',
+			'phase': 'Queued',
+			'filters': json.dumps(filters) if filters and not isinstance(filters, str) else filters,
+			'query_config': json.dumps(query_config) if query_config and not isinstance(query_config, str) else query_config
+		})
+		job.insert(ignore_permissions=True)
+		frappe.db.commit()
+
+		# Parallel requests of a user can all pass the check above. Once the job
+		# is committed, every job that pushed the count over the limit, counting
+		# in creation order, withdraws itself.
+		active = count_active_jobs(created_until=job.creation)
+		if active > limit:
+			frappe.delete_doc('JMIT Report Job', job.name, ignore_permissions=True, force=True)
+			frappe.db.commit()
+			return too_many_jobs(active - 1)
+
+		frappe.enqueue(
+			'jmit_report_builder.api.jobs.run_report_job',
+			queue='long',
+			timeout=JOB_TIMEOUT,
+			report_job=job.name,
+			now=run_inline()
+		)
+
+		return {
+			'success': True,
+			'job_id': job.name
+		}
+	except Exception as e:
+		frappe.logger().error(f"Report job error: {str(e)}")
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+def count_active_jobs(created_until=None):
+	"""Count the queued and running jobs of the current user"""
+	filters = {
+		'owner': frappe.session.user,
+		'status': ['in', ACTIVE_STATUSES]
+	}
+	if created_until:
+		filters['creation'] = ['<=', created_until]
+	return frappe.db.count('JMIT Report Job', filters)
+
+def too_many_jobs(active):
+	return {
+		'success': False,
+		'message': f'You already have {active} report jobs running. Wait for one to finish or cancel it.'
+	}
+
+def run_inline():
+	"""Run jobs in the current process, as in tests, instead of on a worker"""
+	return bool(frappe.flags.in_test or frappe.conf.get('jmit_report_jobs_inline'))
+
+@whitelist()
+def get_report_job(job_id):
+	"""
+	Return the status, phase, row count and artifact of a report job
+	"""
+	try:
+		job = get_job(job_id)
+		rows = job.rows_fetched or 0
+		phase = job.phase
+		if job.status == 'Running':
+			progress = frappe.cache().get_value(f"{PROGRESS_KEY}:{job.name}") or {}
+			rows = progress.get('rows', rows)
+			phase = progress.get('phase', phase)
+
+		return {
+			'success': True,
+			'job_id': job.name,
+			'report_name': job.report_name,
+			'job_type': job.job_type,
+			'status': job.status,
+			'phase': phase,
+			'rows_fetched': rows,
+			'file_url': job.file_url,
+			'error': job.error,
+			'started_at': job.started_at,
+			'finished_at': job.finished_at
+		}
+	except Exception as e:
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+@whitelist()
+def cancel_report_job(job_id):
+	"""
+	Cancel a queued or running report job
+	Running jobs stop at the next batch boundary, or at once when their
+	statement is still running.
+	"""
+	try:
+		job = get_job(job_id)
+		if job.status not in ACTIVE_STATUSES:
+			return {
+				'success': False,
+				'message': f'Job is already {job.status}'
+			}
+
+		frappe.cache().set_value(f"{CANCEL_KEY}:{job.name}", 1, expires_in_sec=JOB_TIMEOUT)
+		if job.status == 'Queued':
+			frappe.db.set_value('JMIT Report Job', job.name, {'status': 'Cancelled', 'phase': 'Cancelled'})
+		else:
+			# A statement can run for minutes before the next batch boundary
+			kill_query(job.name)
+		return {
+			'success': True,
+			'message': 'Job cancelled'
+		}
+	except Exception as e:
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+def get_job(job_id):
+	"""Load a job, allowing only its owner or a System Manager"""
+	job = frappe.get_doc('JMIT Report Job', job_id)
+	if job.owner != frappe.session.user and 'System Manager' not in frappe.get_roles():
+		frappe.throw("Not permitted", frappe.PermissionError)
+	return job
+
+def run_report_job(report_job):
+	"""
+	Worker entry point: execute a job and write its artifact
+	Progress and cancellation go through the cache because the database
+	connection is busy with the streaming cursor while rows are fetched.
+	"""
+	job = frappe.get_doc('JMIT Report Job', report_job)
+	if job.status != 'Queued' or is_cancelled(job.name):
+		return
+
+	set_job_status(job.name, status='Running', phase='Executing', started_at=now_datetime())
+	progress = JobProgress(job.name)
+	try:
+		from jmit_report_builder.api.export import create_private_file
+		from jmit_report_builder.api.query_engine import get_report_config, iter_config_batches
+
+		if job.query_config:
+			config = json.loads(job.query_config)
+		else:
+			config = get_report_config(job.report_name, job.filters)
+
+		title = job.report_name or 'Query'
+		filename = f"{title}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{JOB_EXTENSIONS[job.job_type]}"
+		with governed(config, job_id=job.name, limits=get_job_limits(config)) as governor:
+			batches = progress.track(iter_config_batches(config))
+			file_doc, _ = create_private_file(
+				filename,
+				lambda f: write_job_artifact(job.job_type, title, batches, f, config.get('columns'))
+			)
+
+		if governor.limit and governor.limit['reason'] == 'cancelled':
+			raise JobCancelled()
+		set_job_status(
+			job.name,
+			status='Completed',
+			phase='Completed',
+			rows_fetched=progress.rows,
+			file_url=file_doc.file_url,
+			error=get_limit_message(governor.limit),
+			finished_at=now_datetime()
+		)
+	except JobCancelled:
+		frappe.db.rollback()
+		set_job_status(job.name, status='Cancelled', phase='Cancelled', rows_fetched=progress.rows, finished_at=now_datetime())
+	except Exception as e:
+		frappe.db.rollback()
+		if is_cancelled(job.name) and is_interrupted_error(e):
+			set_job_status(job.name, status='Cancelled', phase='Cancelled', rows_fetched=progress.rows, finished_at=now_datetime())
+			return
+		frappe.logger().error(f"Report job {job.name} failed: {str(e)}")
+		set_job_status(job.name, status='Failed', phase='Failed', error=str(e), finished_at=now_datetime())
+	finally:
+		frappe.cache().delete_value(f"{PROGRESS_KEY}:{job.name}")
+		frappe.cache().delete_value(f"{CANCEL_KEY}:{job.name}")
+
+def get_job_limits(config):
+	"""
+	Return the limits of a background job
+	Jobs get the same row and memory limits as an interactive execution of the
+	config. Their time limit is the job ceiling of the site when one is set,
+	which a report's own limit can still lower; no statement of a job outlives
+	the worker's job timeout.
+	"""
+	limits = get_limits(config)
+	ceiling = int(frappe.conf.get('jmit_report_job_max_execution_time') or 0)
+	if ceiling:
+		requested = int((config.get('limits') or {}).get('max_execution_time') or 0)
+		limits['max_execution_time'] = min(ceiling, requested) if requested else ceiling
+	limits['max_execution_time'] = min(limits['max_execution_time'] or JOB_TIMEOUT, JOB_TIMEOUT)
+	return limits
+
+def get_limit_message(limit):
+	"""Describe the limit that cut a job's artifact short, or None"""
+	if not limit:
+		return None
+	return f"Stopped at the {limit['reason']} limit of {limit['value']}; the file holds the rows read until then"
+
+def write_job_artifact(job_type, title, batches, fileobj, columns=None):
+	"""
+	Write the batches of a job to a binary file in the job's format
+	"""
+	from jmit_report_builder.api import export
+
+	if job_type == 'Excel':
+		return export.write_xlsx(title, batches, fileobj, columns)
+	if job_type == 'CSV':
+		return export.write_csv_file(batches, fileobj, compress=True, columns=columns)
+	if job_type == 'PDF':
+		from pypdf import PdfWriter
+		from frappe.utils.pdf import get_pdf, get_file_data_from_writer
+
+		writer = PdfWriter()
+		for chunk in export.iter_html_chunks(title, batches, columns):
+			get_pdf(chunk, output=writer)
+		fileobj.write(get_file_data_from_writer(writer))
+		return None
+	return write_json(batches, fileobj)
+
+def write_json(batches, fileobj):
+	"""
+	Write batches of records as a JSON array without building one big string
+	"""
+	fileobj.write(b'[')
+	count = 0
+	for batch in batches:
+		for record in batch:
+			if count:
+				fileobj.write(b',')
+			if isinstance(record, Record):
+				record = record.as_dict()
+			fileobj.write(json.dumps(record, default=str).encode())
+			count += 1
+	fileobj.write(b']')
+	return count
+
+class JobProgress:
+	"""
+	Counts the rows flowing through a job and checks for cancellation per batch
+	"""
+	def __init__(self, job_name):
+		self.job_name = job_name
+		self.rows = 0
+
+	def track(self, batches):
+		for batch in batches:
+			if is_cancelled(self.job_name):
+				raise JobCancelled()
+			self.rows += len(batch)
+			frappe.cache().set_value(
+				f"{PROGRESS_KEY}:{self.job_name}",
+				{'phase': 'Fetching rows', 'rows': self.rows},
+				expires_in_sec=JOB_TIMEOUT
+			)
+			yield batch
+
+def is_cancelled(job_name):
+	"""Check whether cancellation of a job was requested"""
+	return bool(frappe.cache().get_value(f"{CANCEL_KEY}:{job_name}"))
+
+def set_job_status(job_name, **values):
+	"""Update a job and commit so pollers see the change"""
+	frappe.db.set_value('JMIT Report Job', job_name, values)
+	frappe.db.commit()
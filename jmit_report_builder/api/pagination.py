@@ -0,0 +1,166 @@
+"""
+Pagination API - Keyset (seek) pagination over report results
+"""
+import frappe
+from frappe.decorators import whitelist
+import base64
+import hashlib
+import json
+from jmit_report_builder.api.cache import normalize_query
+from jmit_report_builder.api.grouping import quote_identifier
+from jmit_report_builder.api.query_engine import apply_filters, get_select_query
+from jmit_report_builder.api.routing import read_replica
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Last sort key of every page query, unless the config names another one
+DEFAULT_UNIQUE_FIELD = 'name'
+
+@whitelist()
+def execute_query_page(query_config, page_token=None, page_size=DEFAULT_PAGE_SIZE):
+	"""
+	Execute one page of a query using keyset pagination
+	query_config accepts the execute_query keys plus:
+		'sort_fields': [{'field': 'posting_date', 'order': 'desc'}, 'customer'],
+		'unique_field': 'name'
+	Pages are delimited by a seek predicate on the sort keys instead of OFFSET,
+	so every page costs the same. Sort keys default to the grouping fields and
+	always end with 'unique_field', a unique non-null column the query has to
+	return, so rows with equal keys are not skipped at page boundaries. NULLs
+	sort first in ascending and last in descending keys on every database.
+	Pages return detail rows without grouping.
+	"""
+	try:
+		config = json.loads(query_config) if isinstance(query_config, str) else query_config
+		page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+		query_type = config.get('query_type', 'SQL')
+		if query_type not in ('SQL', 'VIEW'):
+			return {
+				'success': False,
+				'message': 'Pagination is only supported for SQL queries and views'
+			}
+
+		sort_keys = get_sort_keys(config)
+
+		query, values = apply_filters(
+			get_select_query(config.get('query', ''), query_type),
+			config.get('filters', []),
+			config.get('report_name')
+		)
+		signature = get_page_signature(query, values, sort_keys)
+		last_values = decode_page_token(page_token, signature) if page_token else None
+
+		db_type = getattr(frappe.db, 'db_type', 'mariadb')
+		page_query, page_values = build_page_query(query, values, sort_keys, last_values, page_size, db_type)
+		with read_replica(config.get('max_replica_lag')):
+			rows = frappe.db.sql(page_query, page_values or None, as_dict=True)
+
+		has_more = len(rows) > page_size
+		rows = rows[:page_size]
+		next_page_token = None
+		if has_more:
+			next_page_token = encode_page_token([rows[-1].get(field) for field, _ in sort_keys], signature)
+
+		return {
+			'success': True,
+			'data': rows,
+			'count': len(rows),
+			'has_more': has_more,
+			'next_page_token': next_page_token
+		}
+	except Exception as e:
+		frappe.logger().error(f"Query page error: {str(e)}")
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+def get_sort_keys(config):
+	"""
+	Return [(field, descending)] from sort_fields, or the grouping fields
+	The unique field is appended as the last key unless the keys end with it.
+	"""
+	sort_keys = []
+	for entry in config.get('sort_fields') or config.get('grouping_fields') or []:
+		if isinstance(entry, dict):
+			field = entry.get('field')
+			descending = str(entry.get('order', 'asc')).lower() in ('desc', 'descending')
+		else:
+			field, descending = entry, False
+		sort_keys.append((field, descending))
+
+	unique_field = config.get('unique_field') or DEFAULT_UNIQUE_FIELD
+	if not sort_keys or sort_keys[-1][0] != unique_field:
+		sort_keys.append((unique_field, sort_keys[-1][1] if sort_keys else False))
+	return sort_keys
+
+def build_page_query(query, values, sort_keys, last_values, page_size, db_type='mariadb'):
+	"""
+	Wrap a filtered query with a seek predicate, ORDER BY and LIMIT
+	The predicate is expanded to (k1 > a) OR (k1 = a AND k2 > b) ... so mixed
+	ASC/DESC keys work. NULL key values get IS NULL comparisons, as = and >
+	never match them. One extra row is fetched to tell if another page exists.
+	"""
+	columns = [(quote_identifier(field, db_type), descending) for field, descending in sort_keys]
+	where = ""
+	params = list(values or ())
+
+	if last_values is not None:
+		branches = []
+		for index, (column, descending) in enumerate(columns):
+			parts = [_equal_condition(previous, value) for (previous, _), value in zip(columns[:index], last_values)]
+			parts.append(_after_condition(column, descending, last_values[index]))
+			branches.append(f"({' AND '.join(parts)})")
+			params.extend(value for value in last_values[:index + 1] if value is not None)
+		where = f" WHERE {' OR '.join(branches)}"
+
+	# NULLs sort first ascending and last descending, whatever the database default
+	order_by = ", ".join(
+		f"{column} IS NULL {'ASC' if descending else 'DESC'}, {column} {'DESC' if descending else 'ASC'}"
+		for column, descending in columns
+	)
+	source = quote_identifier('_jmit_page', db_type)
+	page_query = (
+		f"SELECT * FROM ({query.strip().rstrip(';')}) AS {source}{where} "
+		f"ORDER BY {order_by} LIMIT {int(page_size) + 1}"
+	)
+	return page_query, tuple(params)
+
+def _equal_condition(column, value):
+	"""Condition matching rows whose key equals the last value"""
+	return f"{column} IS NULL" if value is None else f"{column} = %s"
+
+def _after_condition(column, descending, value):
+	"""Condition matching rows whose key sorts after the last value"""
+	if value is None:
+		# NULLs are first ascending, so everything else follows; last descending
+		return "1 = 0" if descending else f"{column} IS NOT NULL"
+	if descending:
+		return f"({column} < %s OR {column} IS NULL)"
+	return f"{column} > %s"
+
+def get_page_signature(query, values, sort_keys):
+	"""
+	Fingerprint of a query, its filter values and sort keys
+	Tokens cannot be reused on another query or with other filter values.
+	"""
+	payload = json.dumps([normalize_query(query), list(values or ()), sort_keys], default=str)
+	return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+def encode_page_token(last_values, signature):
+	"""Encode the sort key values of the last row of a page"""
+	payload = json.dumps({'s': signature, 'v': last_values}, default=str)
+	return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_page_token(page_token, signature):
+	"""Decode a page token created for the same query and sort keys"""
+	try:
+		payload = json.loads(base64.urlsafe_b64decode(page_token.encode()).decode())
+	except ValueError:
+		frappe.throw("Invalid page token")
+
+	if payload.get('s') != signature:
+		frappe.throw("Page token does not belong to this query")
+	return payload.get('v')
@@ -0,0 +1,165 @@
+"""
+Report Plans - Compiled, cached execution plans of saved JMIT Reports
+"""
+import frappe
+import json
+from collections import namedtuple
+from jmit_report_builder.api.filters import StatementCache
+from jmit_report_builder.api.snapshot import get_snapshot_query, get_snapshot_filters
+from jmit_report_builder.api.governor import LIMIT_FIELDS
+
+DEFAULT_PLAN_CACHE_SIZE = 256
+
+# The JMIT Report fields that decide whether a cached plan is still valid.
+# Snapshot refreshes do not touch modified, so the snapshot table is checked too.
+PLAN_VERSION_FIELDS = ('modified', 'snapshot_table')
+
+FilterSlot = namedtuple('FilterSlot', ('field', 'operator', 'value', 'prompt', 'mandatory'))
+
+_plans = None
+
+class ReportPlan:
+	"""
+	Everything a run of a saved report needs that does not depend on its filter values
+	Built once per report version from the JMIT Report document and its child
+	tables; bind() only resolves prompt values into a query config. Plans are
+	shared between threads and must not be modified.
+	"""
+	__slots__ = (
+		'report_name', 'version', 'query', 'query_type', 'snapshot', 'filter_slots',
+		'grouping_fields', 'subtotal_fields', 'presorted', 'columns', 'cache_ttl', 'limits',
+		'max_replica_lag'
+	)
+
+	def __init__(self, report):
+		snapshot_query = get_snapshot_query(report)
+
+		self.report_name = report.name
+		self.version = get_plan_version(report)
+		# Materialized reports read their snapshot once it has been built
+		self.query = snapshot_query or report.report_query
+		self.query_type = 'SQL' if snapshot_query else (report.query_type or 'SQL')
+		self.snapshot = bool(snapshot_query)
+		self.filter_slots = tuple(
+			FilterSlot(
+				flt.field_name,
+				flt.operator or '=',
+				flt.filter_value,
+				flt.filter_type != 'Static',
+				bool(flt.mandatory)
+			)
+			for flt in report.filters
+		)
+		self.grouping_fields = tuple(grp.field_name for grp in report.grouping_fields)
+		self.subtotal_fields = tuple(parse_subtotal_config(report.subtotal_config))
+		self.presorted = bool(report.get('presorted'))
+		self.columns = tuple(
+			{
+				'field_name': col.field_name,
+				'display_label': col.display_label,
+				'field_type': col.field_type,
+				'width': col.width,
+				'format': col.format,
+				'visible': col.visible
+			}
+			for col in report.columns
+		)
+		self.cache_ttl = report.cache_ttl or 0
+		self.limits = tuple((field, int(report.get(field) or 0)) for field in LIMIT_FIELDS)
+		# 0 leaves the lag tolerance to the site default
+		self.max_replica_lag = report.get('max_replica_lag') or None
+
+	def bind(self, filters=None):
+		"""
+		Return the execute_query config of a run with the given filter values
+		filters: {field_name: value} for User Prompt and Report Parameter filters,
+		or a list of extra {'field', 'operator', 'value'} filters
+		"""
+		filters = json.loads(filters) if isinstance(filters, str) else (filters or {})
+		report_filters = self.bind_filters(filters if isinstance(filters, dict) else {})
+
+		if isinstance(filters, list):
+			report_filters.extend(filters)
+		if self.snapshot:
+			report_filters = get_snapshot_filters(report_filters)
+
+		return {
+			'report_name': self.report_name,
+			'query': self.query,
+			'query_type': self.query_type,
+			'grouping_fields': list(self.grouping_fields),
+			'subtotal_fields': [dict(entry) for entry in self.subtotal_fields],
+			'filters': report_filters,
+			'presorted': self.presorted,
+			'columns': [dict(col) for col in self.columns],
+			'cache_ttl': self.cache_ttl,
+			'limits': dict(self.limits),
+			'max_replica_lag': self.max_replica_lag
+		}
+
+	def bind_filters(self, prompt_values):
+		"""Resolve the filter slots against prompt values, skipping empty optional filters"""
+		report_filters = []
+		for slot in self.filter_slots:
+			value = prompt_values.get(slot.field, slot.value) if slot.prompt else slot.value
+
+			if value in (None, ''):
+				if slot.mandatory:
+					frappe.throw(f"Filter '{slot.field}' is mandatory")
+				continue
+
+			report_filters.append({
+				'field': slot.field,
+				'operator': slot.operator,
+				'value': value
+			})
+		return report_filters
+
+def get_report_plan(report_name):
+	"""
+	Return the compiled plan of a saved report
+	Plans are cached per process by report name and version; checking the
+	version is a single primary key lookup, so a hot report skips loading
+	the document and its child tables.
+	site_config.json:
+		"jmit_report_plan_cache_size": 256
+	"""
+	version = frappe.db.get_value('JMIT Report', report_name, PLAN_VERSION_FIELDS, as_dict=True)
+	if not version:
+		frappe.throw(f"JMIT Report {report_name} not found", frappe.DoesNotExistError)
+
+	key = (getattr(frappe.local, 'site', None), report_name, get_plan_version(version))
+	plans = get_plan_cache()
+	plan = plans.get(key)
+	if plan is None:
+		plan = ReportPlan(frappe.get_doc('JMIT Report', report_name))
+		# The document may have been saved between the two reads
+		key = key[:2] + (plan.version,)
+		plans.set(key, plan)
+	return plan
+
+def get_plan_version(report):
+	"""Return the values of PLAN_VERSION_FIELDS of a report document or row"""
+	return tuple(str(report.get(field) or '') for field in PLAN_VERSION_FIELDS)
+
+def get_plan_cache():
+	global _plans
+	if _plans is None:
+		conf = frappe.conf or {}
+		_plans = StatementCache(int(conf.get('jmit_report_plan_cache_size') or DEFAULT_PLAN_CACHE_SIZE))
+	return _plans
+
+def parse_subtotal_config(subtotal_config):
+	"""
+	Parse the subtotal_config JSON of a JMIT Report
+	"""
+	if not subtotal_config:
+		return []
+	if isinstance(subtotal_config, list):
+		return subtotal_config
+
+	try:
+		return json.loads(subtotal_config)
+	except ValueError:
+		frappe.logger().error(f"Invalid subtotal configuration: {subtotal_config}")
+		return []
@@ -0,0 +1,107 @@
+"""
+Stored Procedures - Parameterized calls streamed across all result sets
+"""
+import frappe
+import re
+from jmit_report_builder.api.rows import record_class, get_result_fields
+from jmit_report_builder.api.governor import govern_batches, is_stopped
+
+# Rows fetched per round trip from a procedure's result sets
+DEFAULT_PROCEDURE_BATCH_SIZE = 1000
+
+PROCEDURE_PATTERN = re.compile(
+	r'^\s*(?:CALL\s+)?((?:`[^`]+`|[A-Za-z_][A-Za-z0-9_$]*)(?:\.(?:`[^`]+`|[A-Za-z_][A-Za-z0-9_$]*))?)'
+	r'\s*(?:\((.*)\))?\s*;?\s*$',
+	re.IGNORECASE | re.DOTALL
+)
+NAMED_PLACEHOLDER_PATTERN = re.compile(r'%\((\w+)\)s')
+
+def build_procedure_call(query, filters=None):
+	"""
+	Return (sql, values) of a CALL with the filter values bound as arguments
+	query is a procedure name or a CALL statement:
+		get_sales                                 one argument per filter, in filter order
+		CALL get_sales(%s, %s)                    filter values in filter order
+		CALL get_sales(%(from_date)s, %(to)s)     filter values by field name
+		CALL get_sales('2024-01-01', 10)          fixed arguments, no filters
+	"""
+	match = PROCEDURE_PATTERN.match(query or '')
+	if not match:
+		frappe.throw(f"Invalid stored procedure call: {query}")
+
+	name, arguments = match.group(1), (match.group(2) or '').strip()
+	filters = [f for f in (filters or []) if f.get('field')]
+
+	names = NAMED_PLACEHOLDER_PATTERN.findall(arguments)
+	if names:
+		values = {name: None for name in names}
+		values.update((f['field'], get_argument_value(f)) for f in filters)
+		return f"CALL {name}({arguments})", values
+
+	if not arguments:
+		arguments = ', '.join(['%s'] * len(filters))
+	elif '%s' not in arguments:
+		if filters:
+			frappe.throw("The procedure call has fixed arguments; add %s placeholders to bind filters")
+		return f"CALL {name}({arguments})", ()
+
+	values = tuple(get_argument_value(f) for f in filters)
+	if arguments.count('%s') != len(values):
+		frappe.throw(f"The procedure call takes {arguments.count('%s')} arguments but {len(values)} filters were given")
+	return f"CALL {name}({arguments})", values
+
+def get_argument_value(flt):
+	"""Procedure arguments are scalars, so IN lists are passed comma-separated"""
+	value = flt.get('value')
+	if isinstance(value, (list, tuple)):
+		return ','.join(str(v) for v in value)
+	return value
+
+def iter_procedure_result_sets(query, filters=None, batch_size=DEFAULT_PROCEDURE_BATCH_SIZE):
+	"""
+	Call a stored procedure on an unbuffered cursor and yield each result set
+	Every result set is yielded as an iterator of row batches and must be read
+	before the next one; rows left unread are skipped when the generator
+	advances. The connection cannot run other queries until the generator is
+	exhausted or closed.
+	"""
+	if getattr(frappe.db, 'db_type', 'mariadb') == 'postgres':
+		frappe.throw("Stored procedures returning result sets are only supported on MariaDB")
+
+	sql, values = build_procedure_call(query, filters)
+	cursor = get_unbuffered_cursor()
+	try:
+		cursor.execute(sql, values or None)
+		while True:
+			# The status packet that ends a CALL comes as a set without columns
+			if cursor.description:
+				batches = iter_cursor_batches(cursor, batch_size)
+				yield govern_batches(batches)
+				for _ in batches:
+					pass
+			# Closing the cursor skips the result sets after a reached limit
+			if is_stopped() or not cursor.nextset():
+				break
+	finally:
+		cursor.close()
+
+def iter_cursor_batches(cursor, batch_size=DEFAULT_PROCEDURE_BATCH_SIZE):
+	"""Yield the rows of the current result set of a cursor as batches of records"""
+	cls = record_class(get_result_fields(cursor))
+	while True:
+		rows = cursor.fetchmany(batch_size)
+		if not rows:
+			return
+		yield [cls(row) for row in rows]
+
+def get_unbuffered_cursor():
+	"""
+	Open a server-side cursor on the site's connection
+	frappe.db.sql only returns the first result set, so procedures use the
+	driver cursor directly.
+	"""
+	from pymysql.cursors import SSCursor
+
+	if not getattr(frappe.db, '_conn', None):
+		frappe.db.connect()
+	return frappe.db._conn.cursor(SSCursor)
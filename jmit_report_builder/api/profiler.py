@@ -0,0 +1,235 @@
+"""
+Execution Profiler - Per-stage timing of report executions and exports
+"""
+import frappe
+from frappe.decorators import whitelist
+from frappe.utils import add_days, now_datetime
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_active_profile = ContextVar('jmit_report_profile', default=None)
+
+# Roles whose requested profiles trace memory when the site does not always trace it
+DEFAULT_MEMORY_PROFILE_ROLES = ('System Manager',)
+
+# Profiles tracing memory in this process; the tracer stops with the last one
+_memory_tracers = 0
+_memory_tracer_owned = False
+_memory_tracer_lock = threading.Lock()
+
+class ExecutionProfile:
+	"""
+	Wall time, CPU time, rows and bytes of each stage of one execution
+	Peak memory is traced with tracemalloc when track_memory is set. The tracer
+	is process-wide and shared by overlapping profiles, so with concurrent
+	requests in the same worker the peak is an upper bound.
+	"""
+	def __init__(self, report_name=None, source='execute', track_memory=False):
+		self.report_name = report_name
+		self.source = source
+		self.stages = []
+		self.cache_hit = False
+		self.error = None
+		self.track_memory = track_memory
+		self.memory_baseline = 0
+		self.peak_memory = None
+
+		if track_memory:
+			self.memory_baseline = start_memory_tracing()
+
+		self.wall_start = time.perf_counter()
+		self.cpu_start = time.process_time()
+		self.wall_time = None
+		self.cpu_time = None
+
+	@contextmanager
+	def stage(self, name, **counters):
+		record = {'stage': name}
+		record.update(counters)
+		wall_start = time.perf_counter()
+		cpu_start = time.process_time()
+		try:
+			yield record
+		finally:
+			record['wall_ms'] = round((time.perf_counter() - wall_start) * 1000, 3)
+			record['cpu_ms'] = round((time.process_time() - cpu_start) * 1000, 3)
+			self.stages.append(record)
+
+	def stop(self):
+		if self.wall_time is not None:
+			return
+		self.wall_time = round((time.perf_counter() - self.wall_start) * 1000, 3)
+		self.cpu_time = round((time.process_time() - self.cpu_start) * 1000, 3)
+		if self.track_memory:
+			self.peak_memory = max(stop_memory_tracing() - self.memory_baseline, 0)
+
+	@property
+	def rows(self):
+		"""Rows produced by the last stage that reported any"""
+		for record in reversed(self.stages):
+			if record.get('rows_out') is not None:
+				return record['rows_out']
+		return 0
+
+	@property
+	def bytes_serialized(self):
+		return sum(record.get('bytes') or 0 for record in self.stages)
+
+	def as_dict(self):
+		self.stop()
+		return {
+			'report_name': self.report_name,
+			'source': self.source,
+			'wall_ms': self.wall_time,
+			'cpu_ms': self.cpu_time,
+			'rows': self.rows,
+			'bytes_serialized': self.bytes_serialized,
+			'peak_memory_bytes': self.peak_memory,
+			'cache_hit': self.cache_hit,
+			'stages': self.stages
+		}
+
+def start_memory_tracing():
+	"""
+	Join the process-wide memory tracer, starting it for the first profile
+	The peak is only reset when the tracer starts, so overlapping profiles
+	never reset each other's peak. Returns the traced memory at this point.
+	"""
+	global _memory_tracers, _memory_tracer_owned
+	with _memory_tracer_lock:
+		if not _memory_tracers and not tracemalloc.is_tracing():
+			tracemalloc.start()
+			_memory_tracer_owned = True
+		_memory_tracers += 1
+		return tracemalloc.get_traced_memory()[0]
+
+def stop_memory_tracing():
+	"""
+	Leave the memory tracer, stopping it with the last profile if it was
+	started here. Returns the peak traced memory.
+	"""
+	global _memory_tracers, _memory_tracer_owned
+	with _memory_tracer_lock:
+		peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+		_memory_tracers = max(_memory_tracers - 1, 0)
+		if not _memory_tracers and _memory_tracer_owned:
+			tracemalloc.stop()
+			_memory_tracer_owned = False
+		return peak
+
+def get_active_profile():
+	"""Return the profile of the current execution, or None"""
+	return _active_profile.get()
+
+@contextmanager
+def profile_stage(name, **counters):
+	"""
+	Time a stage of the current execution
+	Yields a dict for rows_in, rows_out and bytes; without an active profile
+	nothing is recorded.
+	"""
+	profile = _active_profile.get()
+	if profile is None:
+		yield {}
+		return
+	with profile.stage(name, **counters) as record:
+		yield record
+
+@contextmanager
+def profiled(report_name=None, source='execute', return_profile=False):
+	"""
+	Profile an execution when its profile is requested or the execution log is on
+	Yields the ExecutionProfile, or None when profiling is off. The profile is
+	written to the execution log when it is enabled.
+	Memory is traced for every profile when the site enables it, and otherwise
+	only for profiles requested by a user with a memory profiling role.
+	site_config.json:
+		"jmit_report_execution_log": 1
+		"jmit_report_profile_memory": 0
+		"jmit_report_profile_memory_roles": ["System Manager"]
+	"""
+	log_enabled = is_execution_log_enabled()
+	if not return_profile and not log_enabled:
+		yield None
+		return
+
+	conf = frappe.conf or {}
+	track_memory = bool(conf.get('jmit_report_profile_memory')) or (return_profile and can_profile_memory())
+	profile = ExecutionProfile(report_name, source, track_memory)
+	token = _active_profile.set(profile)
+	try:
+		yield profile
+	except Exception as e:
+		profile.error = str(e)
+		raise
+	finally:
+		_active_profile.reset(token)
+		profile.stop()
+		if log_enabled:
+			log_execution(profile)
+
+def can_profile_memory():
+	"""Check whether the current user's requested profiles trace memory"""
+	conf = frappe.conf or {}
+	roles = conf.get('jmit_report_profile_memory_roles') or DEFAULT_MEMORY_PROFILE_ROLES
+	return bool(set(roles) & set(frappe.get_roles()))
+
+def is_execution_log_enabled():
+	conf = frappe.conf or {}
+	return bool(int(conf.get('jmit_report_execution_log', 1) or 0))
+
+def log_execution(profile):
+	"""
+	Queue an execution log entry; entries are inserted in bulk by the scheduler
+	"""
+	try:
+		from frappe.deferred_insert import deferred_insert
+
+		deferred_insert('JMIT Report Execution Log', [{
+			'report_name': profile.report_name,
+			'source': profile.source,
+			'user': frappe.session.user,
+			'success': int(profile.error is None),
+			'cache_hit': int(profile.cache_hit),
+			'wall_time': profile.wall_time,
+			'cpu_time': profile.cpu_time,
+			'rows': profile.rows,
+			'bytes_serialized': profile.bytes_serialized,
+			'peak_memory': profile.peak_memory,
+			'stages': json.dumps(profile.stages),
+			'error': profile.error
+		}])
+	except Exception as e:
+		frappe.logger().error(f"Execution log error: {str(e)}")
+
+@whitelist()
+def get_slowest_reports(days=7, limit=20):
+	"""
+	Aggregate the execution log into the slowest reports of the last days
+	"""
+	rows = frappe.db.sql("""
+		SELECT
+			report_name,
+			source,
+			COUNT(*) AS executions,
+			AVG(wall_time) AS avg_wall_ms,
+			MAX(wall_time) AS max_wall_ms,
+			AVG(cpu_time) AS avg_cpu_ms,
+			MAX(`rows`) AS max_rows,
+			MAX(peak_memory) AS max_peak_memory,
+			SUM(cache_hit) AS cache_hits,
+			SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) AS failures
+		FROM `tabJMIT Report Execution Log`
+		WHERE creation >= %s
+		GROUP BY report_name, source
+		ORDER BY avg_wall_ms DESC
+		LIMIT %s
+	""", (add_days(now_datetime(), -int(days)), int(limit)), as_dict=True)
+	return {
+		'success': True,
+		'data': rows
+	}
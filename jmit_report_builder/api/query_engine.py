@@ -4,6 +4,28 @@ Query Execution Engine - Executes SQL, stored procedures, and views
 import frappe
 from frappe.decorators import whitelist
 import json
+from itertools import chain, islice
+from jmit_report_builder.api.cache import (
+	make_cache_key, get_cached_result, set_cached_result, get_report_cache_ttl
+)
+from jmit_report_builder.api.filters import compile_query
+from jmit_report_builder.api.profiler import profiled, profile_stage
+from jmit_report_builder.api.columnar import is_available as columnar_available, apply_grouping_columnar
+from jmit_report_builder.api.schema import get_schema_catalog, DEFAULT_SEARCH_LIMIT
+from jmit_report_builder.api.plan import get_report_plan
+from jmit_report_builder.api.procedures import iter_procedure_result_sets
+from jmit_report_builder.api.rows import (
+	fetch_records, iter_record_batches, format_result, get_key_getter, get_field_getter, is_record
+)
+from jmit_report_builder.api.wire import negotiate_wire_format, is_binary, encode_result, make_response
+from jmit_report_builder.api.governor import governed, govern_query, govern_rows, govern_batches, needs_streaming
+from jmit_report_builder.api.routing import read_replica
+from jmit_report_builder.api.grouping import (
+	iter_sorted_groups, build_rollup_query, map_rollup_rows
+)
+
+# Rows fetched per round trip when a query runs in streaming mode
+DEFAULT_BATCH_SIZE = 1000
 
 @whitelist()
 def execute_query(query_config):
@@ -14,97 +36,384 @@ def execute_query(query_config):
 		'query_type': 'SQL|STORED_PROCEDURE|VIEW',
 		'grouping_fields': ['field1', 'field2'],
 		'subtotal_fields': [{'field': 'amount', 'operation': 'SUM'}],
-		'filters': [{'field': 'date', 'operator': '=', 'value': '2024-01-01'}]
+		'filters': [{'field': 'date', 'operator': '=', 'value': '2024-01-01'}],
+		'stream': False,
+		'batch_size': 1000,
+		'presorted': False,
+		'summary_only': False,
+		'report_name': None,
+		'cache_ttl': 0,
+		'aggregation_backend': 'python',
+		'profile': False,
+		'row_format': 'dict',
+		'encoding': 'json',
+		'compression': None,
+		'limits': {'max_execution_time': 0, 'max_rows': 0, 'max_memory_mb': 0},
+		'job_id': None,
+		'max_replica_lag': None
 	}
+	With 'stream' set, rows are read from an unbuffered server-side cursor in
+	batches of 'batch_size' instead of being buffered by the driver first.
+	With 'presorted' set, groups are built in a single pass as they close;
+	the query must then order rows by the grouping fields with values that
+	compare equal in Python, as a case-insensitive collation can place 'ACME'
+	and 'acme' side by side. 'summary_only' skips the
+	detail rows and lets the database compute the subtotals with ROLLUP.
+	Results are cached for 'cache_ttl' seconds, or for the Cache TTL of the
+	JMIT Report named by 'report_name'.
+	'aggregation_backend': 'columnar' computes unsorted groups and subtotals
+	with NumPy when it is installed; the output is the same as the default up
+	to floating-point rounding of the subtotals.
+	'profile' adds a '_profile' key with the wall and CPU time, rows and bytes
+	of each stage and the peak memory of the execution.
+	Rows are kept as tuple records internally; 'row_format': 'compact' returns
+	them as value lists with a 'columns' list instead of one dict per row, and
+	'columnar' as one value list per column with group rows in 'markers'.
+	'encoding' (msgpack, arrow) and 'compression' (gzip, zstd) return the
+	result as an encoded HTTP response body instead of a JSON message.
+	Executions are bounded by the site, role and report limits; 'limits' can
+	only lower them. An execution stopped by a limit returns the rows read so
+	far with 'partial': True and a 'limit' entry. With a 'job_id' it can be
+	interrupted with governor.cancel_query.
+	Queries run on a read replica when one is configured and at most
+	'max_replica_lag' seconds (by default the site tolerance) behind.
 	"""
 	try:
 		config = json.loads(query_config) if isinstance(query_config, str) else query_config
 		
-		query = config.get('query', '')
-		query_type = config.get('query_type', 'SQL')
-		grouping_fields = config.get('grouping_fields', [])
-		subtotal_fields = config.get('subtotal_fields', [])
-		filters = config.get('filters', [])
-		
-		# Apply filters
-		query = apply_filters(query, filters)
-		
-		# Execute query based on type
-		if query_type == 'SQL':
-			results = frappe.db.sql(query, as_dict=True)
-		elif query_type == 'STORED_PROCEDURE':
-			results = execute_stored_procedure(query, filters)
-		elif query_type == 'VIEW':
-			results = frappe.db.sql(f"SELECT * FROM {query}", as_dict=True)
-		else:
-			results = []
-		
-		# Apply grouping and subtotals
-		if grouping_fields:
-			results = apply_grouping_and_subtotals(results, grouping_fields, subtotal_fields)
+		wire = negotiate_wire_format(config)
 		
+		with profiled(config.get('report_name'), 'execute', bool(config.get('profile'))) as profile:
+			ttl = int(config.get('cache_ttl') or get_report_cache_ttl(config.get('report_name')))
+			cache_key = make_cache_key(config) if ttl else None
+			result = None
+			if cache_key:
+				with profile_stage('cache_lookup'):
+					result = get_cached_result(cache_key)
+				if result is not None and profile:
+					profile.cache_hit = True
+			
+			if result is None:
+				with read_replica(config.get('max_replica_lag')):
+					result = run_governed(config)
+				# Partial results depend on timing, so they are never cached
+				if cache_key and not result.get('partial'):
+					set_cached_result(cache_key, result, ttl)
+			
+			result = format_result(result, wire.row_format)
+			if is_binary(wire):
+				with profile_stage('serialize') as stage:
+					body = encode_result(result, wire)
+					stage['bytes'] = len(body)
+				return make_response(body, wire)
+			if profile and config.get('profile'):
+				with profile_stage('serialize') as stage:
+					stage['bytes'] = len(frappe.as_json(result))
+				result = dict(result, _profile=profile.as_dict())
+			return result
+	except Exception as e:
+		frappe.logger().error(f"Query execution error: {str(e)}")
 		return {
-			'success': True,
-			'data': results,
-			'count': len(results) if results else 0
+			'success': False,
+			'message': str(e)
 		}
+
+@whitelist()
+def run_report(report_name, filters=None, row_format=None, encoding=None, compression=None):
+	"""
+	Execute a saved JMIT Report
+	filters: {field_name: value} for User Prompt and Report Parameter filters,
+	or a list of extra {'field', 'operator', 'value'} filters
+	row_format, encoding and compression shape the response as in execute_query
+	"""
+	try:
+		config = get_report_config(report_name, filters)
+		config.update(row_format=row_format, encoding=encoding, compression=compression)
 	except Exception as e:
-		frappe.logger().error(f"Query execution error: {str(e)}")
 		return {
 			'success': False,
 			'message': str(e)
 		}
+	
+	return execute_query(config)
 
-def apply_filters(query, filters):
+def get_report_config(report_name, filters=None):
 	"""
-	Apply WHERE filters to the query
+	Build an execute_query config from a saved JMIT Report
+	The report is compiled once per version into a cached plan, so a run only
+	binds its filter values.
+	"""
+	return get_report_plan(report_name).bind(filters)
+
+def run_governed(config):
 	"""
-	if not filters:
-		return query
+	Run a query config under its limits
+	A statement interrupted by the database timeout or a cancellation ends the
+	execution as a partial result instead of an error, with the rows that were
+	read in batches before the interruption.
+	"""
+	with governed(config, job_id=config.get('job_id'), keep_batches=True) as governor:
+		try:
+			result = run_query_config(config)
+		except Exception as e:
+			if not governor.interrupted(e):
+				raise
+			result = get_interrupted_result(config, governor.kept_streams)
+		return governor.finish(result)
+
+def get_interrupted_result(config, streams):
+	"""
+	Build the result of an interrupted execution from the batches already read
+	streams holds the batches of each statement or procedure result set. The
+	rows are grouped as a complete run would group them.
+	"""
+	grouping_fields = config.get('grouping_fields') or []
+	presorted = bool(config.get('presorted'))
+	result_sets = []
+	for batches in streams or []:
+		rows = list(iter_records(batches))
+		if grouping_fields and has_fields(rows, grouping_fields):
+			rows = group_records(
+				rows, grouping_fields, config.get('subtotal_fields') or [], presorted, config.get('aggregation_backend')
+			)
+		result_sets.append(rows)
+
+	data = result_sets[0] if result_sets else []
+	result = {
+		'success': True,
+		'data': data,
+		'count': len(data)
+	}
+	if len(result_sets) > 1:
+		result['result_sets'] = [{'data': rows, 'count': len(rows)} for rows in result_sets[1:]]
+	return result
+
+def run_query_config(config):
+	"""
+	Execute a parsed query config without caching or error handling
+	"""
+	query = config.get('query', '')
+	query_type = config.get('query_type', 'SQL')
+	grouping_fields = config.get('grouping_fields', [])
+	subtotal_fields = config.get('subtotal_fields', [])
+	filters = config.get('filters', [])
+	presorted = bool(config.get('presorted'))
+	scope = config.get('report_name')
 	
-	where_conditions = []
-	for f in filters:
-		field = f.get('field', '')
-		operator = f.get('operator', '=')
-		value = f.get('value', '')
-		
-		if operator == '=':
-			where_conditions.append(f"{field} = '{value}'")
-		elif operator == '!=':
-			where_conditions.append(f"{field} != '{value}'")
-		elif operator == '>':
-			where_conditions.append(f"{field} > {value}")
-		elif operator == '<':
-			where_conditions.append(f"{field} < {value}")
-		elif operator == 'LIKE':
-			where_conditions.append(f"{field} LIKE '%{value}%'")
-		elif operator == 'IN':
-			values = "', '".join(value.split(','))
-			where_conditions.append(f"{field} IN ('{values}')")
-	
-	if where_conditions:
-		where_clause = " AND ".join(where_conditions)
-		if "WHERE" in query.upper():
-			query = query.replace(" WHERE", f" WHERE {where_clause} AND")
-		else:
-			query += f" WHERE {where_clause}"
+	if config.get('summary_only') and grouping_fields and query_type in ('SQL', 'VIEW'):
+		query, values = apply_filters(get_select_query(query, query_type), filters, scope)
+		with profile_stage('rollup') as stage:
+			results = execute_rollup(query, values, grouping_fields, subtotal_fields)
+			stage['rows_out'] = len(results)
+		return {
+			'success': True,
+			'data': results,
+			'count': len(results)
+		}
+	
+	# Stored procedures always read from an unbuffered cursor
+	if config.get('stream') and query_type != 'STORED_PROCEDURE':
+		# Fetching and grouping interleave, so they are timed as one stage
+		with profile_stage('stream') as stage:
+			results = list(iter_records(iter_config_batches(config)))
+			stage['rows_out'] = len(results)
+		return {
+			'success': True,
+			'data': results,
+			'count': len(results)
+		}
+	
+	# Execute query based on type
+	if query_type in ('SQL', 'VIEW'):
+		query, values = apply_filters(get_select_query(query, query_type), filters, scope)
+		with profile_stage('query') as stage:
+			if needs_streaming():
+				# Buffered rows could only be measured once all of them were fetched
+				results = list(iter_records(iter_statement_batches(query, values)))
+			else:
+				results = govern_rows(fetch_records(govern_query(query), values))
+			stage['rows_out'] = len(results)
+	elif query_type == 'STORED_PROCEDURE':
+		with profile_stage('query') as stage:
+			result_sets = execute_stored_procedure(query, filters, config.get('batch_size'))
+			results = result_sets[0] if result_sets else []
+			stage['rows_out'] = sum(len(rows) for rows in result_sets)
+	else:
+		results = []
+	
+	# Apply grouping and subtotals
+	if grouping_fields:
+		with profile_stage('grouping', rows_in=len(results)) as stage:
+			results = group_records(
+				results, grouping_fields, subtotal_fields, presorted, config.get('aggregation_backend')
+			)
+			stage['rows_out'] = len(results)
+	
+	response = {
+		'success': True,
+		'data': results,
+		'count': len(results) if results else 0
+	}
+	
+	# Result sets after the first have their own columns and are returned apart
+	if query_type == 'STORED_PROCEDURE' and len(result_sets) > 1:
+		response['result_sets'] = []
+		for rows in result_sets[1:]:
+			if grouping_fields and has_fields(rows, grouping_fields):
+				rows = group_records(rows, grouping_fields, subtotal_fields, presorted, config.get('aggregation_backend'))
+			response['result_sets'].append({'data': rows, 'count': len(rows)})
+	
+	return response
+
+def iter_config_batches(config, batch_size=None):
+	"""
+	Stream the rows of a query config in batches, grouped when configured
+	Grouping of pre-sorted results stays streaming; unsorted results have to be
+	held in full before their groups are known. The result sets of a stored
+	procedure follow each other, each grouped on its own when it has the
+	grouping fields, and a batch never spans two result sets.
+	"""
+	batch_size = int(batch_size or config.get('batch_size') or DEFAULT_BATCH_SIZE)
+	
+	if config.get('query_type') == 'STORED_PROCEDURE':
+		return chain.from_iterable(
+			group_result_set_batches(batches, config, batch_size)
+			for batches in iter_procedure_result_sets(config.get('query', ''), config.get('filters', []), batch_size)
+		)
+	
+	batches = iter_query_batches(
+		config.get('query', ''),
+		config.get('query_type', 'SQL'),
+		config.get('filters', []),
+		batch_size,
+		config.get('report_name')
+	)
+	return group_batches(batches, config, batch_size)
+
+def group_result_set_batches(batches, config, batch_size):
+	"""Group the batches of one procedure result set if it has the grouping fields"""
+	batches = iter(batches)
+	first = next(batches, None)
+	if first is None:
+		return iter(())
+	batches = chain([first], batches)
+	if not has_fields(first, config.get('grouping_fields')):
+		return batches
+	return group_batches(batches, config, batch_size)
+
+def group_batches(batches, config, batch_size):
+	"""
+	Apply the grouping of a query config to a stream of batches
+	"""
+	grouping_fields = config.get('grouping_fields', [])
+	subtotal_fields = config.get('subtotal_fields', [])
+	if not grouping_fields:
+		return batches
 	
+	records = iter_records(batches)
+	if config.get('presorted'):
+		grouped = iter_sorted_groups(records, grouping_fields, subtotal_fields)
+	else:
+		grouped = group_records(records, grouping_fields, subtotal_fields, backend=config.get('aggregation_backend'))
+	return iter_batches(grouped, batch_size)
+
+def get_select_query(query, query_type):
+	"""
+	Return the SELECT statement for a SQL query or a view name
+	"""
+	if query_type == 'VIEW':
+		return f"SELECT * FROM {query}"
 	return query
 
-def execute_stored_procedure(proc_name, params):
+def apply_filters(query, filters, scope=None):
 	"""
-	Execute a stored procedure
+	Apply WHERE filters to the query
+	Returns (query, values): filter values are bound as parameters, and the
+	compiled statement text is cached per scope (usually the report name).
 	"""
-	try:
-		result = frappe.call('frappe.client.sql', query=f"CALL {proc_name}()", as_dict=True)
-		return result
-	except Exception as e:
-		frappe.logger().error(f"Stored procedure error: {str(e)}")
-		return []
+	with profile_stage('filters'):
+		return compile_query(query, filters, scope)
+
+def iter_query_batches(query, query_type='SQL', filters=None, batch_size=DEFAULT_BATCH_SIZE, scope=None):
+	"""
+	Execute a query on an unbuffered server-side cursor and yield lists of rows
+	Only one batch is held in memory at a time. The connection cannot run other
+	queries until the generator is exhausted or closed.
+	"""
+	if query_type == 'STORED_PROCEDURE':
+		for batches in iter_procedure_result_sets(query, filters, batch_size):
+			yield from batches
+		return
+	elif query_type not in ('SQL', 'VIEW'):
+		return
+	
+	query, values = apply_filters(get_select_query(query, query_type), filters, scope)
+	yield from iter_statement_batches(query, values, batch_size)
+
+def iter_statement_batches(query, values=None, batch_size=DEFAULT_BATCH_SIZE):
+	"""
+	Read a filtered statement on an unbuffered cursor within the current limits
+	"""
+	with frappe.db.unbuffered_cursor():
+		yield from govern_batches(iter_record_batches(govern_query(query), values, batch_size))
+
+def iter_batches(rows, batch_size=DEFAULT_BATCH_SIZE):
+	"""
+	Split any iterable of rows into lists of at most batch_size rows
+	"""
+	rows = iter(rows)
+	while True:
+		batch = list(islice(rows, batch_size))
+		if not batch:
+			return
+		yield batch
+
+def iter_records(batches):
+	"""
+	Flatten a stream of batches back into a stream of records
+	"""
+	return chain.from_iterable(batches)
+
+def execute_stored_procedure(proc_name, params, batch_size=None):
+	"""
+	Execute a stored procedure with the filter values bound as its arguments
+	Returns a list with the rows of every result set the procedure returned.
+	"""
+	return [
+		list(iter_records(batches))
+		for batches in iter_procedure_result_sets(proc_name, params, int(batch_size or DEFAULT_BATCH_SIZE))
+	]
+
+def has_fields(rows, fields):
+	"""Check whether the first record of rows has all the given fields"""
+	return bool(rows) and is_record(rows[0]) and all(field in rows[0] for field in fields or [])
+
+def execute_rollup(query, values, grouping_fields, subtotal_fields):
+	"""
+	Compute group subtotals in the database instead of fetching detail rows
+	Returns GROUP_HEADER/SUBTOTAL rows without the detail records.
+	"""
+	db_type = getattr(frappe.db, 'db_type', 'mariadb')
+	rollup_query = build_rollup_query(query, grouping_fields, subtotal_fields, db_type)
+	rows = frappe.db.sql(rollup_query, values or None, as_dict=True)
+	return map_rollup_rows(rows, grouping_fields, subtotal_fields, db_type)
+
+def group_records(records, grouping_fields, subtotal_fields, presorted=False, backend=None):
+	"""
+	Group records, using the single-pass engine when they arrive sorted by the grouping fields
+	Unsorted records use the columnar backend when it is requested and NumPy is
+	installed, and the row-based implementation otherwise.
+	"""
+	if presorted:
+		return list(iter_sorted_groups(records, grouping_fields, subtotal_fields))
+	if backend == 'columnar' and columnar_available():
+		return apply_grouping_columnar(records, grouping_fields, subtotal_fields)
+	return apply_grouping_and_subtotals(records, grouping_fields, subtotal_fields)
 
 def apply_grouping_and_subtotals(data, grouping_fields, subtotal_fields):
 	"""
 	Apply grouping and calculate subtotals
+	data may be a list or any iterable of records, e.g. iter_records(batches)
 	"""
 	if not data or not grouping_fields:
 		return data
@@ -113,10 +422,15 @@ def apply_grouping_and_subtotals(data, grouping_fields, subtotal_fields):
 	
 	grouped_data = defaultdict(list)
 	
-	# Group the data
-	for record in data:
-		key = tuple(record.get(field, '') for field in grouping_fields)
-		grouped_data[key].append(record)
+	rows = iter(data)
+	first = next(rows, None)
+	if first is None:
+		return []
+	
+	# Group the data; tuple records are keyed by position
+	key_of = get_key_getter(first, grouping_fields)
+	for record in chain([first], rows):
+		grouped_data[key_of(record)].append(record)
 	
 	# Build result with grouping headers and subtotals
 	result = []
@@ -142,18 +456,19 @@ def apply_grouping_and_subtotals(data, grouping_fields, subtotal_fields):
 			for subtotal_field in subtotal_fields:
 				field_name = subtotal_field.get('field')
 				operation = subtotal_field.get('operation', 'SUM')
+				value_of = get_field_getter(first, field_name, 0)
 				
 				if operation == 'SUM':
-					subtotal_row[f'{field_name}_subtotal'] = sum(float(r.get(field_name, 0) or 0) for r in records)
+					subtotal_row[f'{field_name}_subtotal'] = sum(float(value_of(r) or 0) for r in records)
 				elif operation == 'AVG':
-					values = [float(r.get(field_name, 0) or 0) for r in records if r.get(field_name)]
+					values = [float(value_of(r) or 0) for r in records if value_of(r)]
 					subtotal_row[f'{field_name}_subtotal'] = sum(values) / len(values) if values else 0
 				elif operation == 'COUNT':
 					subtotal_row[f'{field_name}_subtotal'] = len(records)
 				elif operation == 'MAX':
-					subtotal_row[f'{field_name}_subtotal'] = max([float(r.get(field_name, 0) or 0) for r in records])
+					subtotal_row[f'{field_name}_subtotal'] = max([float(value_of(r) or 0) for r in records])
 				elif operation == 'MIN':
-					subtotal_row[f'{field_name}_subtotal'] = min([float(r.get(field_name, 0) or 0) for r in records])
+					subtotal_row[f'{field_name}_subtotal'] = min([float(value_of(r) or 0) for r in records])
 			
 			result.append(subtotal_row)
 	
@@ -173,7 +488,8 @@ def preview_query(query):
 		if 'LIMIT' not in query.upper():
 			query += ' LIMIT 100'
 		
-		results = frappe.db.sql(query, as_dict=True)
+		with read_replica():
+			results = frappe.db.sql(query, as_dict=True)
 		return {
 			'success': True,
 			'data': results[:10],  # Show first 10 rows
@@ -186,21 +502,18 @@ def preview_query(query):
 		}
 
 @whitelist()
-def get_available_tables():
+def get_available_tables(txt=None, limit=None):
 	"""
 	Get list of available database tables and views
+	Served from the cached schema catalog; with txt the names are ranked by
+	prefix and fuzzy match.
 	"""
 	try:
-		tables = frappe.db.sql("""
-			SELECT TABLE_NAME 
-			FROM information_schema.TABLES 
-			WHERE TABLE_SCHEMA = DATABASE()
-			ORDER BY TABLE_NAME
-		""", as_dict=True)
+		catalog = get_schema_catalog()
 		
 		return {
 			'success': True,
-			'data': [t.get('TABLE_NAME') for t in tables]
+			'data': catalog.search_tables(txt, int(limit or DEFAULT_SEARCH_LIMIT)) if txt else list(catalog.table_names)
 		}
 	except Exception as e:
 		return {
@@ -214,16 +527,9 @@ def get_table_columns(table_name):
 	Get columns and their data types for a specific table
 	"""
 	try:
-		columns = frappe.db.sql(f"""
-			SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE
-			FROM information_schema.COLUMNS
-			WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
-			ORDER BY ORDINAL_POSITION
-		""", (table_name,), as_dict=True)
-		
 		return {
 			'success': True,
-			'data': columns
+			'data': get_schema_catalog().get_columns(table_name)
 		}
 	except Exception as e:
 		return {
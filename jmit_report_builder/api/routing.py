@@ -0,0 +1,210 @@
+"""
+Replica Routing - Sends read-only report queries to read replicas
+"""
+import frappe
+from frappe.decorators import whitelist
+from frappe.utils import cint
+import random
+from contextlib import contextmanager
+
+DEFAULT_MAX_REPLICA_LAG = 30
+DEFAULT_HEALTH_TTL = 10
+
+HEALTH_KEY = "jmit_report_replica_health"
+
+@contextmanager
+def read_replica(max_lag=None):
+	"""
+	Run the body on a read replica that is at most max_lag seconds behind
+	frappe.db is swapped for the replica connection, as frappe.read_only()
+	does, so every query in the body reads from it. Yields the replica name,
+	or None when no replica is configured or fresh enough and the primary is
+	used. The body must not write.
+	site_config.json:
+		"jmit_report_replicas": [{"name": "replica-1", "host": "10.0.0.2", "port": 3306, "weight": 1}]
+		"jmit_report_replica_max_lag": 30
+		"jmit_report_replica_health_ttl": 10
+		"jmit_report_replica_connector": "dotted.path.to.connect"
+	"""
+	# Nested routing keeps the connection already chosen
+	if getattr(frappe.local, 'jmit_report_replica', None) or not get_replicas():
+		yield getattr(frappe.local, 'jmit_report_replica', None)
+		return
+
+	if max_lag is None:
+		max_lag = get_max_replica_lag()
+	name, db = connect_fresh_replica(float(max_lag))
+	if db is None:
+		yield None
+		return
+
+	primary = frappe.local.db
+	frappe.local.db = db
+	frappe.local.jmit_report_replica = name
+	try:
+		yield name
+	finally:
+		frappe.local.db = primary
+		frappe.local.jmit_report_replica = None
+		close_connection(db)
+
+def get_current_replica():
+	"""Return the name of the replica the current queries are routed to, or None"""
+	return getattr(frappe.local, 'jmit_report_replica', None)
+
+def get_replicas():
+	"""Return the configured replicas, each with a name"""
+	replicas = (frappe.conf or {}).get('jmit_report_replicas') or []
+	return [
+		dict(replica, name=replica.get('name') or replica.get('host') or f"replica-{index}")
+		for index, replica in enumerate(replicas)
+	]
+
+def get_max_replica_lag():
+	return float((frappe.conf or {}).get('jmit_report_replica_max_lag') or DEFAULT_MAX_REPLICA_LAG)
+
+def connect_fresh_replica(max_lag):
+	"""
+	Connect to a replica within max_lag seconds of the primary
+	Replicas are tried in a weighted random order to spread the load. The lag
+	of each replica is checked at most once per health TTL and shared by all
+	workers; unreachable replicas are skipped until their next check.
+	Returns (name, connection), or (None, None) to use the primary.
+	"""
+	for replica in order_replicas(get_replicas()):
+		health = frappe.cache().get_value(f"{HEALTH_KEY}:{replica['name']}")
+		if health and not is_acceptable(health, max_lag):
+			continue
+
+		db = None
+		try:
+			db = connect_replica(replica)
+			# Frappe connects lazily; fail over here rather than on the report query
+			if hasattr(db, 'connect') and not getattr(db, '_conn', None):
+				db.connect()
+			if not health:
+				health = store_health(replica['name'], {'healthy': True, 'lag': get_replication_lag(db)})
+		except Exception as e:
+			frappe.logger().error(f"Read replica {replica['name']} is unavailable: {str(e)}")
+			health = store_health(replica['name'], {'healthy': False, 'lag': None, 'error': str(e)})
+
+		if is_acceptable(health, max_lag):
+			return replica['name'], db
+		close_connection(db)
+	return None, None
+
+def order_replicas(replicas):
+	"""Shuffle replicas so each comes first in proportion to its weight"""
+	return sorted(
+		replicas,
+		key=lambda replica: random.random() ** (1.0 / max(float(replica.get('weight') or 1), 0.001)),
+		reverse=True
+	)
+
+def is_acceptable(health, max_lag):
+	return bool(health.get('healthy')) and health.get('lag') is not None and health['lag'] <= max_lag
+
+def store_health(name, health):
+	ttl = int((frappe.conf or {}).get('jmit_report_replica_health_ttl') or DEFAULT_HEALTH_TTL)
+	frappe.cache().set_value(f"{HEALTH_KEY}:{name}", health, expires_in_sec=ttl)
+	return health
+
+def connect_replica(replica):
+	"""
+	Open a connection to a replica
+	A connector set in site_config is called with the replica entry and must
+	return a frappe Database-like object; by default the replica is reached
+	with the site's database credentials.
+	"""
+	conf = frappe.conf or {}
+	connector = conf.get('jmit_report_replica_connector')
+	if connector:
+		return frappe.get_attr(connector)(replica)
+
+	from frappe.database import get_db
+
+	return get_db(
+		host=replica.get('host'),
+		port=replica.get('port'),
+		user=replica.get('user') or conf.get('db_name'),
+		password=replica.get('password') or conf.get('db_password')
+	)
+
+@contextmanager
+def replica_connection(name):
+	"""
+	Open a connection to a named replica outside of query routing, e.g. to kill a query
+	"""
+	replica = next((replica for replica in get_replicas() if replica['name'] == name), None)
+	if replica is None:
+		frappe.throw(f"Unknown read replica: {name}")
+
+	db = connect_replica(replica)
+	try:
+		yield db
+	finally:
+		close_connection(db)
+
+def get_replication_lag(db):
+	"""
+	Return how many seconds a replica is behind its primary
+	A server that is not replicating counts as up to date. Connectors may
+	provide their own get_replication_lag().
+	"""
+	if hasattr(db, 'get_replication_lag'):
+		return db.get_replication_lag()
+
+	if getattr(db, 'db_type', 'mariadb') == 'postgres':
+		lag = db.sql("""
+			SELECT CASE WHEN pg_is_in_recovery()
+				THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+				ELSE 0 END
+		""")[0][0]
+		return float(lag)
+
+	status = db.sql("SHOW SLAVE STATUS", as_dict=True)
+	if not status:
+		return 0.0
+	lag = status[0].get('Seconds_Behind_Master')
+	if lag is None:
+		# Replication is stopped or broken
+		frappe.throw("Replication is not running")
+	return float(lag)
+
+def close_connection(db):
+	if db is None:
+		return
+	try:
+		db.close()
+	except Exception:
+		pass
+
+@whitelist()
+def get_replica_status(refresh=False):
+	"""
+	Return the lag and health of every configured read replica
+	With refresh the lag is checked now instead of read from the shared cache.
+	"""
+	try:
+		frappe.only_for('System Manager')
+		status = []
+		for replica in get_replicas():
+			health = None if cint(refresh) else frappe.cache().get_value(f"{HEALTH_KEY}:{replica['name']}")
+			if not health:
+				try:
+					with replica_connection(replica['name']) as db:
+						health = {'healthy': True, 'lag': get_replication_lag(db)}
+				except Exception as e:
+					health = {'healthy': False, 'lag': None, 'error': str(e)}
+				store_health(replica['name'], health)
+			status.append(dict(health, name=replica['name'], host=replica.get('host'), weight=replica.get('weight') or 1))
+		return {
+			'success': True,
+			'max_lag': get_max_replica_lag(),
+			'replicas': status
+		}
+	except Exception as e:
+		return {
+			'success': False,
+			'message': str(e)
+		}
@@ -0,0 +1,228 @@
+"""
+Compact Rows - Tuple records sharing one column schema per result
+"""
+import frappe
+from itertools import islice
+from operator import itemgetter
+
+# Record classes are cached per column list; ad-hoc queries add new ones
+MAX_RECORD_CLASSES = 1024
+
+ROW_FORMATS = ('dict', 'compact', 'columnar')
+
+_record_classes = {}
+
+class Record(tuple):
+	"""
+	A result row stored as a plain tuple of values
+	Subclasses created by record_class() carry the column names and their
+	positions, so a row costs one tuple instead of one dict per row. Records
+	read like dicts (get, [], in, keys, items) for the grouping, statistics
+	and export code, and convert to dicts with as_dict() at the API boundary.
+	json and msgpack encode a tuple subclass as an array without calling its
+	methods, so a bare record would come out as its keys or its values; results
+	go through format_result() before they are encoded.
+	"""
+	__slots__ = ()
+	_fields = ()
+	_index = {}
+
+	def get(self, key, default=None):
+		index = self._index.get(key)
+		return default if index is None else tuple.__getitem__(self, index)
+
+	def __getitem__(self, key):
+		if isinstance(key, str):
+			return tuple.__getitem__(self, self._index[key])
+		return tuple.__getitem__(self, key)
+
+	def __getattr__(self, key):
+		index = type(self)._index.get(key)
+		if index is None:
+			raise AttributeError(key)
+		return tuple.__getitem__(self, index)
+
+	def __contains__(self, key):
+		return key in self._index
+
+	def __iter__(self):
+		return iter(self._fields)
+
+	def keys(self):
+		return self._fields
+
+	def values(self):
+		return tuple(tuple.__iter__(self))
+
+	def items(self):
+		return zip(self._fields, tuple.__iter__(self))
+
+	def as_dict(self):
+		return dict(zip(self._fields, tuple.__iter__(self)))
+
+	def __reduce__(self):
+		# Record classes are created at runtime, so pickles rebuild them from the fields
+		return (make_record, (self._fields, tuple(tuple.__iter__(self))))
+
+	def __repr__(self):
+		return f"Record({self.as_dict()!r})"
+
+def record_class(fields):
+	"""
+	Return the Record subclass of a column list
+	Duplicate column names resolve to the last one, as they do in dict rows.
+	"""
+	fields = tuple(fields)
+	cls = _record_classes.get(fields)
+	if cls is None:
+		if len(_record_classes) >= MAX_RECORD_CLASSES:
+			_record_classes.clear()
+		cls = _record_classes[fields] = type('Record', (Record,), {
+			'__slots__': (),
+			'_fields': fields,
+			'_index': {field: index for index, field in enumerate(fields)}
+		})
+	return cls
+
+def make_record(fields, values):
+	"""Build one record, e.g. when unpickling"""
+	return record_class(fields)(values)
+
+def to_records(fields, rows):
+	"""Wrap tuples fetched with the given column names as records"""
+	cls = record_class(fields)
+	return [cls(row) for row in rows]
+
+def get_result_fields(cursor=None):
+	"""Return the column names of the last query on a cursor, by default frappe.db's"""
+	cursor = cursor or frappe.db._cursor
+	return tuple(column[0] for column in cursor.description or ())
+
+def fetch_records(query, values=None):
+	"""
+	Run a query and return its rows as records
+	"""
+	rows = frappe.db.sql(query, values or None)
+	return to_records(get_result_fields(), rows)
+
+def iter_record_batches(query, values=None, batch_size=1000):
+	"""
+	Run a query on the current cursor and yield its rows as batches of records
+	Meant for frappe.db.unbuffered_cursor(), where rows arrive as they are read.
+	"""
+	rows = iter(frappe.db.sql(query, values or None, as_iterator=True))
+	cls = record_class(get_result_fields())
+	while True:
+		batch = [cls(row) for row in islice(rows, batch_size)]
+		if not batch:
+			return
+		yield batch
+
+def is_record(value):
+	"""Check whether a value is a row, as a dict or a Record"""
+	return isinstance(value, (dict, Record))
+
+def get_field_getter(sample, field, default=None):
+	"""
+	Return a fast accessor of one field for rows shaped like sample
+	Records get a positional itemgetter instead of a per-row name lookup. The
+	rows it is applied to must share the schema of sample.
+	"""
+	if isinstance(sample, Record):
+		index = sample._index.get(field)
+		if index is None:
+			return lambda row: default
+		return itemgetter(index)
+	return lambda row: row.get(field, default)
+
+def get_key_getter(sample, fields):
+	"""
+	Return an accessor of the tuple of several fields for rows shaped like sample
+	Missing fields read as '', matching the grouping key of dict rows.
+	"""
+	if isinstance(sample, Record) and fields and all(field in sample._index for field in fields):
+		indexes = [sample._index[field] for field in fields]
+		if len(indexes) == 1:
+			index = indexes[0]
+			return lambda row: (tuple.__getitem__(row, index),)
+		return itemgetter(*indexes)
+	return lambda row: tuple(row.get(field, '') for field in fields)
+
+def as_dicts(rows):
+	"""Convert the records of a list of rows to dicts, leaving other rows as they are"""
+	return [row.as_dict() if isinstance(row, Record) else row for row in rows]
+
+def format_rows(rows, row_format='dict'):
+	"""
+	Shape rows for an API response
+	'dict' returns every row as a dict. 'compact' returns (columns, rows)
+	where detail rows are lists of values in column order; GROUP_HEADER and
+	SUBTOTAL rows stay dicts. Returns (columns or None, rows).
+	"""
+	if row_format != 'compact':
+		return None, as_dicts(rows)
+
+	columns = None
+	compact = []
+	for row in rows:
+		if isinstance(row, Record):
+			if columns is None:
+				columns = list(row._fields)
+			compact.append(list(tuple.__iter__(row)))
+		elif isinstance(row, dict) and '_type' not in row:
+			if columns is None:
+				columns = list(row.keys())
+			compact.append([row.get(column) for column in columns])
+		else:
+			compact.append(row)
+	return columns, compact
+
+def format_columnar(rows):
+	"""
+	Split rows into column value lists and an index of group rows
+	Returns (columns, values, markers): values holds one list per column over
+	the detail rows, and markers {'positions': [...], 'rows': [...]} holds the
+	GROUP_HEADER and SUBTOTAL rows with the number of detail rows before each.
+	"""
+	details = []
+	markers = {'positions': [], 'rows': []}
+	for row in rows:
+		if isinstance(row, dict) and '_type' in row:
+			markers['positions'].append(len(details))
+			markers['rows'].append(row)
+		else:
+			details.append(row)
+
+	if not details:
+		return [], [], markers
+
+	sample = details[0]
+	columns = list(sample.keys())
+	if isinstance(sample, Record) and all(type(row) is type(sample) for row in details):
+		# Transposed in C; Record iterates over its keys, so read the raw tuples
+		values = [list(column) for column in zip(*map(tuple.__iter__, details))]
+	else:
+		values = [[row.get(column) for row in details] for column in columns]
+	return columns, values, markers
+
+def format_result(result, row_format='dict'):
+	"""
+	Return a copy of a run result with its data shaped for the API response
+	The cached result keeps its records, so each response formats its own copy.
+	'columnar' replaces data with columns, values and markers.
+	"""
+	if not isinstance(result, dict) or 'data' not in result:
+		return result
+	if row_format and row_format not in ROW_FORMATS:
+		frappe.throw(f"Unsupported row format: {row_format}")
+
+	result = dict(result)
+	if row_format == 'columnar':
+		result['columns'], result['values'], result['markers'] = format_columnar(result.pop('data') or [])
+	else:
+		columns, result['data'] = format_rows(result.get('data') or [], row_format)
+		if row_format == 'compact':
+			result['columns'] = columns
+	if result.get('result_sets'):
+		result['result_sets'] = [format_result(result_set, row_format) for result_set in result['result_sets']]
+	return result
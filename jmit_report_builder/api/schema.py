@@ -0,0 +1,213 @@
+"""
+Schema Catalog - Cached table and column metadata for the report designer
+"""
+import frappe
+from frappe.decorators import whitelist
+import threading
+import time
+from itertools import islice
+from jmit_report_builder.api.routing import read_replica
+
+DEFAULT_SCHEMA_CACHE_TTL = 3600
+DEFAULT_SEARCH_LIMIT = 20
+
+GENERATION_KEY = "jmit_report_schema_generation"
+
+# Loaded catalogs per site, shared by the threads of a worker
+_catalogs = {}
+_catalog_lock = threading.Lock()
+
+class SchemaCatalog:
+	"""
+	All tables, views and columns of a database, loaded by one bulk query
+	"""
+	def __init__(self, rows, generation=0):
+		self.generation = generation
+		self.loaded_at = time.monotonic()
+		self.tables = {}
+		self.columns = []
+
+		for row in rows:
+			table = self.tables.get(row['table_name'])
+			if table is None:
+				table = self.tables[row['table_name']] = {
+					'name': row['table_name'],
+					'type': row['table_type'],
+					'columns': []
+				}
+			if row['column_name'] is None:
+				continue
+			column = {
+				'COLUMN_NAME': row['column_name'],
+				'DATA_TYPE': row['data_type'],
+				'IS_NULLABLE': row['is_nullable']
+			}
+			table['columns'].append(column)
+			self.columns.append((row['table_name'], column, row['column_name'].lower()))
+
+		self.table_names = sorted(self.tables)
+		# Frappe tables are matched without their 'tab' prefix
+		self.table_keys = [(name, strip_table_prefix(name.lower())) for name in self.table_names]
+
+	def is_fresh(self, generation, ttl):
+		return self.generation == generation and time.monotonic() - self.loaded_at < ttl
+
+	def get_columns(self, table_name):
+		table = self.tables.get(table_name)
+		return list(table['columns']) if table else []
+
+	def search_tables(self, txt, limit=DEFAULT_SEARCH_LIMIT):
+		"""Return table names ranked by how well they match txt"""
+		return rank_matches(strip_table_prefix((txt or '').strip().lower()), self.table_keys, limit)
+
+	def search_columns(self, txt, table_name=None, limit=DEFAULT_SEARCH_LIMIT):
+		"""Return {'table', 'column', 'data_type'} entries ranked by how well the column matches txt"""
+		if table_name:
+			table = self.tables.get(table_name)
+			candidates = [
+				(table_name, column, column['COLUMN_NAME'].lower()) for column in table['columns']
+			] if table else []
+		else:
+			candidates = self.columns
+
+		matches = rank_matches(txt, ((entry, entry[2]) for entry in candidates), limit)
+		return [
+			{'table': table, 'column': column['COLUMN_NAME'], 'data_type': column['DATA_TYPE']}
+			for table, column, _ in matches
+		]
+
+@whitelist()
+def search_schema(txt, table_name=None, limit=DEFAULT_SEARCH_LIMIT):
+	"""
+	Prefix and fuzzy search over table and column names
+	With table_name only the columns of that table are searched.
+	"""
+	try:
+		catalog = get_schema_catalog()
+		limit = int(limit or DEFAULT_SEARCH_LIMIT)
+		return {
+			'success': True,
+			'tables': [] if table_name else catalog.search_tables(txt, limit),
+			'columns': catalog.search_columns(txt, table_name, limit)
+		}
+	except Exception as e:
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+@whitelist()
+def clear_schema_cache():
+	"""
+	Reload the schema catalog on the next lookup in every worker
+	"""
+	invalidate_schema_cache()
+	return {
+		'success': True,
+		'message': 'Schema cache cleared'
+	}
+
+def get_schema_catalog():
+	"""
+	Return the schema catalog of the current site, loading it when it is stale
+	The catalog is reloaded after the TTL or when the shared generation was
+	bumped by a migration or a DocType change in any worker.
+	site_config.json:
+		"jmit_report_schema_cache_ttl": 3600
+	"""
+	site = getattr(frappe.local, 'site', None)
+	generation = frappe.cache().get_value(GENERATION_KEY) or 0
+	ttl = int((frappe.conf or {}).get('jmit_report_schema_cache_ttl') or DEFAULT_SCHEMA_CACHE_TTL)
+
+	catalog = _catalogs.get(site)
+	if catalog is not None and catalog.is_fresh(generation, ttl):
+		return catalog
+
+	with _catalog_lock:
+		catalog = _catalogs.get(site)
+		if catalog is None or not catalog.is_fresh(generation, ttl):
+			with read_replica():
+				rows = load_schema_rows()
+			catalog = _catalogs[site] = SchemaCatalog(rows, generation)
+	return catalog
+
+def load_schema_rows():
+	"""
+	Read every table and column of the current database in one query
+	Tables without readable columns are kept through the outer join.
+	"""
+	if getattr(frappe.db, 'db_type', 'mariadb') == 'postgres':
+		schema_condition = "t.table_schema = current_schema()"
+	else:
+		schema_condition = "t.table_schema = DATABASE()"
+
+	return frappe.db.sql(f"""
+		SELECT
+			t.table_name AS table_name,
+			t.table_type AS table_type,
+			c.column_name AS column_name,
+			c.data_type AS data_type,
+			c.is_nullable AS is_nullable
+		FROM information_schema.tables t
+		LEFT JOIN information_schema.columns c
+			ON c.table_schema = t.table_schema AND c.table_name = t.table_name
+		WHERE {schema_condition}
+		ORDER BY t.table_name, c.ordinal_position
+	""", as_dict=True)
+
+def invalidate_schema_cache(*args, **kwargs):
+	"""
+	Drop the schema catalog of the current site in every worker
+	Used as the after_migrate hook and on DocType and Custom Field changes.
+	"""
+	frappe.cache().set_value(GENERATION_KEY, (frappe.cache().get_value(GENERATION_KEY) or 0) + 1)
+	_catalogs.pop(getattr(frappe.local, 'site', None), None)
+
+def rank_matches(txt, candidates, limit=DEFAULT_SEARCH_LIMIT):
+	"""
+	Rank (item, lowercase name) candidates against txt and return the best items
+	An empty txt returns the first candidates in their given order.
+	"""
+	txt = (txt or '').strip().lower()
+	if not txt:
+		return [item for item, _ in islice(candidates, limit)]
+
+	scored = []
+	for item, key in candidates:
+		score = match_score(txt, key)
+		if score is not None:
+			scored.append((score, len(key), key, item))
+	scored.sort(key=lambda entry: entry[:3])
+	return [entry[3] for entry in scored[:limit]]
+
+def match_score(txt, key):
+	"""
+	Score how well a lowercase name matches lowercase txt, lower is better
+	Exact, prefix, word-start and substring matches rank ahead of fuzzy
+	subsequence matches, which are ranked by how tightly the letters cluster.
+	Returns None when the name does not match.
+	"""
+	if key == txt:
+		return 0
+	if key.startswith(txt):
+		return 1
+	position = key.find(txt)
+	if position > 0:
+		if key[position - 1] in ' _-':
+			return 2
+		return 3
+
+	# Fuzzy: every character of txt appears in order
+	gaps = 0
+	last = -1
+	for char in txt:
+		index = key.find(char, last + 1)
+		if index < 0:
+			return None
+		if last >= 0:
+			gaps += index - last - 1
+		last = index
+	return 4 + gaps
+
+def strip_table_prefix(name):
+	return name[3:] if name.startswith('tab') else name
@@ -0,0 +1,248 @@
+"""
+Materialized Snapshots - Keeps the output of heavy reports in snapshot tables
+"""
+import frappe
+from frappe.decorators import whitelist
+from frappe.utils import now
+import hashlib
+import re
+from jmit_report_builder.api.cache import invalidate_report
+from jmit_report_builder.api.filters import compile_query
+from jmit_report_builder.api.grouping import quote_identifier, _split_top_level
+from jmit_report_builder.api.sql_parser import ParsedQuery, split_field, unquote
+
+SNAPSHOT_TABLE_PREFIX = "_jmit_snapshot_"
+# Suffix of the table holding the source row count of each snapshot partition
+PARTITION_COUNTS_SUFFIX = "_partitions"
+
+# Partitions replaced per DELETE/INSERT round
+PARTITION_CHUNK_SIZE = 500
+
+ORDER_TERM_PATTERN = re.compile(r'^(`[^`]+`|"[^"]+"|[\w.]+)(\s+(ASC|DESC))?$', re.IGNORECASE)
+
+def get_snapshot_table(report_name):
+	"""Return the snapshot table name of a report"""
+	return SNAPSHOT_TABLE_PREFIX + hashlib.sha1(report_name.encode()).hexdigest()[:12]
+
+def refresh_snapshot(report_name, full=False):
+	"""
+	Bring the snapshot of a materialized report up to date
+	The first refresh (or full=True) rebuilds the whole table. Later refreshes
+	replace only the partitions with source rows modified after the stored
+	watermark, so history is not recomputed. A modified row only names the
+	partition it is in now, so the source row count of every partition is kept
+	beside the snapshot as well: a partition whose count changed lost rows that
+	were deleted or moved to another partition, and is refreshed too.
+	Changes that neither advance the watermark nor change a partition's row
+	count, such as direct SQL updates that leave modified alone, are only
+	picked up by a full rebuild.
+	Returns the number of partitions refreshed, or None after a full rebuild.
+	"""
+	report = frappe.get_doc('JMIT Report', report_name)
+	if not report.materialized:
+		frappe.throw(f"Report '{report_name}' is not materialized")
+	if (report.query_type or 'SQL') != 'SQL':
+		frappe.throw("Only SQL reports can be materialized")
+	if not report.source_table or not report.partition_field:
+		frappe.throw("Materialized reports need a source table and a partition field")
+
+	db_type = getattr(frappe.db, 'db_type', 'mariadb')
+	table = get_snapshot_table(report.name)
+	watermark_column = quote_identifier(report.watermark_field or 'modified', db_type)
+	source = quote_identifier(report.source_table, db_type)
+	counts_table = table + PARTITION_COUNTS_SUFFIX
+	# Counting before reading the watermark leaves rows changed in between to
+	# the next refresh, either by their watermark or by their old partition's count
+	counts_query = get_partition_counts_query(report, source, db_type)
+	rebuild = full or not report.snapshot_table or not report.last_watermark
+	if rebuild:
+		rebuild_snapshot(counts_query, counts_table, db_type)
+	else:
+		counts = dict(frappe.db.sql(counts_query))
+	new_watermark = frappe.db.sql(f"SELECT MAX({watermark_column}) FROM {source}")[0][0]
+
+	partitions = None
+	if rebuild:
+		rebuild_snapshot(report.report_query, table, db_type)
+	else:
+		stored = dict(frappe.db.sql(f"SELECT partition_key, source_rows FROM {quote_identifier(counts_table, db_type)}"))
+		recounted = [key for key in counts.keys() | stored.keys() if counts.get(key) != stored.get(key)]
+		changed = set(get_changed_partitions(report, source, watermark_column, new_watermark))
+		partitions = list(changed.union(key for key in recounted if key is not None))
+		refresh_partitions(report, table, partitions, db_type)
+		update_partition_counts(counts_table, counts, recounted, db_type)
+
+	frappe.db.set_value('JMIT Report', report.name, {
+		'snapshot_table': table,
+		'last_watermark': new_watermark or report.last_watermark,
+		'last_refreshed_on': now()
+	}, update_modified=False)
+	frappe.db.commit()
+	invalidate_report(report.name)
+	return len(partitions) if partitions is not None else None
+
+def rebuild_snapshot(query, table, db_type='mariadb'):
+	"""
+	Recreate a snapshot table from the full output of a query
+	The new table is built beside the old one and renamed into place, so
+	readers never see a missing table.
+	"""
+	staging = quote_identifier(f"{table}_new", db_type)
+	frappe.db.sql(f"DROP TABLE IF EXISTS {staging}")
+	frappe.db.sql(f"CREATE TABLE {staging} AS SELECT * FROM ({query.strip().rstrip(';')}) AS _jmit_snapshot")
+	frappe.db.sql(f"DROP TABLE IF EXISTS {quote_identifier(table, db_type)}")
+	frappe.db.sql(f"ALTER TABLE {staging} RENAME TO {quote_identifier(table, db_type)}")
+
+def get_partition_expression(report, db_type='mariadb'):
+	"""Return the SQL expression giving the partition key of a source row"""
+	return report.partition_expression or quote_identifier(report.partition_field, db_type)
+
+def get_partition_counts_query(report, source, db_type='mariadb'):
+	"""Return a query counting the source rows of each partition"""
+	expression = get_partition_expression(report, db_type)
+	return (
+		f"SELECT {expression} AS partition_key, COUNT(*) AS source_rows "
+		f"FROM {source} GROUP BY {expression}"
+	)
+
+def update_partition_counts(counts_table, counts, keys, db_type='mariadb'):
+	"""
+	Store the current source row counts of the given partitions
+	Partitions left without source rows are removed.
+	"""
+	target = quote_identifier(counts_table, db_type)
+	for start in range(0, len(keys), PARTITION_CHUNK_SIZE):
+		chunk = keys[start:start + PARTITION_CHUNK_SIZE]
+		present = [key for key in chunk if key is not None]
+		if present:
+			frappe.db.sql(f"DELETE FROM {target} WHERE partition_key IN ({', '.join(['%s'] * len(present))})", tuple(present))
+		if None in chunk:
+			frappe.db.sql(f"DELETE FROM {target} WHERE partition_key IS NULL")
+		rows = [(key, counts[key]) for key in chunk if key in counts]
+		if rows:
+			frappe.db.sql(
+				f"INSERT INTO {target} (partition_key, source_rows) VALUES {', '.join(['(%s, %s)'] * len(rows))}",
+				tuple(value for row in rows for value in row)
+			)
+
+def get_changed_partitions(report, source, watermark_column, new_watermark):
+	"""
+	Return the partition keys of source rows modified since the last refresh
+	"""
+	if new_watermark is None:
+		return []
+	expression = get_partition_expression(report, getattr(frappe.db, 'db_type', 'mariadb'))
+	rows = frappe.db.sql(
+		f"SELECT DISTINCT {expression.replace('%', '%%')} FROM {source} "
+		f"WHERE {watermark_column} > %s AND {watermark_column} <= %s",
+		(report.last_watermark, new_watermark)
+	)
+	return [row[0] for row in rows if row[0] is not None]
+
+def refresh_partitions(report, table, partitions, db_type='mariadb'):
+	"""
+	Replace the snapshot rows of the given partitions with fresh query output
+	The partition filter is placed by the filter compiler, so an alias such as
+	month is replaced by its expression inside the report query.
+	"""
+	column = quote_identifier(report.partition_field, db_type)
+	target = quote_identifier(table, db_type)
+	for start in range(0, len(partitions), PARTITION_CHUNK_SIZE):
+		chunk = list(partitions[start:start + PARTITION_CHUNK_SIZE])
+		query, values = compile_query(
+			report.report_query,
+			[{'field': report.partition_field, 'operator': 'IN', 'value': chunk}],
+			f"{report.name}:snapshot"
+		)
+		frappe.db.sql(f"DELETE FROM {target} WHERE {column} IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk))
+		frappe.db.sql(
+			f"INSERT INTO {target} SELECT * FROM ({query.strip().rstrip(';')}) AS _jmit_snapshot",
+			values
+		)
+
+def reset_snapshot(report_name, drop=False):
+	"""
+	Stop reading a snapshot until its next full rebuild, e.g. after the query changed
+	"""
+	if drop:
+		db_type = getattr(frappe.db, 'db_type', 'mariadb')
+		table = get_snapshot_table(report_name)
+		frappe.db.sql(f"DROP TABLE IF EXISTS {quote_identifier(table, db_type)}")
+		frappe.db.sql(f"DROP TABLE IF EXISTS {quote_identifier(table + PARTITION_COUNTS_SUFFIX, db_type)}")
+	else:
+		frappe.db.set_value('JMIT Report', report_name, {
+			'snapshot_table': None,
+			'last_watermark': None
+		}, update_modified=False)
+
+def get_snapshot_query(report):
+	"""
+	Return a query reading a report from its snapshot, or None when there is none yet
+	The leading ORDER BY terms of the report query that name output columns
+	are kept so results come back in the same order.
+	"""
+	if not report.get('materialized') or not report.get('snapshot_table'):
+		return None
+
+	db_type = getattr(frappe.db, 'db_type', 'mariadb')
+	query = f"SELECT * FROM {quote_identifier(report.snapshot_table, db_type)}"
+	order_by = get_output_order_by(report.report_query, db_type)
+	return f"{query} ORDER BY {order_by}" if order_by else query
+
+def get_output_order_by(query, db_type='mariadb'):
+	"""
+	Rewrite the outermost ORDER BY of a query in terms of its output columns
+	"""
+	parsed = ParsedQuery(query)
+	if not parsed.valid or 'ORDER BY' not in parsed.clauses:
+		return ''
+
+	_, body_start, body_end = parsed.clauses['ORDER BY']
+	terms = []
+	for term in _split_top_level(parsed.sql[body_start:body_end].strip().rstrip(';')):
+		match = ORDER_TERM_PATTERN.match(term.strip())
+		if not match:
+			break
+		_, column = split_field(match.group(1))
+		item = parsed.select_items.get(unquote(column).lower())
+		if item is None:
+			break
+		direction = (match.group(3) or 'ASC').upper()
+		terms.append(f"{quote_identifier(item.name, db_type)} {direction}")
+	return ', '.join(terms)
+
+def get_snapshot_filters(filters):
+	"""Point report filters at the bare output columns of a snapshot"""
+	return [dict(f, field=split_field(f.get('field', ''))[1]) for f in filters]
+
+@whitelist()
+def refresh_report_snapshot(report_name, full=0):
+	"""
+	Refresh the snapshot of a materialized report
+	A refresh rebuilds tables and reruns the report query, so it needs write
+	permission on the report.
+	"""
+	try:
+		frappe.has_permission('JMIT Report', 'write', report_name, throw=True)
+		partitions = refresh_snapshot(report_name, bool(int(full or 0)))
+		return {
+			'success': True,
+			'message': 'Snapshot rebuilt' if partitions is None else f'{partitions} partitions refreshed'
+		}
+	except Exception as e:
+		frappe.logger().error(f"Snapshot refresh error: {str(e)}")
+		return {
+			'success': False,
+			'message': str(e)
+		}
+
+def refresh_materialized_reports():
+	"""
+	Scheduler job: refresh the snapshots of all enabled materialized reports
+	"""
+	for report_name in frappe.get_all('JMIT Report', filters={'materialized': 1, 'enabled': 1}, pluck='name'):
+		try:
+			refresh_snapshot(report_name)
+		except Exception as e:
+			frappe.db.rollback()
+			frappe.logger().error(f"Snapshot refresh error for {report_name}: {str(e)}")
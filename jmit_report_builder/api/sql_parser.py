@@ -0,0 +1,348 @@
+"""
+SQL Parser - Tokenizes report queries and rewrites them to add filter predicates
+"""
+import re
+
+# Keywords that start a clause of a SELECT block
+CLAUSE_KEYWORDS = ('FROM', 'WHERE', 'GROUP BY', 'HAVING', 'WINDOW', 'ORDER BY', 'LIMIT', 'FOR', 'LOCK', 'INTO')
+
+# Clauses a new WHERE or HAVING clause has to be inserted before
+WHERE_FOLLOWERS = ('GROUP BY', 'HAVING', 'WINDOW', 'ORDER BY', 'LIMIT', 'FOR', 'LOCK', 'INTO')
+HAVING_FOLLOWERS = ('WINDOW', 'ORDER BY', 'LIMIT', 'FOR', 'LOCK', 'INTO')
+
+COMPOUND_KEYWORDS = ('UNION', 'INTERSECT', 'EXCEPT')
+
+SELECT_MODIFIERS = (
+	'ALL', 'DISTINCT', 'DISTINCTROW', 'HIGH_PRIORITY', 'STRAIGHT_JOIN', 'SQL_SMALL_RESULT',
+	'SQL_BIG_RESULT', 'SQL_BUFFER_RESULT', 'SQL_CACHE', 'SQL_NO_CACHE', 'SQL_CALC_FOUND_ROWS'
+)
+
+AGGREGATE_FUNCTIONS = (
+	'AVG', 'BIT_AND', 'BIT_OR', 'BIT_XOR', 'COUNT', 'GROUP_CONCAT', 'JSON_ARRAYAGG',
+	'JSON_OBJECTAGG', 'MAX', 'MIN', 'STD', 'STDDEV', 'STDDEV_POP', 'STDDEV_SAMP', 'SUM',
+	'VARIANCE', 'VAR_POP', 'VAR_SAMP', 'STRING_AGG', 'ARRAY_AGG'
+)
+
+# Words that cannot be an implicit alias
+NON_ALIAS_WORDS = ('END', 'NULL', 'TRUE', 'FALSE', 'AND', 'OR', 'NOT', 'IS', 'IN', 'LIKE', 'THEN', 'ELSE')
+
+# Words that expect an operand, so the word after them is not an implicit alias
+OPERAND_WORDS = (
+	'AND', 'OR', 'NOT', 'XOR', 'IS', 'IN', 'LIKE', 'RLIKE', 'REGEXP', 'BETWEEN', 'DIV', 'MOD',
+	'ESCAPE', 'COLLATE', 'INTERVAL', 'BINARY', 'CASE', 'WHEN', 'THEN', 'ELSE', 'DISTINCT'
+)
+
+TOKEN_PATTERN = re.compile(r"""
+	(?P<space>\s+)
+	| (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+	| (?P<string>'(?:[^'\\]|\\.|'')*')
+	| (?P<quoted>`(?:[^`]|``)*`|"(?:[^"\\]|\\.|"")*")
+	| (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+	| (?P<word>[A-Za-z_@$][A-Za-z0-9_@$]*)
+	| (?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+SIMPLE_REFERENCE = re.compile(r'^(`[^`]+`|[A-Za-z_][A-Za-z0-9_]*)(\.(`[^`]+`|[A-Za-z_][A-Za-z0-9_]*))?$')
+
+class Token:
+	"""
+	A lexical token with its character span and parenthesis depth
+	"""
+	__slots__ = ('kind', 'text', 'start', 'end', 'depth')
+
+	def __init__(self, kind, text, start, end, depth):
+		self.kind = kind
+		self.text = text
+		self.start = start
+		self.end = end
+		self.depth = depth
+
+	@property
+	def upper(self):
+		return self.text.upper() if self.kind == 'word' else self.text
+
+	def __repr__(self):
+		return f"Token({self.kind}, {self.text!r}, depth={self.depth})"
+
+class SelectItem:
+	"""
+	One expression of a SELECT list
+	"""
+	__slots__ = ('expression', 'name', 'aggregate', 'windowed')
+
+	def __init__(self, expression, name, aggregate, windowed):
+		self.expression = expression
+		self.name = name
+		self.aggregate = aggregate
+		self.windowed = windowed
+
+def tokenize(sql):
+	"""
+	Split SQL into significant tokens, dropping whitespace and comments
+	Parentheses carry the depth outside them; other tokens the depth they are at.
+	"""
+	tokens = []
+	depth = 0
+	for match in TOKEN_PATTERN.finditer(sql):
+		kind = match.lastgroup
+		if kind in ('space', 'comment'):
+			continue
+
+		text = match.group()
+		if text == ')':
+			depth -= 1
+		tokens.append(Token(kind, text, match.start(), match.end(), depth))
+		if text == '(':
+			depth += 1
+	return tokens
+
+class ParsedQuery:
+	"""
+	Structure of a SELECT statement as needed to place filter predicates
+	ctes maps each CTE name to (body_start, body_end, ParsedQuery). clauses maps
+	the clauses of the outermost block to (keyword_start, body_start, body_end).
+	"""
+	def __init__(self, sql):
+		self.sql = sql
+		self.tokens = tokenize(sql)
+		self.ctes = {}
+		self.clauses = {}
+		self.select_items = {}
+		self.compound = False
+		self.end = len(sql.rstrip().rstrip(';').rstrip())
+		self.valid = False
+		self._parse()
+
+	def _parse(self):
+		tokens = self.tokens
+		index = self._parse_ctes(0)
+		if index >= len(tokens) or tokens[index].upper != 'SELECT':
+			return
+
+		markers = []
+		position = index
+		while position < len(tokens):
+			token = tokens[position]
+			if token.depth == 0 and token.kind == 'word':
+				word = token.upper
+				following = tokens[position + 1].upper if position + 1 < len(tokens) else ''
+				if word in COMPOUND_KEYWORDS:
+					self.compound = True
+				elif word in ('GROUP', 'ORDER') and following == 'BY':
+					markers.append((f"{word} BY", token.start, tokens[position + 1].end))
+					position += 1
+				elif word in CLAUSE_KEYWORDS and word not in [m[0] for m in markers]:
+					markers.append((word, token.start, token.end))
+			elif token.depth == 0 and token.text == ';':
+				break
+			position += 1
+
+		for number, (name, keyword_start, body_start) in enumerate(markers):
+			body_end = markers[number + 1][1] if number + 1 < len(markers) else self.end
+			self.clauses[name] = (keyword_start, body_start, body_end)
+
+		from_start = self.clauses['FROM'][0] if 'FROM' in self.clauses else self.end
+		self._parse_select_list(index + 1, from_start)
+		self.valid = True
+
+	def _parse_ctes(self, index):
+		"""Record the bodies of a leading WITH clause and return the main SELECT index"""
+		tokens = self.tokens
+		if index >= len(tokens) or tokens[index].upper != 'WITH':
+			return index
+
+		index += 1
+		if index < len(tokens) and tokens[index].upper == 'RECURSIVE':
+			index += 1
+
+		while index < len(tokens):
+			name = unquote(tokens[index].text)
+			index += 1
+			if index < len(tokens) and tokens[index].text == '(':
+				index = self._matching_paren(index) + 1
+			if index >= len(tokens) or tokens[index].upper != 'AS':
+				return index
+			index += 1
+			if index >= len(tokens) or tokens[index].text != '(':
+				return index
+
+			close = self._matching_paren(index)
+			body_start, body_end = tokens[index].end, tokens[close].start
+			self.ctes[name.lower()] = (body_start, body_end, ParsedQuery(self.sql[body_start:body_end]))
+			index = close + 1
+
+			if index < len(tokens) and tokens[index].text == ',':
+				index += 1
+				continue
+			return index
+		return index
+
+	def _matching_paren(self, index):
+		depth = self.tokens[index].depth
+		for position in range(index + 1, len(self.tokens)):
+			token = self.tokens[position]
+			if token.text == ')' and token.depth == depth:
+				return position
+		return len(self.tokens) - 1
+
+	def _parse_select_list(self, index, from_start):
+		tokens = self.tokens
+		while index < len(tokens) and tokens[index].upper in SELECT_MODIFIERS:
+			index += 1
+
+		item = []
+		for token in tokens[index:]:
+			if token.start >= from_start:
+				break
+			if token.depth == 0 and token.text == ',':
+				self._add_select_item(item)
+				item = []
+			else:
+				item.append(token)
+		self._add_select_item(item)
+
+	def _add_select_item(self, item):
+		if not item:
+			return
+
+		alias = None
+		if len(item) >= 3 and item[-2].upper == 'AS':
+			alias, item = item[-1], item[:-2]
+		elif len(item) >= 2 and item[-1].kind in ('word', 'quoted') and item[-1].upper not in NON_ALIAS_WORDS \
+				and (item[-2].kind in ('word', 'quoted', 'number', 'string') or item[-2].text == ')') \
+				and item[-2].upper not in OPERAND_WORDS:
+			alias, item = item[-1], item[:-1]
+
+		expression = self.sql[item[0].start:item[-1].end]
+		if alias is not None:
+			name = unquote(alias.text)
+		elif SIMPLE_REFERENCE.match(expression):
+			name = unquote(expression.rsplit('.', 1)[-1])
+		else:
+			return
+
+		aggregate = windowed = False
+		# Aggregates and windows of a scalar subquery do not apply to this block
+		subqueries = []
+		for index, token in enumerate(item):
+			if token.text == '(':
+				subqueries.append(index + 1 < len(item) and item[index + 1].upper == 'SELECT')
+			elif token.text == ')':
+				if subqueries:
+					subqueries.pop()
+			elif not any(subqueries):
+				if token.upper in AGGREGATE_FUNCTIONS and index + 1 < len(item) and item[index + 1].text == '(':
+					aggregate = True
+				elif token.upper == 'OVER':
+					windowed = True
+		self.select_items.setdefault(name.lower(), SelectItem(expression, name, aggregate, windowed))
+
+def unquote(identifier):
+	"""Strip backticks or double quotes around an identifier"""
+	if len(identifier) >= 2 and identifier[0] == identifier[-1] and identifier[0] in '`"':
+		return identifier[1:-1]
+	return identifier
+
+def split_field(field):
+	"""Split a possibly qualified field into (qualifier, column)"""
+	parts = [unquote(part) for part in re.findall(r'`[^`]+`|[^.]+', field)]
+	if len(parts) == 2:
+		return parts[0], parts[1]
+	return None, unquote(field)
+
+def add_conditions(parsed, conditions):
+	"""
+	Return the SQL of a parsed query with filter conditions added
+	conditions is a list of (field, build) where build(target) returns the
+	condition SQL for a column expression. Each condition is placed where it
+	can use indexes before aggregation:
+	- cte.column filters go into the WHERE of that CTE
+	- output aliases of plain expressions are replaced by the expression in WHERE
+	- output aliases of aggregates go into HAVING
+	- everything else goes into the WHERE of the outermost query block
+	Compound (UNION) queries, window function aliases and queries that cannot be
+	parsed are wrapped in a derived table and filtered on their output columns.
+	"""
+	if not conditions:
+		return parsed.sql
+
+	if not parsed.valid or parsed.compound:
+		return wrap_conditions(parsed, conditions)
+
+	where = []
+	having = []
+	cte_conditions = {}
+
+	for field, build in conditions:
+		qualifier, column = split_field(field)
+		if qualifier and qualifier.lower() in parsed.ctes:
+			cte_conditions.setdefault(qualifier.lower(), []).append((column, build))
+			continue
+
+		item = parsed.select_items.get(column.lower()) if not qualifier else None
+		if item is None:
+			where.append(build(field))
+		elif item.windowed:
+			return wrap_conditions(parsed, conditions)
+		elif item.aggregate:
+			having.append(build(field))
+		elif SIMPLE_REFERENCE.match(item.expression):
+			where.append(build(item.expression))
+		else:
+			where.append(build(f"({item.expression})"))
+
+	edits = []
+	if having:
+		edits.append(_clause_edit(parsed, 'HAVING', having, HAVING_FOLLOWERS))
+	if where:
+		edits.append(_clause_edit(parsed, 'WHERE', where, WHERE_FOLLOWERS))
+	for name, cte_conds in cte_conditions.items():
+		body_start, body_end, cte_parsed = parsed.ctes[name]
+		edits.append((body_start, body_end, add_conditions(cte_parsed, cte_conds)))
+
+	# Apply right to left so earlier offsets stay valid; a HAVING inserted at the
+	# same offset as a new WHERE is listed first and so ends up after it
+	sql = parsed.sql
+	for start, end, replacement in sorted(edits, key=lambda edit: -edit[0]):
+		sql = sql[:start] + replacement + sql[end:]
+	return sql
+
+def _clause_edit(parsed, clause, conditions, followers):
+	"""Return the (start, end, text) edit that adds conditions to a clause"""
+	condition_sql = " AND ".join(conditions)
+
+	if clause in parsed.clauses:
+		_, body_start, body_end = parsed.clauses[clause]
+		existing = parsed.sql[body_start:body_end].strip()
+		return body_start, body_end, f" {condition_sql} AND ({existing}) "
+
+	position = parsed.end
+	for follower in followers:
+		if follower in parsed.clauses:
+			position = min(position, parsed.clauses[follower][0])
+	separator = "" if position == parsed.end else " "
+	return position, position, f" {clause} {condition_sql}{separator}"
+
+def wrap_conditions(parsed, conditions):
+	"""Filter the output columns of a query through a derived table"""
+	condition_sql = " AND ".join(build(_output_column(field)) for field, build in conditions)
+	return f"SELECT * FROM ({parsed.sql[:parsed.end]}) AS _jmit_filtered WHERE {condition_sql}"
+
+def _output_column(field):
+	"""Return the output column a filter field refers to, quoted if needed"""
+	column = split_field(field)[1]
+	if re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', column):
+		return column
+	return f"`{column}`"
+
+def add_row_limit(parsed, limit):
+	"""
+	Return the SQL of a parsed query returning at most limit rows
+	The LIMIT is appended to the outermost block so its ORDER BY still applies.
+	Queries that already end in LIMIT or a locking clause, or that cannot be
+	parsed, are wrapped in a derived table instead.
+	"""
+	sql = parsed.sql[:parsed.end]
+	if parsed.valid and not any(clause in parsed.clauses for clause in ('LIMIT', 'FOR', 'LOCK', 'INTO')):
+		return f"{sql} LIMIT {int(limit)}"
+	return f"SELECT * FROM ({sql}) AS _jmit_limited LIMIT {int(limit)}"
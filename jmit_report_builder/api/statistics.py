@@ -0,0 +1,311 @@
+"""
+Report Statistics - Single-pass column statistics over streamed batches
+"""
+import hashlib
+import itertools
+from collections import Counter
+from datetime import datetime
+from heapq import heappush, heapreplace
+from jmit_report_builder.api.rows import Record, get_field_getter
+
+# Rows inspected before field types are decided
+SAMPLE_ROWS = 100
+
+# Most frequent text values reported per field
+TOP_K = 10
+
+# HyperLogLog uses 2 ** HLL_PRECISION registers, about 1.6% standard error
+HLL_PRECISION = 12
+
+# Bits of the value hash, a BLAKE2b digest of this many bytes
+HASH_BITS = 64
+
+class NumericStats:
+	"""
+	Running count, sum, min, max and variance of a numeric field
+	Variance uses Welford's update, and batches summarized elsewhere are
+	combined with the parallel form of the same recurrence.
+	"""
+	__slots__ = ('count', 'sum', 'min', 'max', 'mean', 'm2', 'null_count')
+
+	def __init__(self):
+		self.count = 0
+		self.sum = 0
+		self.min = None
+		self.max = None
+		self.mean = 0.0
+		self.m2 = 0.0
+		self.null_count = 0
+
+	def update(self, values):
+		count, total, mean, m2 = self.count, self.sum, self.mean, self.m2
+		low, high = self.min, self.max
+		for value in values:
+			if value is None or value == '':
+				self.null_count += 1
+				continue
+			try:
+				value = float(value)
+			except (TypeError, ValueError):
+				continue
+
+			count += 1
+			total += value
+			delta = value - mean
+			mean += delta / count
+			m2 += delta * (value - mean)
+			if low is None or value < low:
+				low = value
+			if high is None or value > high:
+				high = value
+
+		self.count, self.sum, self.mean, self.m2 = count, total, mean, m2
+		self.min, self.max = low, high
+
+	def merge(self, count, total, low, high, mean, m2, null_count=0):
+		"""Combine the summary of another batch of values"""
+		self.null_count += null_count
+		if not count:
+			return
+		combined = self.count + count
+		delta = mean - self.mean
+		self.m2 += m2 + delta * delta * self.count * count / combined
+		self.mean += delta * count / combined
+		self.count = combined
+		self.sum += total
+		self.min = low if self.min is None else min(self.min, low)
+		self.max = high if self.max is None else max(self.max, high)
+
+	def as_dict(self):
+		stats = {
+			'min': self.min,
+			'max': self.max,
+			'sum': self.sum,
+			'count': self.count,
+			'null_count': self.null_count
+		}
+		if self.count > 0:
+			stats['avg'] = self.sum / self.count
+			stats['variance'] = self.m2 / (self.count - 1) if self.count > 1 else 0.0
+		return stats
+
+class HyperLogLog:
+	"""
+	Approximate distinct counter with fixed memory
+	Values are strings, hashed with a 64-bit BLAKE2b digest so the estimate of
+	the same values is the same in every process.
+	"""
+	__slots__ = ('precision', 'registers')
+
+	def __init__(self, precision=HLL_PRECISION):
+		self.precision = precision
+		self.registers = bytearray(1 << precision)
+
+	def add(self, value):
+		self.update((value,))
+
+	def update(self, values):
+		"""Add many values; a register only depends on the distinct values"""
+		registers = self.registers
+		shift = HASH_BITS - self.precision
+		low_bits = (1 << shift) - 1
+		for value in values:
+			hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=HASH_BITS // 8).digest(), 'big')
+			rank = shift - (hashed & low_bits).bit_length() + 1
+			index = hashed >> shift
+			if rank > registers[index]:
+				registers[index] = rank
+
+	def count(self):
+		size = len(self.registers)
+		alpha = 0.7213 / (1 + 1.079 / size)
+		estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+		zeros = self.registers.count(0)
+		if estimate <= 2.5 * size and zeros:
+			# Linear counting is more accurate for small cardinalities
+			from math import log
+			estimate = size * log(size / zeros)
+		return int(round(estimate))
+
+class SpaceSaving:
+	"""
+	Bounded heavy-hitters counter
+	Keeps at most `capacity` values; a new value replaces the least frequent
+	one and inherits its count, so counts of frequent values are upper bounds
+	that overestimate by at most the evicted count. The least frequent value is
+	found with a min-heap of (count, value) entries that are refreshed lazily:
+	counts only grow, so an entry whose count is stale is pushed back with the
+	current count instead of being updated on every increment.
+	"""
+	__slots__ = ('capacity', 'counts', 'heap', 'sequence')
+
+	def __init__(self, capacity=TOP_K * 4):
+		self.capacity = capacity
+		self.counts = {}
+		self.heap = []
+		# Ties on count are broken by insertion order, so values need not be comparable
+		self.sequence = itertools.count()
+
+	def add(self, value, weight=1):
+		counts = self.counts
+		if value in counts:
+			counts[value] += weight
+		elif len(counts) < self.capacity:
+			counts[value] = weight
+			heappush(self.heap, (weight, next(self.sequence), value))
+		else:
+			heap = self.heap
+			while True:
+				entry_count, _, evicted = heap[0]
+				current = counts[evicted]
+				if current == entry_count:
+					break
+				heapreplace(heap, (current, next(self.sequence), evicted))
+			del counts[evicted]
+			counts[value] = current + weight
+			heapreplace(heap, (current + weight, next(self.sequence), value))
+
+	def update(self, frequencies):
+		"""
+		Add the counts of a Counter, such as the values of one batch
+		Frequent values go first, so rare ones evict each other rather than them.
+		"""
+		add = self.add
+		for value, weight in frequencies.most_common():
+			add(value, weight)
+
+	def top(self, k=TOP_K):
+		ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+		return [{'value': value, 'count': count} for value, count in ranked]
+
+class TextStats:
+	"""
+	Approximate cardinality and most frequent values of a text field
+	"""
+	__slots__ = ('count', 'null_count', 'distinct', 'heavy_hitters')
+
+	def __init__(self):
+		self.count = 0
+		self.null_count = 0
+		self.distinct = HyperLogLog()
+		self.heavy_hitters = SpaceSaving()
+
+	def update(self, values):
+		present = [str(value) for value in values if value is not None and value != '']
+		self.null_count += len(values) - len(present)
+		self.count += len(present)
+		# Each distinct value of the batch is hashed and counted once
+		frequencies = Counter(present)
+		self.distinct.update(frequencies)
+		self.heavy_hitters.update(frequencies)
+
+	def as_dict(self):
+		return {
+			'count': self.count,
+			'null_count': self.null_count,
+			'approx_distinct': self.distinct.count(),
+			'top_values': self.heavy_hitters.top()
+		}
+
+class ReportStatistics:
+	"""
+	Accumulates statistics over batches of records in one pass
+	Field types are inferred from the first SAMPLE_ROWS rows, so memory stays
+	bounded by the sample, the sketches and one batch.
+	"""
+	def __init__(self, backend=None, sample_rows=SAMPLE_ROWS):
+		self.backend = backend
+		self.sample_rows = sample_rows
+		self.sample = []
+		self.fields = None
+		self.total_rows = 0
+
+	def update(self, batch):
+		# Group headers and subtotal rows of grouped results are not data
+		batch = [record for record in batch if not record.get('_type')]
+		self.total_rows += len(batch)
+		if self.fields is None:
+			self.sample.extend(batch)
+			if len(self.sample) < self.sample_rows:
+				return
+			batch, self.sample = self.sample, []
+			self.fields = create_field_stats(infer_field_types(batch))
+
+		# Tuple records of one result share a schema and are read by position
+		shared = bool(batch) and isinstance(batch[0], Record) and all(type(record) is type(batch[0]) for record in batch)
+		for field, field_stats in self.fields.items():
+			if shared:
+				values = list(map(get_field_getter(batch[0], field), batch))
+			else:
+				values = [record.get(field) for record in batch]
+			if isinstance(field_stats, NumericStats) and self.backend == 'columnar':
+				from jmit_report_builder.api.columnar import is_available, summarize_numeric
+				if is_available():
+					field_stats.merge(*summarize_numeric(values))
+					continue
+			field_stats.update(values)
+
+	def result(self):
+		if self.fields is None:
+			sample, self.sample = self.sample, []
+			self.fields = create_field_stats(infer_field_types(sample))
+			self.total_rows -= len(sample)
+			self.update(sample)
+
+		if not self.total_rows:
+			return {}
+
+		stats = {
+			'total_rows': self.total_rows,
+			'generated_at': datetime.now().isoformat(),
+			'numeric_fields': {},
+			'text_fields': {}
+		}
+		for field, field_stats in self.fields.items():
+			group = 'numeric_fields' if isinstance(field_stats, NumericStats) else 'text_fields'
+			stats[group][field] = field_stats.as_dict()
+		return stats
+
+def get_batch_statistics(batches, backend=None):
+	"""
+	Compute report statistics over an iterable of record batches
+	"""
+	report_stats = ReportStatistics(backend)
+	for batch in batches:
+		report_stats.update(batch)
+	return report_stats.result()
+
+def infer_field_types(sample):
+	"""
+	Return {field: 'numeric' | 'text'} for the non-internal fields of a sample
+	A field is numeric when it has values and every non-empty value converts
+	to float, so leading NULLs do not turn a numeric column into text.
+	"""
+	fields = {}
+	for record in sample:
+		for field in record:
+			if field not in fields and not field.startswith('_'):
+				fields[field] = None
+
+	for field in fields:
+		seen = False
+		numeric = True
+		for record in sample:
+			value = record.get(field)
+			if value is None or value == '':
+				continue
+			seen = True
+			try:
+				float(value)
+			except (TypeError, ValueError):
+				numeric = False
+				break
+		fields[field] = 'numeric' if seen and numeric else 'text'
+	return fields
+
+def create_field_stats(field_types):
+	"""Create an accumulator per field"""
+	return {
+		field: NumericStats() if field_type == 'numeric' else TextStats()
+		for field, field_type in field_types.items()
+	}
@@ -0,0 +1,184 @@
+"""
+Wire Format - Negotiated encoding and compression of report responses
+MessagePack, Arrow and zstd are optional; they are used when the msgpack,
+pyarrow and zstandard packages are installed.
+"""
+import frappe
+import gzip
+import json
+from collections import namedtuple
+from decimal import Decimal
+
+# Media types of each encoding; the first one is sent as the Content-Type
+ENCODINGS = {
+	'json': ('application/json',),
+	'msgpack': ('application/msgpack', 'application/vnd.msgpack', 'application/x-msgpack'),
+	'arrow': ('application/vnd.apache.arrow.stream',)
+}
+COMPRESSIONS = ('zstd', 'gzip')
+
+# Packages needed by each encoding and compression
+REQUIRED_PACKAGES = {
+	'msgpack': 'msgpack',
+	'arrow': 'pyarrow',
+	'zstd': 'zstandard'
+}
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Schema metadata key holding everything of an Arrow response besides the values
+ARROW_METADATA_KEY = b'jmit'
+
+WireFormat = namedtuple('WireFormat', ('row_format', 'encoding', 'compression'))
+
+def negotiate_wire_format(config):
+	"""
+	Resolve the row format, encoding and compression of a response
+	config keys:
+		'row_format': 'dict|compact|columnar'
+		'encoding': 'json|msgpack|arrow|auto'
+		'compression': 'gzip|zstd|auto'
+	'auto' picks from the Accept and Accept-Encoding request headers.
+	MessagePack and Arrow default to the columnar row format.
+	"""
+	encoding = config.get('encoding') or 'json'
+	compression = config.get('compression') or None
+
+	if encoding == 'auto':
+		encoding = negotiate_encoding(frappe.get_request_header('Accept'))
+	if compression == 'auto':
+		compression = negotiate_compression(frappe.get_request_header('Accept-Encoding'))
+
+	if encoding not in ENCODINGS:
+		frappe.throw(f"Unsupported encoding: {encoding}")
+	if compression and compression not in COMPRESSIONS:
+		frappe.throw(f"Unsupported compression: {compression}")
+	check_available(encoding, compression)
+
+	row_format = config.get('row_format') or ('columnar' if encoding != 'json' else 'dict')
+	if encoding == 'arrow' and row_format != 'columnar':
+		frappe.throw("The Arrow encoding requires the columnar row format")
+	return WireFormat(row_format, encoding, compression)
+
+def is_binary(wire):
+	"""Check whether a response is sent as an encoded body instead of a JSON message"""
+	return wire.encoding != 'json' or bool(wire.compression)
+
+def negotiate_encoding(accept):
+	"""Return the supported encoding with the highest quality in an Accept header, json by default"""
+	media_types = {media_type: name for name, types in ENCODINGS.items() for media_type in types}
+	best, best_quality = 'json', 0
+	for value, quality in parse_header_values(accept):
+		name = media_types.get(value)
+		if name and quality > best_quality and is_available(name):
+			best, best_quality = name, quality
+	return best
+
+def negotiate_compression(accept_encoding):
+	"""Return the preferred available compression accepted by the client, or None"""
+	accepted = {value: quality for value, quality in parse_header_values(accept_encoding) if quality > 0}
+	for name in COMPRESSIONS:
+		if name in accepted and is_available(name):
+			return name
+	return None
+
+def parse_header_values(header):
+	"""Yield (value, quality) of a comma-separated header such as Accept"""
+	for part in (header or '').split(','):
+		value, _, params = part.partition(';')
+		quality = 1.0
+		for param in params.split(';'):
+			key, _, number = param.strip().partition('=')
+			if key == 'q':
+				try:
+					quality = float(number)
+				except ValueError:
+					quality = 0.0
+		if value.strip():
+			yield value.strip().lower(), quality
+
+def get_optional_module(name):
+	"""
+	Return an optional module, or None when it is not installed
+	"""
+	try:
+		return __import__(name)
+	except ImportError:
+		return None
+
+def is_available(name):
+	"""Check whether an encoding or compression can be used"""
+	package = REQUIRED_PACKAGES.get(name)
+	return package is None or get_optional_module(package) is not None
+
+def check_available(*names):
+	for name in names:
+		if name and not is_available(name):
+			frappe.throw(f"The {name} format requires the {REQUIRED_PACKAGES[name]} package")
+
+def encode_result(result, wire):
+	"""
+	Encode a formatted result as the uncompressed body of a response
+	"""
+	if wire.encoding == 'msgpack':
+		return get_optional_module('msgpack').packb(result, default=encode_value, use_bin_type=True)
+	if wire.encoding == 'arrow':
+		return encode_arrow(result)
+	return frappe.as_json(result, indent=None, separators=(',', ':')).encode()
+
+def compress(body, compression):
+	"""Compress a body, or return None when it is too small to benefit"""
+	if not compression or len(body) < MIN_COMPRESS_BYTES:
+		return None
+	if compression == 'zstd':
+		return get_optional_module('zstandard').ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+	return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+def encode_value(value):
+	"""Convert values msgpack and Arrow cannot store (decimals, dates) the way frappe.as_json does"""
+	if isinstance(value, Decimal):
+		return float(value)
+	return str(value)
+
+def encode_arrow(result):
+	"""
+	Encode a columnar result as an Arrow IPC stream
+	The values become one record batch; columns of mixed types are sent as
+	strings. Everything else (count, markers, result_sets) is stored as JSON
+	in the schema metadata.
+	"""
+	pa = get_optional_module('pyarrow')
+	columns = result.get('columns') or []
+	arrays = [to_arrow_array(pa, values) for values in result.get('values') or []]
+	metadata = {key: value for key, value in result.items() if key not in ('columns', 'values')}
+
+	table = pa.Table.from_arrays(arrays, names=columns).replace_schema_metadata({
+		ARROW_METADATA_KEY: json.dumps(metadata, default=encode_value, separators=(',', ':'))
+	})
+	sink = pa.BufferOutputStream()
+	with pa.ipc.new_stream(sink, table.schema) as writer:
+		writer.write_table(table)
+	return sink.getvalue().to_pybytes()
+
+def to_arrow_array(pa, values):
+	try:
+		return pa.array(values)
+	except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+		return pa.array([None if value is None else encode_value(value) for value in values], type=pa.string())
+
+def make_response(body, wire):
+	"""
+	Build the HTTP response of an encoded body, compressing it when requested
+	Compression is sent as Content-Encoding, so browsers decompress it natively.
+	"""
+	from werkzeug.wrappers import Response
+
+	compressed = compress(body, wire.compression)
+	response = Response(compressed or body, content_type=ENCODINGS[wire.encoding][0])
+	if compressed is not None:
+		response.headers['Content-Encoding'] = wire.compression
+	response.headers['Vary'] = 'Accept, Accept-Encoding'
+	return response
@@ -16,6 +16,7 @@ class JMITReport(Document):
 		
 		# Validate query syntax
 		self.validate_query_syntax()
+		self.validate_presorted()
 	
 	def validate_query_syntax(self):
 		"""Validate SQL query syntax"""
@@ -31,10 +32,34 @@ class JMITReport(Document):
 		except Exception as e:
 			frappe.throw(f"Query validation error: {str(e)}")
 	
+	def validate_presorted(self):
+		"""Check that a presorted query is ordered by its grouping fields"""
+		from jmit_report_builder.api.grouping import is_sorted_by
+		
+		grouping_fields = [grp.field_name for grp in self.grouping_fields]
+		if self.presorted and self.query_type == 'SQL' and not is_sorted_by(self.report_query, grouping_fields):
+			frappe.throw("A presorted query must start its ORDER BY with the grouping fields")
+	
 	def on_update(self):
 		"""Called after report is updated"""
 		frappe.msgprint(f"Report '{self.report_name}' updated successfully")
 
 def on_update(doc, method):
 	"""Hook for document update"""
-	pass
+	from jmit_report_builder.api.cache import invalidate_report
+	from jmit_report_builder.api.snapshot import reset_snapshot
+	invalidate_report(doc.name)
+	
+	# A snapshot of the old query or partitioning no longer matches the report
+	if doc.snapshot_table and any(
+		doc.has_value_changed(field)
+		for field in ('report_query', 'materialized', 'source_table', 'partition_field', 'partition_expression')
+	):
+		reset_snapshot(doc.name)
+
+def on_trash(doc, method):
+	"""Hook for document deletion"""
+	from jmit_report_builder.api.cache import invalidate_report
+	from jmit_report_builder.api.snapshot import reset_snapshot
+	invalidate_report(doc.name)
+	reset_snapshot(doc.name, drop=True)
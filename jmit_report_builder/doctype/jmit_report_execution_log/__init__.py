@@ -0,0 +1,4 @@
+"""
+JMIT Report Execution Log DocType
+Rolling log of report execution timings
+"""
@@ -0,0 +1,16 @@
+"""
+JMIT Report Execution Log DocType Class
+One entry per profiled report execution or export
+"""
+import frappe
+from frappe.model.document import Document
+
+class JMITReportExecutionLog(Document):
+	@staticmethod
+	def clear_old_logs(days=30):
+		"""Delete log entries older than days, called by Log Settings"""
+		from frappe.query_builder import Interval
+		from frappe.query_builder.functions import Now
+		
+		table = frappe.qb.DocType("JMIT Report Execution Log")
+		frappe.db.delete(table, filters=(table.modified < (Now() - Interval(days=days))))
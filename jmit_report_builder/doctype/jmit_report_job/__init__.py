@@ -0,0 +1,4 @@
+"""
+JMIT Report Job DocType
+Background report execution and export
+"""
@@ -0,0 +1,19 @@
+"""
+JMIT Report Job DocType Class
+Tracks a report run or export queued in the background
+"""
+import frappe
+from frappe.model.document import Document
+
+class JMITReportJob(Document):
+	@staticmethod
+	def clear_old_logs(days=30):
+		"""Delete finished jobs older than days, called by Log Settings"""
+		from frappe.query_builder import Interval
+		from frappe.query_builder.functions import Now
+		
+		table = frappe.qb.DocType("JMIT Report Job")
+		frappe.db.delete(
+			table,
+			filters=(table.modified < (Now() - Interval(days=days))) & (table.status.notin(['Queued', 'Running']))
+		)
@@ -0,0 +1,4 @@
+"""
+JMIT Report Query Plan DocType
+Stored EXPLAIN output and index advice for a report
+"""
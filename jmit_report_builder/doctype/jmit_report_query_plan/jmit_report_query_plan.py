@@ -0,0 +1,8 @@
+"""
+JMIT Report Query Plan DocType Class
+Keeps the query plans of a report so regressions can be tracked
+"""
+from frappe.model.document import Document
+
+class JMITReportQueryPlan(Document):
+	pass
@@ -18,10 +18,36 @@ on_session_start = [
 doc_events = {
 	"JMIT Report": {
 		"on_update": "jmit_report_builder.doctype.jmit_report.jmit_report.on_update",
+		"on_trash": "jmit_report_builder.doctype.jmit_report.jmit_report.on_trash",
 		"validate": "jmit_report_builder.doctype.jmit_report.jmit_report.validate"
+	},
+	"DocType": {
+		"on_update": "jmit_report_builder.api.schema.invalidate_schema_cache",
+		"on_trash": "jmit_report_builder.api.schema.invalidate_schema_cache"
+	},
+	"Custom Field": {
+		"on_update": "jmit_report_builder.api.schema.invalidate_schema_cache",
+		"on_trash": "jmit_report_builder.api.schema.invalidate_schema_cache"
 	}
 }
 
+after_migrate = [
+	"jmit_report_builder.api.schema.invalidate_schema_cache"
+]
+
+# Scheduled Tasks
+scheduler_events = {
+	"hourly": [
+		"jmit_report_builder.api.snapshot.refresh_materialized_reports"
+	]
+}
+
+# Log Clearing
+default_log_clearing_doctypes = {
+	"JMIT Report Job": 30,
+	"JMIT Report Execution Log": 30
+}
+
 # Fixtures
 fixtures = [
 	"jmit_report_builder.doctype.jmit_report",
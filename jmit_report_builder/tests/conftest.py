@@ -0,0 +1,36 @@
+"""
+Test Fixtures - Run the app against the frappe stub of the benchmark suite
+frappe.db is an in-memory SQLite database, replaced for every test together
+with the cache and the site config.
+"""
+import os
+import sys
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'benchmarks')
+sys.path.insert(0, BENCHMARK_DIR)
+
+import frappe_stub
+
+frappe = frappe_stub.install()
+
+import datasets
+import pytest
+
+@pytest.fixture(autouse=True)
+def site():
+	"""A fresh database, cache and site config for each test"""
+	conf = dict(frappe.conf)
+	frappe.local.db = frappe_stub.Database()
+	frappe.cache().data.clear()
+	frappe.flags.clear()
+	yield frappe
+	frappe.local.db.close()
+	frappe.conf.clear()
+	frappe.conf.update(conf)
+
+@pytest.fixture
+def sales():
+	"""Load a small deterministic sales table and return its rows"""
+	data = datasets.generate_rows(200, cardinality=5, seed=7)
+	datasets.load_table(frappe.db, data)
+	return data
@@ -0,0 +1,111 @@
+import json
+
+import frappe
+import pytest
+
+from jmit_report_builder.api import advisor
+from jmit_report_builder.api.sql_parser import ParsedQuery
+
+QUERY = """
+	SELECT si.customer, si.posting_date, sii.item_group AS grp, SUM(sii.amount) AS amount
+	FROM `tabSales Invoice` si
+	JOIN `tabSales Invoice Item` AS sii ON sii.parent = si.name
+	WHERE si.docstatus = 1
+	GROUP BY si.customer, si.posting_date, sii.item_group
+"""
+
+MARIADB_EXPLAIN = [
+	{'table': 'si', 'type': 'ALL', 'key': None, 'rows': 50000, 'Extra': 'Using where; Using temporary; Using filesort'},
+	{'table': 'sii', 'type': 'ref', 'key': 'parent', 'rows': 4, 'Extra': ''}
+]
+
+POSTGRES_PLAN = [{'Plan': {
+	'Node Type': 'Sort',
+	'Plan Rows': 800,
+	'Plans': [{
+		'Node Type': 'Hash Join',
+		'Plans': [
+			{'Node Type': 'Seq Scan', 'Relation Name': 'tabSales Invoice', 'Alias': 'si', 'Plan Rows': 50000},
+			{'Node Type': 'Index Scan', 'Relation Name': 'tabSales Invoice Item', 'Alias': 'sii', 'Index Name': 'parent', 'Plan Rows': 4}
+		]
+	}]
+}}]
+
+@pytest.fixture
+def parsed():
+	parsed = ParsedQuery(QUERY)
+	return parsed, advisor.get_table_aliases(parsed)
+
+def explain(monkeypatch, result):
+	monkeypatch.setattr(frappe.local.db, 'sql', lambda query, values=None, **kwargs: result)
+
+def test_mariadb_plan_is_normalized(monkeypatch):
+	explain(monkeypatch, MARIADB_EXPLAIN)
+	plan = advisor.get_query_plan(QUERY, None)
+	assert [(step['alias'], step['access'], step['rows']) for step in plan] == [('si', 'ALL', 50000), ('sii', 'ref', 4)]
+	assert plan[0]['full_scan'] and plan[0]['filesort'] and plan[0]['temporary']
+	assert not (plan[1]['full_scan'] or plan[1]['filesort'] or plan[1]['temporary'])
+
+def test_postgres_plan_is_flattened(monkeypatch):
+	explain(monkeypatch, [(json.dumps(POSTGRES_PLAN),)])
+	plan = advisor.get_query_plan(QUERY, None, 'postgres')
+	assert [(step['alias'], step['access']) for step in plan] == [(None, 'Sort'), ('si', 'Seq Scan'), ('sii', 'Index Scan')]
+	assert plan[0]['filesort'] and plan[1]['full_scan'] and plan[2]['key'] == 'parent'
+
+def test_findings_rate_scans_by_table_size():
+	findings = advisor.get_plan_findings([
+		dict(alias='si', table='si', rows=50000, full_scan=True, filesort=True, temporary=False),
+		dict(alias='tiny', table='tiny', rows=10, full_scan=True, filesort=False, temporary=False)
+	])
+	assert [(f['alias'], f['issue'], f['severity']) for f in findings] == [
+		('si', 'full_scan', 'high'), ('si', 'filesort', 'medium'), ('tiny', 'full_scan', 'low')
+	]
+
+def test_aliases_and_columns_are_resolved(parsed):
+	parsed, aliases = parsed
+	assert aliases == {'si': 'tabSales Invoice', 'sii': 'tabSales Invoice Item'}
+	assert advisor.resolve_column('si.customer', parsed, aliases) == ('si', 'customer')
+	# Output aliases are followed to their column
+	assert advisor.resolve_column('grp', parsed, aliases) == ('sii', 'item_group')
+	# Computed fields cannot use an index; bare names that are not output columns are ambiguous in a join
+	assert advisor.resolve_column('amount', parsed, aliases) is None
+	assert advisor.resolve_column('customer', parsed, aliases) == ('si', 'customer')
+	assert advisor.resolve_column('docstatus', parsed, aliases) is None
+
+def advisor_steps():
+	return [dict(alias='si', table='si', key=None, rows=50000, full_scan=True, filesort=True, temporary=True)]
+
+def test_indexes_put_equality_columns_first(monkeypatch, parsed):
+	_, aliases = parsed
+	monkeypatch.setattr(advisor, 'get_existing_indexes', lambda table, db_type='mariadb': [['customer', 'posting_date']])
+	columns = [
+		('si', 'docstatus', 'equality'),
+		('si', 'posting_date', 'range'),
+		('si', 'customer', 'grouping'),
+		('sii', 'item_group', 'equality')
+	]
+	findings = advisor.get_plan_findings(advisor_steps()) + advisor.get_filter_findings([('si', 'remarks', 'like')])
+	suggestions = advisor.suggest_indexes(advisor_steps(), findings, columns, aliases)
+	assert [s['columns'] for s in suggestions] == [['docstatus', 'posting_date'], ['docstatus', 'customer']]
+	assert suggestions[0]['sql'] == "CREATE INDEX `jmit_docstatus_posting_date` ON `tabSales Invoice` (`docstatus`, `posting_date`)"
+
+	# An index that already starts with the columns is not suggested again
+	monkeypatch.setattr(advisor, 'get_existing_indexes', lambda table, db_type='mariadb': [['docstatus', 'posting_date', 'name']])
+	assert [s['columns'] for s in advisor.suggest_indexes(advisor_steps(), findings, columns, aliases)] == [['docstatus', 'customer']]
+
+def test_plan_regressions():
+	previous = [
+		{'alias': 'si', 'access': 'range', 'key': 'posting_date', 'rows': 1000, 'full_scan': False},
+		{'alias': 'sii', 'access': 'ref', 'key': 'parent', 'rows': 4, 'full_scan': False}
+	]
+	current = [
+		{'alias': 'si', 'access': 'ALL', 'key': None, 'rows': 50000, 'full_scan': True},
+		{'alias': 'sii', 'access': 'ref', 'key': 'item_code', 'rows': 5, 'full_scan': False}
+	]
+	messages = [r['message'] for r in advisor.compare_plans(previous, current)]
+	assert messages == [
+		"si was read with range and is now fully scanned",
+		"Estimated rows read from si grew from 1000 to 50000",
+		"sii now uses index item_code instead of parent"
+	]
+	assert advisor.compare_plans(previous, previous) == []
@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+
+import datasets
+import frappe
+import pytest
+
+from jmit_report_builder.api import batch, query_engine, routing
+from jmit_report_builder.api.rows import as_dicts
+
+class InlinePool:
+	"""Runs pool tasks on the calling thread"""
+	def run(self, fn, *args):
+		return fn(*args)
+
+@pytest.fixture
+def report(monkeypatch, sales):
+	config = {
+		'query': datasets.get_query(),
+		'grouping_fields': ['region'],
+		'subtotal_fields': [{'field': 'qty', 'operation': 'SUM'}]
+	}
+	monkeypatch.setattr(query_engine, 'get_report_config', lambda name, filters=None: dict(config))
+	return config
+
+@pytest.fixture
+def replica_calls(monkeypatch):
+	calls = []
+
+	@contextmanager
+	def read_replica(max_lag=None):
+		calls.append(max_lag)
+		yield None
+
+	monkeypatch.setattr(routing, 'read_replica', read_replica)
+	return calls
+
+def test_requested_settings_only_lower_the_site_settings():
+	frappe.conf.update(jmit_report_batch_connections=3, jmit_report_batch_processes=2)
+	connections, processes = batch.get_batch_settings()
+	assert (connections, processes) == (3, 2)
+	assert batch.clamp_setting(None, connections) == 3
+	assert batch.clamp_setting(1, connections) == 1
+	assert batch.clamp_setting(64, connections) == 3
+	assert batch.clamp_setting('0', processes) == 2
+
+def test_process_pool_is_shared(monkeypatch):
+	monkeypatch.setattr(batch, '_process_pool', None)
+	pool = batch.get_process_pool(2)
+	try:
+		assert batch.get_process_pool(8) is pool
+		assert pool._max_workers == 2
+	finally:
+		pool.shutdown()
+
+def test_batch_report_groups_rows_on_the_pool(report, replica_calls):
+	result = batch.run_batch_report(0, {'report_name': 'Sales', 'filters': None}, InlinePool())
+	expected = as_dicts(query_engine.run_query_config(report)['data'])
+	assert result['success'], result.get('message')
+	assert result['data'] == expected
+	assert result['count'] == len(expected)
+	assert 'partial' not in result
+	assert replica_calls == [None]
+
+def test_batch_report_runs_under_the_limits(report, replica_calls):
+	frappe.conf.update(jmit_report_max_rows=50)
+	result = batch.run_batch_report(2, {'report_name': 'Sales', 'filters': None}, InlinePool())
+	assert result['success'], result.get('message')
+	assert result['partial'] is True
+	assert result['limit']['reason'] == 'max_rows'
+	assert sum(row['_record_count'] for row in result['data'] if row.get('_type') == 'GROUP_HEADER') == 50
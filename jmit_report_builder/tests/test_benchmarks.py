@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+import datasets
+
+from jmit_report_builder.tests.conftest import BENCHMARK_DIR
+
+def run_benchmarks(*args):
+	# run.py installs its own frappe stub, so it runs in a separate interpreter
+	return subprocess.run(
+		[sys.executable, os.path.join(BENCHMARK_DIR, 'run.py'), *args],
+		capture_output=True, text=True
+	)
+
+def test_datasets_are_deterministic():
+	data = datasets.generate_rows(500, cardinality=7, seed=3)
+	assert data == datasets.generate_rows(500, cardinality=7, seed=3)
+	assert data != datasets.generate_rows(500, cardinality=7, seed=4)
+	assert len({row['customer'] for row in data}) == 7
+	assert list(data[0]) == [column['field_name'] for column in datasets.COLUMNS]
+	assert any(row['amount'] is None for row in data)
+
+def test_run_and_compare(tmp_path):
+	baseline = tmp_path / 'baseline.json'
+	process = run_benchmarks(
+		'run', '--rows', '300', '--cardinality', '5', '--repeat', '1',
+		'--benchmarks', 'apply_filters,apply_grouping_and_subtotals,export_to_csv',
+		'--output', str(baseline)
+	)
+	assert process.returncode == 0, process.stderr
+	results = json.loads(baseline.read_text())
+	assert sorted(results['results']) == [
+		'apply_filters[rows=300,cardinality=5]',
+		'apply_grouping_and_subtotals[rows=300,cardinality=5]',
+		'export_to_csv[rows=300,cardinality=5]'
+	]
+
+	assert run_benchmarks('compare', str(baseline), str(baseline)).returncode == 0
+
+	# A baseline ten times faster makes every benchmark a regression
+	for result in results['results'].values():
+		result['min'] /= 10
+	faster = tmp_path / 'faster.json'
+	faster.write_text(json.dumps(results))
+	process = run_benchmarks('compare', str(faster), str(baseline), '--min-delta', '0')
+	assert process.returncode == 1
+	assert '3 benchmark(s) regressed' in process.stdout
+
+def test_unknown_benchmarks_are_rejected():
+	process = run_benchmarks('run', '--rows', '10', '--benchmarks', 'no_such_benchmark')
+	assert process.returncode == 2
+	assert 'unknown benchmarks: no_such_benchmark' in process.stderr
@@ -0,0 +1,87 @@
+import datasets
+import frappe
+import pytest
+
+from jmit_report_builder.api import cache
+from jmit_report_builder.api.query_engine import execute_query
+
+CONFIG = {
+	'report_name': 'Sales',
+	'query': datasets.get_query(),
+	'grouping_fields': ['region'],
+	'subtotal_fields': [{'field': 'qty', 'operation': 'SUM'}]
+}
+
+@pytest.fixture(autouse=True)
+def backend():
+	backend = cache.LocalCacheBackend()
+	cache.set_backend(backend)
+	yield backend
+	cache.set_backend(None)
+
+def key(**config):
+	return cache.make_cache_key(dict(CONFIG, **config))
+
+def test_key_ignores_whitespace_in_the_query():
+	assert key(query=CONFIG['query'] + ' ;\n') == key()
+
+@pytest.mark.parametrize('option', [
+	{'presorted': True},
+	{'aggregation_backend': 'columnar'},
+	{'summary_only': True},
+	{'filters': [{'field': 'region', 'operator': '=', 'value': 'North'}]}
+])
+def test_key_covers_options_that_change_the_result(option):
+	assert key(**option) != key()
+
+def test_default_backend_shares_the_key_of_python():
+	assert key(aggregation_backend='python') == key()
+
+def test_results_are_served_from_the_cache_until_invalidated(sales):
+	first = execute_query(dict(CONFIG, cache_ttl=60))
+	frappe.db.sql(f"DELETE FROM `{datasets.TABLE}`")
+	assert execute_query(dict(CONFIG, cache_ttl=60)) == first
+
+	assert cache.clear_report_cache('Sales')['success']
+	assert execute_query(dict(CONFIG, cache_ttl=60))['count'] == 0
+
+def test_clearing_needs_permission(monkeypatch, backend):
+	def deny(*args, **kwargs):
+		raise frappe.PermissionError('Not permitted')
+	backend.set('entry', {'success': True}, 60)
+
+	monkeypatch.setattr(frappe, 'has_permission', deny)
+	assert not cache.clear_report_cache('Sales')['success']
+	monkeypatch.setattr(frappe, 'only_for', deny)
+	assert not cache.clear_report_cache()['success']
+	assert backend.get('entry') == {'success': True}
+
+def test_redis_backend_evicts_the_least_recently_used_entry():
+	backend = cache.RedisCacheBackend(cache.FakeRedis(), max_entries=2)
+	backend.set('a', 1, 60)
+	backend.set('b', 2, 60)
+	backend.get('a')
+	backend.set('c', 3, 60)
+	assert (backend.get('a'), backend.get('b'), backend.get('c')) == (1, None, 3)
+
+def test_sites_do_not_share_keys_or_backends(monkeypatch, backend):
+	first = key()
+	cache.invalidate_report('Sales')
+	monkeypatch.setattr(frappe.local, 'site', 'other.site')
+	assert key() != first
+	assert cache.get_generation('Sales') == 0
+	frappe.conf.update(jmit_report_cache_max_entries=3)
+	try:
+		assert cache.get_backend() is not backend
+		assert cache.get_backend().max_entries == 3
+	finally:
+		cache.set_backend(None)
+
+def test_redis_backends_of_two_sites_keep_their_own_entries():
+	client = cache.FakeRedis()
+	first = cache.RedisCacheBackend(client, prefix=f"{cache.KEY_PREFIX}:one")
+	second = cache.RedisCacheBackend(client, prefix=f"{cache.KEY_PREFIX}:two")
+	first.set('a', 1, 60)
+	second.set('b', 2, 60)
+	second.clear()
+	assert (first.get('a'), second.get('b')) == (1, None)
@@ -0,0 +1,72 @@
+import datasets
+import pytest
+
+from jmit_report_builder.api.query_engine import apply_grouping_and_subtotals
+from jmit_report_builder.api.rows import to_records
+
+np = pytest.importorskip('numpy')
+from jmit_report_builder.api import columnar
+
+SUBTOTAL_FIELDS = [
+	{'field': 'qty', 'operation': 'SUM'},
+	{'field': 'amount', 'operation': 'AVG'},
+	{'field': 'amount', 'operation': 'MAX'},
+	{'field': 'rate', 'operation': 'MIN'},
+	{'field': 'qty', 'operation': 'COUNT'}
+]
+
+def assert_same_groups(actual, expected):
+	assert len(actual) == len(expected)
+	for row, other in zip(actual, expected):
+		if isinstance(other, dict) and other.get('_type') == 'SUBTOTAL':
+			assert row == {key: pytest.approx(value) if isinstance(value, float) else value for key, value in other.items()}
+		else:
+			assert row is other or row == other
+
+def as_records(data):
+	fields = list(data[0])
+	return to_records(fields, [[row.get(field) for field in fields] for row in data])
+
+@pytest.mark.parametrize('convert', [list, as_records])
+@pytest.mark.parametrize('fields', [['region'], ['region', 'customer']])
+def test_columnar_matches_the_row_engine(convert, fields):
+	data = convert(datasets.generate_rows(500, cardinality=7, seed=11))
+	expected = apply_grouping_and_subtotals(data, fields, SUBTOTAL_FIELDS)
+	assert_same_groups(columnar.apply_grouping_columnar(data, fields, SUBTOTAL_FIELDS), expected)
+
+def test_null_keys_empty_values_and_missing_fields():
+	data = [
+		{'region': None, 'qty': '', 'amount': None, 'rate': '2.5'},
+		{'region': 'East', 'qty': 3, 'amount': 0, 'rate': 1},
+		{'qty': 4, 'amount': 10},
+		{'region': None, 'qty': '7', 'amount': 6, 'rate': None}
+	]
+	expected = apply_grouping_and_subtotals(data, ['region'], SUBTOTAL_FIELDS)
+	result = columnar.apply_grouping_columnar(data, ['region'], SUBTOTAL_FIELDS)
+	assert_same_groups(result, expected)
+	assert [row['_group_key'] for row in result if row.get('_type') == 'GROUP_HEADER'] == [
+		{'region': None}, {'region': 'East'}, {'region': ''}
+	]
+
+def test_factorize_numbers_groups_by_first_occurrence():
+	data = [{'a': 'y', 'b': 1}, {'a': 'x', 'b': 1}, {'a': 'y', 'b': 1}, {'a': 'y', 'b': 2}]
+	codes, keys = columnar.factorize(data, ['a', 'b'])
+	assert codes.tolist() == [0, 1, 0, 2]
+	assert keys == [('y', 1), ('x', 1), ('y', 2)]
+
+def test_float_column_reads_empty_values_as_absent_zeros():
+	for column in ([1.5, None, 0, 2], [1.5, '', 0, '2']):
+		values, present = columnar.to_float_column(column)
+		assert values.tolist() == [1.5, 0.0, 0.0, 2.0]
+		assert present.tolist() == [True, False, False, True]
+
+def test_the_string_zero_is_counted_by_avg():
+	values, present = columnar.to_float_column(['0', '4', None])
+	assert values.tolist() == [0.0, 4.0, 0.0]
+	assert present.tolist() == [True, True, False]
+
+	data = [{'region': 'East', 'amount': value} for value in ('0', '4', '', '0.0')]
+	subtotals = [{'field': 'amount', 'operation': 'AVG'}]
+	expected = apply_grouping_and_subtotals(data, ['region'], subtotals)
+	assert_same_groups(columnar.apply_grouping_columnar(data, ['region'], subtotals), expected)
+	assert expected[-1]['amount_subtotal'] == pytest.approx(4 / 3)
@@ -0,0 +1,130 @@
+import csv
+import gzip
+import io
+import re
+
+import datasets
+import pytest
+
+from jmit_report_builder.api import export
+from jmit_report_builder.api.query_engine import execute_query, iter_config_batches
+
+FIELDS = ['region', 'customer', 'item_group', 'posting_date', 'status', 'qty', 'rate', 'amount']
+
+COLUMNS = [
+	{'field_name': 'region', 'display_label': 'Region', 'field_type': 'Data'},
+	{'field_name': 'customer', 'display_label': 'Customer', 'field_type': 'Data'},
+	{'field_name': 'qty', 'display_label': 'Qty', 'field_type': 'Int'},
+	{'field_name': 'amount', 'display_label': 'Amount', 'field_type': 'Currency'}
+]
+
+GROUPED = {
+	'query': datasets.get_query() + " ORDER BY region",
+	'grouping_fields': ['region'],
+	'subtotal_fields': [{'field': 'qty', 'operation': 'SUM'}, {'field': 'amount', 'operation': 'SUM'}]
+}
+
+def grouped_rows(**config):
+	result = execute_query(dict(GROUPED, **config))
+	assert result['success'], result.get('message')
+	return result['data']
+
+def cell(value):
+	return '' if value is None else str(value)
+
+def first_subtotal(rows):
+	return next(row for row in rows if row.get('_type') == 'SUBTOTAL')
+
+def test_grouped_csv_writes_group_rows_under_the_detail_header(sales):
+	rows = grouped_rows()
+	lines = list(csv.reader(io.StringIO(export.export_to_csv('Sales', rows)['content'])))
+
+	assert lines[0] == FIELDS
+	assert len(lines) == len(rows) + 1
+	header, detail = rows[0], rows[1]
+	assert lines[1] == [header['_group_key']['region']] + [''] * (len(FIELDS) - 1)
+	assert lines[2] == [cell(detail[field]) for field in FIELDS]
+
+	subtotal = first_subtotal(rows)
+	line = dict(zip(FIELDS, lines[rows.index(subtotal) + 1]))
+	assert line['region'] == subtotal['_group_key']['region']
+	assert float(line['qty']) == subtotal['qty_subtotal']
+	assert float(line['amount']) == pytest.approx(subtotal['amount_subtotal'])
+	assert line['customer'] == ''
+
+def test_csv_file_streams_a_grouped_report_with_its_columns(sales):
+	output = io.BytesIO()
+	count = export.write_csv_file(iter_config_batches(dict(GROUPED, batch_size=16)), output, True, COLUMNS)
+	lines = list(csv.reader(io.StringIO(gzip.decompress(output.getvalue()).decode('utf-8'))))
+
+	rows = grouped_rows()
+	assert count == len(rows)
+	assert lines[0] == ['Region', 'Customer', 'Qty', 'Amount']
+	subtotal = first_subtotal(rows)
+	assert lines[rows.index(subtotal) + 1][:3] == [subtotal['_group_key']['region'], '', cell(subtotal['qty_subtotal'])]
+
+def test_csv_sections_follow_the_result_sets():
+	batches = [[{'name': 'A', 'qty': 1}], [{'item': 'X'}, {'item': 'Y'}]]
+	output = io.StringIO()
+	assert export.write_csv(batches, output) == 3
+	assert output.getvalue().split('\r\n') == ['name,qty', 'A,1', '', 'item', 'X', 'Y', '']
+
+def test_grouped_xlsx_fills_group_rows(sales):
+	openpyxl = pytest.importorskip('openpyxl')
+	rows = grouped_rows()
+	output = io.BytesIO()
+	assert export.write_xlsx('Sales', [rows], output, COLUMNS) == len(rows)
+
+	sheet = openpyxl.load_workbook(output).active
+	lines = list(sheet.iter_rows(values_only=True))
+	assert lines[2] == ('Region', 'Customer', 'Qty', 'Amount')
+	assert lines[3] == (rows[0]['_group_key']['region'], None, None, None)
+	subtotal = first_subtotal(rows)
+	region, customer, qty, amount = lines[rows.index(subtotal) + 3]
+	assert (region, customer, qty) == (subtotal['_group_key']['region'], None, subtotal['qty_subtotal'])
+	assert amount == pytest.approx(subtotal['amount_subtotal'])
+	assert sheet.cell(row=4, column=1).font.bold
+
+def html_rows(document, row_class):
+	return [
+		re.findall(r'<td>(.*?)</td>', row)
+		for row in re.findall(rf'<tr class="{row_class}">(.*?)</tr>', document)
+	]
+
+def test_grouped_html_fills_and_formats_group_rows(sales):
+	rows = grouped_rows()
+	document = export.generate_html_from_data('Sales', rows, COLUMNS)
+	headers = [row for row in rows if row.get('_type') == 'GROUP_HEADER']
+	subtotals = [row for row in rows if row.get('_type') == 'SUBTOTAL']
+
+	assert html_rows(document, 'group-header') == [[row['_group_key']['region'], '', '', ''] for row in headers]
+	region, customer, qty, amount = html_rows(document, 'subtotal')[0]
+	assert (region, customer, qty) == (subtotals[0]['_group_key']['region'], '', str(subtotals[0]['qty_subtotal']))
+	assert amount == f"${subtotals[0]['amount_subtotal']:,.2f}"
+
+def test_html_chunks_split_the_rows(sales):
+	rows = grouped_rows()
+	chunks = list(export.iter_html_chunks('Sales', [rows[:50], rows[50:]], COLUMNS, rows_per_chunk=100))
+	assert len(chunks) == -(-len(rows) // 100)
+	assert sum(chunk.count('<tr') - 1 for chunk in chunks) == len(rows)
+
+def test_html_tables_follow_the_result_sets():
+	batches = [[{'name': 'A', 'qty': 1}], [{'item': 'X'}, {'item': 'Y'}]]
+	document = ''.join(export.iter_html_chunks('Sales', batches, rows_per_chunk=None))
+	tables = re.findall(r'<table>(.*?)</table>', document, re.DOTALL)
+	assert [re.findall(r'<t[hd]>(.*?)</t[hd]>', table) for table in tables] == [['name', 'qty', 'A', '1'], ['item', 'X', 'Y']]
+	# A chunk that starts with the next result set has its header
+	chunks = list(export.iter_html_chunks('Sales', batches, rows_per_chunk=1))
+	assert [re.findall(r'<th>(.*?)</th>', chunk) for chunk in chunks] == [['name', 'qty'], ['item'], ['item']]
+
+def test_group_key_goes_to_the_first_column_when_not_exported():
+	row = {'_type': 'GROUP_HEADER', '_group_key': {'region': 'North', 'status': 'Paid'}, '_record_count': 2}
+	assert export.get_row_values(row, ['customer', 'qty']) == ['region: North, status: Paid', None]
+
+def test_summary_without_details_exports_grouping_and_subtotal_fields():
+	rows = [
+		{'_type': 'GROUP_HEADER', '_group_key': {'region': 'North'}, '_record_count': 2},
+		{'_type': 'SUBTOTAL', '_group_key': {'region': 'North'}, 'qty_subtotal': 7}
+	]
+	assert export.get_export_headers(rows) == (['region', 'qty'], ['region', 'qty'])
+	assert export.export_to_csv('Sales', rows)['content'].splitlines() == ['region,qty', 'North,', 'North,7']
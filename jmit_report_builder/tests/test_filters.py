@@ -0,0 +1,59 @@
+import frappe
+import pytest
+
+from jmit_report_builder.api import filters
+from jmit_report_builder.api.filters import compile_query
+
+QUERY = "SELECT name, region, qty FROM `tabOrder`"
+
+@pytest.fixture(autouse=True)
+def orders():
+	filters.statement_cache.clear()
+	filters.parse_cache.clear()
+	frappe.db.sql("CREATE TABLE `tabOrder` (name, region, qty)")
+	frappe.db.executemany("INSERT INTO `tabOrder` VALUES (%s, %s, %s)", [
+		('A', 'North', 1), ('B', "O'Brien", 5), ('C', 'South', 10), ('D', '50% off', 20)
+	])
+
+def names(query, report_filters):
+	sql, values = compile_query(query, report_filters, 'Orders')
+	return [row[0] for row in frappe.db.sql(sql, values)]
+
+def test_values_are_bound_not_interpolated():
+	sql, values = compile_query(QUERY, [{'field': 'region', 'operator': '=', 'value': "x' OR '1'='1"}])
+	assert sql == QUERY + " WHERE region = %s"
+	assert values == ("x' OR '1'='1",)
+	assert names(QUERY, [{'field': 'region', 'value': "x' OR '1'='1"}]) == []
+	assert names(QUERY, [{'field': 'region', 'value': "O'Brien"}]) == ['B']
+
+@pytest.mark.parametrize('report_filters, expected', [
+	([{'field': 'region', 'operator': 'in', 'value': 'North, South'}], ['A', 'C']),
+	([{'field': 'region', 'operator': 'NOT IN', 'value': ['North', 'South']}], ['B', 'D']),
+	([{'field': 'region', 'operator': 'IN', 'value': ''}], []),
+	([{'field': 'region', 'operator': 'NOT IN', 'value': ''}], ['A', 'B', 'C', 'D']),
+	([{'field': 'region', 'operator': 'LIKE', 'value': 'outh'}], ['C']),
+	([{'field': 'qty', 'operator': '>=', 'value': 5}, {'field': 'qty', 'operator': '<', 'value': 20}], ['B', 'C'])
+])
+def test_operators(report_filters, expected):
+	assert names(QUERY, report_filters) == expected
+
+def test_literal_percent_in_the_query_survives_binding():
+	query = "SELECT name FROM `tabOrder` WHERE region LIKE '%off'"
+	assert names(query, [{'field': 'qty', 'operator': '>', 'value': 1}]) == ['D']
+
+@pytest.mark.parametrize('report_filter', [
+	{'field': 'region; DROP TABLE `tabOrder`', 'value': 1},
+	{'field': 'region', 'operator': 'OR 1=1 --', 'value': 1}
+])
+def test_unsafe_fields_and_operators_are_rejected(report_filter):
+	with pytest.raises(frappe.ValidationError):
+		compile_query(QUERY, [report_filter])
+
+def test_statement_text_is_reused_across_values():
+	first, _ = compile_query(QUERY, [{'field': 'region', 'value': 'North'}], 'Orders')
+	second, values = compile_query(QUERY, [{'field': 'region', 'value': 'South'}], 'Orders')
+	assert second is first and values == ('South',)
+	third, _ = compile_query(QUERY, [{'field': 'region', 'operator': 'IN', 'value': 'a,b'}], 'Orders')
+	assert third.endswith("region IN (%s, %s)")
+	filters.statement_cache.clear('Orders')
+	assert compile_query(QUERY, [{'field': 'region', 'value': 'North'}], 'Orders')[0] is not first
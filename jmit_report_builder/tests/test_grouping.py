@@ -0,0 +1,140 @@
+import datasets
+import pytest
+from decimal import Decimal
+
+from jmit_report_builder.api.grouping import iter_sorted_groups, is_sorted_by, build_rollup_query, map_rollup_rows
+from jmit_report_builder.api.query_engine import apply_grouping_and_subtotals
+from jmit_report_builder.api.rows import to_records
+
+SUBTOTAL_FIELDS = [
+	{'field': 'qty', 'operation': 'SUM'},
+	{'field': 'amount', 'operation': 'SUM'},
+	{'field': 'rate', 'operation': 'AVG'},
+	{'field': 'amount', 'operation': 'MAX'},
+	{'field': 'qty', 'operation': 'MIN'},
+	{'field': 'rate', 'operation': 'COUNT'}
+]
+
+def sorted_rows(rows=300, fields=('region', 'customer')):
+	return sorted(datasets.generate_rows(rows, cardinality=4, seed=3), key=lambda row: [row[f] for f in fields])
+
+def assert_same_groups(actual, expected):
+	"""Compare grouped rows; sums may differ in the last bit with the summation order"""
+	assert len(actual) == len(expected)
+	for row, other in zip(actual, expected):
+		if isinstance(other, dict) and other.get('_type') == 'SUBTOTAL':
+			assert row == {key: pytest.approx(value) if isinstance(value, float) else value for key, value in other.items()}
+		else:
+			assert row == other
+
+@pytest.mark.parametrize('fields', [['region'], ['region', 'customer']])
+def test_single_pass_matches_the_legacy_engine(fields):
+	data = sorted_rows(fields=fields)
+	expected = apply_grouping_and_subtotals(data, fields, SUBTOTAL_FIELDS)
+	assert_same_groups(list(iter_sorted_groups(data, fields, SUBTOTAL_FIELDS)), expected)
+
+def test_single_pass_matches_the_legacy_engine_on_records():
+	data = sorted_rows()
+	fields = list(data[0])
+	records = to_records(fields, [[row[field] for field in fields] for row in data])
+	expected = apply_grouping_and_subtotals(records, ['region'], SUBTOTAL_FIELDS)
+	assert_same_groups(list(iter_sorted_groups(records, ['region'], SUBTOTAL_FIELDS)), expected)
+
+def test_empty_values_follow_the_legacy_semantics():
+	data = [
+		{'region': 'North', 'amount': None},
+		{'region': 'North', 'amount': 10},
+		{'region': 'North', 'amount': 0}
+	]
+	subtotal_fields = [
+		{'field': 'amount', 'operation': 'AVG'},
+		{'field': 'amount', 'operation': 'MIN'},
+		{'field': 'amount', 'operation': 'COUNT'}
+	]
+	header, *details, subtotal = iter_sorted_groups(data, ['region'], subtotal_fields)
+	assert header == {'_type': 'GROUP_HEADER', '_group_key': {'region': 'North'}, '_record_count': 3}
+	assert details == data
+	assert subtotal == {'_type': 'SUBTOTAL', '_group_key': {'region': 'North'}, 'amount_subtotal': 3}
+	assert subtotal == apply_grouping_and_subtotals(data, ['region'], subtotal_fields)[-1]
+
+def test_groups_are_emitted_as_they_close():
+	def rows():
+		yield {'region': 'East', 'qty': 1}
+		yield {'region': 'West', 'qty': 2}
+		raise AssertionError('read past the first group')
+	groups = iter_sorted_groups(rows(), ['region'], [{'field': 'qty', 'operation': 'SUM'}])
+	assert [next(groups) for _ in range(3)][-1] == {'_type': 'SUBTOTAL', '_group_key': {'region': 'East'}, 'qty_subtotal': 1}
+
+@pytest.mark.parametrize('query, fields, expected', [
+	("SELECT * FROM t ORDER BY region, customer DESC", ['region', 'customer'], True),
+	("SELECT * FROM t ORDER BY t.region LIMIT 10", ['region'], True),
+	("SELECT * FROM t ORDER BY `region` ASC", ['region'], True),
+	("SELECT * FROM t ORDER BY customer, region", ['region'], False),
+	("SELECT * FROM (SELECT * FROM t ORDER BY region) x", ['region'], False),
+	("SELECT * FROM t", ['region'], False)
+])
+def test_is_sorted_by(query, fields, expected):
+	assert is_sorted_by(query, fields) is expected
+
+ROLLUP_SUBTOTALS = [{'field': 'amount', 'operation': 'SUM'}, {'field': 'qty', 'operation': 'COUNT'}]
+
+def mariadb_row(null_marker, region, count, amount):
+	return {
+		'_jmit_null_0': null_marker, 'region': region, '_record_count': count,
+		'_jmit_agg_0': amount, '_jmit_agg_1': count
+	}
+
+def test_rollup_rows_keep_a_null_group_apart_from_the_total():
+	# GROUP BY region IS NULL, region WITH ROLLUP over East (2 rows) and NULL (1 row)
+	rows = [
+		mariadb_row(0, 'East', 2, Decimal('30.50')),
+		mariadb_row(0, None, 2, Decimal('30.50')),
+		mariadb_row(1, None, 1, Decimal('4')),
+		mariadb_row(1, None, 1, Decimal('4')),
+		mariadb_row(None, None, 3, Decimal('34.50'))
+	]
+	assert map_rollup_rows(rows, ['region'], ROLLUP_SUBTOTALS) == [
+		{'_type': 'GROUP_HEADER', '_group_key': {'region': 'East'}, '_record_count': 2},
+		{'_type': 'SUBTOTAL', '_group_key': {'region': 'East'}, 'amount_subtotal': 30.5, 'qty_subtotal': 2},
+		{'_type': 'GROUP_HEADER', '_group_key': {'region': None}, '_record_count': 1},
+		{'_type': 'SUBTOTAL', '_group_key': {'region': None}, 'amount_subtotal': 4.0, 'qty_subtotal': 1},
+		{
+			'_type': 'SUBTOTAL', '_group_key': {}, '_rollup_level': 0, '_record_count': 3,
+			'amount_subtotal': 34.5, 'qty_subtotal': 3
+		}
+	]
+
+def test_rollup_subtotals_have_the_python_engine_types():
+	rows = [mariadb_row(0, 'East', 2, Decimal('30.50')), mariadb_row(None, None, 2, Decimal('30.50'))]
+	subtotal_fields = [
+		{'field': 'amount', 'operation': 'SUM'},
+		{'field': 'qty', 'operation': 'COUNT'}
+	]
+	header, subtotal, total = map_rollup_rows(rows, ['region'], subtotal_fields)
+	assert type(header['_record_count']) is int
+	assert subtotal == {'_type': 'SUBTOTAL', '_group_key': {'region': 'East'}, 'amount_subtotal': 30.5, 'qty_subtotal': 2}
+	assert type(subtotal['amount_subtotal']) is float and type(subtotal['qty_subtotal']) is int
+	data = [{'region': 'East', 'amount': 10.25, 'qty': 1}, {'region': 'East', 'amount': 20.25, 'qty': 1}]
+	assert subtotal == apply_grouping_and_subtotals(data, ['region'], subtotal_fields)[-1]
+
+def test_postgres_rollup_rows_use_the_grouping_bits():
+	rows = [
+		{'region': 'East', 'customer': 'A', '_jmit_grouping': 0, '_record_count': 1, '_jmit_agg_0': 5, '_jmit_agg_1': 1},
+		{'region': None, 'customer': None, '_jmit_grouping': 0, '_record_count': 2, '_jmit_agg_0': 7, '_jmit_agg_1': 2},
+		{'region': 'East', 'customer': None, '_jmit_grouping': 1, '_record_count': 1, '_jmit_agg_0': 5, '_jmit_agg_1': 1},
+		{'region': None, 'customer': None, '_jmit_grouping': 3, '_record_count': 3, '_jmit_agg_0': 12, '_jmit_agg_1': 3}
+	]
+	result = map_rollup_rows(rows, ['region', 'customer'], ROLLUP_SUBTOTALS, 'postgres')
+	assert [(row['_type'], row['_group_key'], row.get('_rollup_level')) for row in result] == [
+		('GROUP_HEADER', {'region': 'East', 'customer': 'A'}, None),
+		('SUBTOTAL', {'region': 'East', 'customer': 'A'}, None),
+		('GROUP_HEADER', {'region': None, 'customer': None}, None),
+		('SUBTOTAL', {'region': None, 'customer': None}, None),
+		('SUBTOTAL', {'region': 'East'}, 1),
+		('SUBTOTAL', {}, 0)
+	]
+	assert (result[-1]['amount_subtotal'], result[-1]['qty_subtotal']) == (12.0, 3)
+
+def test_rollup_query_rejects_unsafe_field_names():
+	with pytest.raises(ValueError):
+		build_rollup_query("SELECT * FROM t", ['region`; DROP TABLE t; --'], [])
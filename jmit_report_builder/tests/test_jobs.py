@@ -0,0 +1,126 @@
+import csv
+import gzip
+import io
+import json
+from contextlib import contextmanager
+
+import datasets
+import frappe
+import pytest
+
+from jmit_report_builder.api import governor, jobs
+from jmit_report_builder.api.query_engine import execute_query
+
+@pytest.fixture
+def job(monkeypatch, sales):
+	doc = frappe.get_doc({
+		'doctype': 'JMIT Report Job',
+		'name': 'JOB-0001',
+		'owner': 'Administrator',
+		'report_name': None,
+		'job_type': 'Execute',
+		'status': 'Queued',
+		'query_config': json.dumps({'query': datasets.get_query(), 'batch_size': 50})
+	})
+	get_doc = frappe.get_doc
+	monkeypatch.setattr(frappe, 'get_doc', lambda doctype, *args: doc if doctype == 'JMIT Report Job' else get_doc(doctype, *args))
+	monkeypatch.setattr(frappe.local.db, 'set_value', lambda doctype, name, values, **kwargs: doc.update(values))
+	# Running jobs register their connection so cancel_report_job can interrupt it
+	monkeypatch.setattr(governor, 'get_connection_id', lambda: 7)
+	return doc
+
+@pytest.fixture
+def timeouts(monkeypatch):
+	"""Record the statement timeouts, which SQLite cannot set"""
+	seconds = []
+
+	@contextmanager
+	def statement_timeout(value):
+		seconds.append(value)
+		yield
+
+	monkeypatch.setattr(governor, 'statement_timeout', statement_timeout)
+	return seconds
+
+def expected_rows():
+	return execute_query({'query': datasets.get_query()})['data']
+
+def read_artifact(job):
+	with open(frappe.get_site_path('private', 'files', job.file_url.rsplit('/', 1)[1]), 'rb') as f:
+		return f.read()
+
+def test_execute_job_writes_the_rows_as_json(job, sales, timeouts):
+	jobs.run_report_job(job.name)
+	assert job.status == 'Completed'
+	assert job.rows_fetched == len(sales)
+	assert json.loads(read_artifact(job)) == expected_rows()
+	assert frappe.cache().get_value(f"{jobs.PROGRESS_KEY}:{job.name}") is None
+
+def test_csv_job_writes_a_compressed_file(job, sales, timeouts):
+	job.job_type = 'CSV'
+	jobs.run_report_job(job.name)
+	assert job.status == 'Completed'
+	rows = list(csv.reader(io.StringIO(gzip.decompress(read_artifact(job)).decode('utf-8-sig'))))
+	assert rows[0] == list(expected_rows()[0])
+	assert len(rows) == len(sales) + 1
+
+def test_cancelled_job_stops_at_the_next_batch(job, monkeypatch, timeouts):
+	cancelled = iter([False, False, True])
+	monkeypatch.setattr(jobs, 'is_cancelled', lambda job_name: next(cancelled, True))
+	jobs.run_report_job(job.name)
+	assert job.status == 'Cancelled'
+	assert job.rows_fetched == 50
+	assert not job.file_url
+
+def test_queued_job_is_cancelled_without_running(job):
+	assert jobs.cancel_report_job(job.name)['success']
+	assert job.status == 'Cancelled'
+	jobs.run_report_job(job.name)
+	assert job.status == 'Cancelled'
+	assert not job.started_at
+
+def test_jobs_per_user_are_limited(monkeypatch):
+	monkeypatch.setattr(frappe.local.db, 'count', lambda *args, **kwargs: jobs.DEFAULT_MAX_JOBS_PER_USER)
+	result = jobs.enqueue_report_job('Sales')
+	assert not result['success']
+	assert 'already have 2 report jobs' in result['message']
+
+def test_other_users_cannot_read_a_job(job, monkeypatch):
+	monkeypatch.setattr(frappe.session, 'user', 'someone@example.com')
+	monkeypatch.setattr(frappe, 'get_roles', lambda *args: ['Report User'])
+	assert jobs.get_report_job(job.name) == {'success': False, 'message': 'Not permitted'}
+	assert not jobs.cancel_report_job(job.name)['success']
+	assert job.status == 'Queued'
+
+def test_jobs_keep_the_site_limits(job, sales, timeouts):
+	frappe.conf.update(jmit_report_max_rows=120)
+	jobs.run_report_job(job.name)
+	assert timeouts == [jobs.JOB_TIMEOUT]
+	assert job.status == 'Completed'
+	assert job.rows_fetched == 120
+	assert 'max_rows limit of 120' in job.error
+	assert len(json.loads(read_artifact(job))) == 120
+
+@pytest.mark.parametrize('site, ceiling, report, expected', [
+	(60, 0, 0, 60),
+	(60, 900, 0, 900),
+	(60, 900, 300, 300),
+	(0, 0, 0, jobs.JOB_TIMEOUT),
+	(0, 7200, 0, jobs.JOB_TIMEOUT)
+])
+def test_job_time_limit(site, ceiling, report, expected):
+	frappe.conf.update(jmit_report_max_execution_time=site, jmit_report_job_max_execution_time=ceiling)
+	limits = jobs.get_job_limits({'limits': {'max_execution_time': report}})
+	assert limits['max_execution_time'] == expected
+
+def test_racing_requests_over_the_limit_withdraw_their_job(monkeypatch):
+	# Another request committed its job between the check and the insert
+	counts = iter([1, jobs.DEFAULT_MAX_JOBS_PER_USER + 1])
+	deleted = []
+	monkeypatch.setattr(frappe.local.db, 'count', lambda doctype, filters: next(counts))
+	monkeypatch.setattr(frappe, 'delete_doc', lambda doctype, name, **kwargs: deleted.append(name), raising=False)
+	monkeypatch.setattr(frappe, 'enqueue', lambda *args, **kwargs: pytest.fail('job was enqueued'), raising=False)
+	result = jobs.enqueue_report_job('Sales')
+	assert not result['success']
+	assert 'already have 2 report jobs' in result['message']
+	assert len(deleted) == 1
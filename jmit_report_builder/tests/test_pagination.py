@@ -0,0 +1,62 @@
+import frappe
+import pytest
+
+from jmit_report_builder.api.pagination import execute_query_page
+
+ROWS = [
+	('INV-1', 'North', 5), ('INV-2', 'North', 5), ('INV-3', None, 5), ('INV-4', 'South', None),
+	('INV-5', None, None), ('INV-6', 'North', 1), ('INV-7', 'South', 5), ('INV-8', None, 1)
+]
+
+@pytest.fixture(autouse=True)
+def invoices():
+	frappe.db.sql("CREATE TABLE `tabInvoice` (name, region, qty)")
+	frappe.db.executemany("INSERT INTO `tabInvoice` VALUES (%s, %s, %s)", ROWS)
+
+def read_pages(page_size=2, **config):
+	config = dict({'query': "SELECT name, region, qty FROM `tabInvoice`"}, **config)
+	names, token = [], None
+	while True:
+		page = execute_query_page(config, token, page_size)
+		assert page['success'], page.get('message')
+		names.extend(row['name'] for row in page['data'])
+		if not page['has_more']:
+			return names
+		token = page['next_page_token']
+
+def expected(*keys):
+	"""Names sorted like the page query: NULLs first ascending and last descending"""
+	# The unique name key follows the direction of the last key
+	rows = sorted(ROWS, key=lambda row: row[0], reverse=keys[-1][1])
+	for index, descending in reversed(keys):
+		rows.sort(key=lambda row: (row[index] is not None, row[index]), reverse=descending)
+	return [row[0] for row in rows]
+
+@pytest.mark.parametrize('page_size', [1, 2, 3, 8])
+@pytest.mark.parametrize('sort_fields, keys', [
+	(['region'], [(1, False)]),
+	([{'field': 'region', 'order': 'desc'}], [(1, True)]),
+	(['qty', {'field': 'region', 'order': 'desc'}], [(2, False), (1, True)]),
+	([{'field': 'qty', 'order': 'desc'}, 'region'], [(2, True), (1, False)])
+])
+def test_pages_cover_duplicate_and_null_keys_once(sort_fields, keys, page_size):
+	names = read_pages(page_size, sort_fields=sort_fields)
+	assert names == expected(*keys)
+	assert sorted(names) == [row[0] for row in ROWS]
+
+def test_grouping_fields_are_the_default_sort_keys():
+	assert read_pages(grouping_fields=['region']) == expected((1, False))
+
+def test_unique_field_alone():
+	assert read_pages(3) == [row[0] for row in ROWS]
+
+def test_token_is_bound_to_the_filter_values():
+	config = {
+		'query': "SELECT name, region, qty FROM `tabInvoice`",
+		'filters': [{'field': 'qty', 'operator': '=', 'value': 5}]
+	}
+	page = execute_query_page(config, None, 1)
+	config['filters'][0]['value'] = 1
+	result = execute_query_page(config, page['next_page_token'], 1)
+	assert not result['success']
+	assert 'does not belong' in result['message']
@@ -0,0 +1,93 @@
+import frappe
+import pytest
+
+from jmit_report_builder.api import procedures
+from jmit_report_builder.api.query_engine import execute_query
+
+FILTERS = [
+	{'field': 'from_date', 'operator': '>=', 'value': '2024-01-01'},
+	{'field': 'region', 'operator': 'IN', 'value': ['East', 'West']}
+]
+
+class ProcedureCursor:
+	"""A driver cursor over fixed result sets, ending with the CALL status set"""
+	def __init__(self, result_sets):
+		self.result_sets = list(result_sets) + [(None, [])]
+		self.index = 0
+		self.fetched = 0
+		self.executed = None
+		self.closed = False
+
+	def execute(self, sql, values=None):
+		self.executed = (sql, values)
+
+	@property
+	def description(self):
+		columns = self.result_sets[self.index][0]
+		return [(column,) for column in columns] if columns else None
+
+	def fetchmany(self, size):
+		rows = self.result_sets[self.index][1]
+		batch, self.result_sets[self.index] = rows[:size], (self.result_sets[self.index][0], rows[size:])
+		self.fetched += len(batch)
+		return batch
+
+	def nextset(self):
+		self.index += 1
+		return True if self.index < len(self.result_sets) else None
+
+	def close(self):
+		self.closed = True
+
+@pytest.fixture
+def cursor(monkeypatch):
+	cursor = ProcedureCursor([
+		(('region', 'amount'), [('East', 10), ('West', 5), ('East', 7)]),
+		(('region', 'customers'), [('East', 2), ('West', 1)]),
+		(('generated_at',), [('2024-06-30',)])
+	])
+	monkeypatch.setattr(procedures, 'get_unbuffered_cursor', lambda: cursor)
+	return cursor
+
+@pytest.mark.parametrize('query, expected', [
+	('get_sales', ("CALL get_sales(%s, %s)", ('2024-01-01', 'East,West'))),
+	('CALL `reports`.get_sales(%s, %s);', ("CALL `reports`.get_sales(%s, %s)", ('2024-01-01', 'East,West'))),
+	('CALL get_sales(%(region)s, %(to_date)s)', ("CALL get_sales(%(region)s, %(to_date)s)", {'region': 'East,West', 'to_date': None, 'from_date': '2024-01-01'}))
+])
+def test_filters_are_bound_as_arguments(query, expected):
+	assert procedures.build_procedure_call(query, FILTERS) == expected
+
+def test_fixed_arguments_and_mismatched_placeholders():
+	assert procedures.build_procedure_call("CALL get_sales('2024-01-01', 10)") == ("CALL get_sales('2024-01-01', 10)", ())
+	with pytest.raises(frappe.ValidationError):
+		procedures.build_procedure_call("CALL get_sales('2024-01-01')", FILTERS)
+	with pytest.raises(frappe.ValidationError):
+		procedures.build_procedure_call("CALL get_sales(%s)", FILTERS)
+	with pytest.raises(frappe.ValidationError):
+		procedures.build_procedure_call("get_sales; DROP TABLE x")
+
+def test_every_result_set_is_returned(cursor):
+	result = execute_query({
+		'query': 'get_sales',
+		'query_type': 'STORED_PROCEDURE',
+		'filters': FILTERS,
+		'grouping_fields': ['region'],
+		'subtotal_fields': [{'field': 'amount', 'operation': 'SUM'}],
+		'batch_size': 2
+	})
+	assert result['success'], result.get('message')
+	assert cursor.executed == ("CALL get_sales(%s, %s)", ('2024-01-01', 'East,West'))
+	assert cursor.closed
+	subtotals = [row for row in result['data'] if row.get('_type') == 'SUBTOTAL']
+	assert [(row['_group_key']['region'], row['amount_subtotal']) for row in subtotals] == [('East', 17), ('West', 5)]
+	# Later result sets are grouped when they have the grouping fields
+	assert [row.get('_type') for row in result['result_sets'][0]['data']] == ['GROUP_HEADER', None, 'SUBTOTAL'] * 2
+	assert result['result_sets'][1] == {'data': [{'generated_at': '2024-06-30'}], 'count': 1}
+
+def test_row_limit_skips_the_remaining_result_sets(cursor):
+	frappe.conf.update(jmit_report_max_rows=2)
+	result = execute_query({'query': 'get_sales', 'query_type': 'STORED_PROCEDURE', 'filters': FILTERS})
+	assert result['partial'] is True
+	assert result['data'] == [{'region': 'East', 'amount': 10}, {'region': 'West', 'amount': 5}]
+	assert 'result_sets' not in result
+	assert cursor.closed
@@ -0,0 +1,59 @@
+import tracemalloc
+
+import frappe
+import pytest
+
+from jmit_report_builder.api import profiler
+
+@pytest.fixture(autouse=True)
+def no_execution_log():
+	frappe.conf.update(jmit_report_execution_log=0)
+	yield
+	assert not tracemalloc.is_tracing()
+
+def test_requested_profile_traces_memory_for_permitted_roles(monkeypatch):
+	with profiler.profiled('Sales', return_profile=True) as profile:
+		data = [str(i) * 10 for i in range(10000)]
+	assert profile.track_memory
+	assert profile.as_dict()['peak_memory_bytes'] > 0
+	del data
+
+	monkeypatch.setattr(frappe, 'get_roles', lambda *args: ['Report User'])
+	with profiler.profiled('Sales', return_profile=True) as profile:
+		pass
+	assert not profile.track_memory
+	assert profile.as_dict()['peak_memory_bytes'] is None
+
+	frappe.conf.update(jmit_report_profile_memory_roles=['Report User'])
+	with profiler.profiled('Sales', return_profile=True) as profile:
+		pass
+	assert profile.track_memory
+
+def test_site_setting_traces_memory_for_everyone(monkeypatch):
+	monkeypatch.setattr(frappe, 'get_roles', lambda *args: ['Guest'])
+	frappe.conf.update(jmit_report_profile_memory=1, jmit_report_execution_log=1)
+	monkeypatch.setattr(profiler, 'log_execution', lambda profile: None)
+	with profiler.profiled('Sales') as profile:
+		pass
+	assert profile.track_memory
+
+def test_overlapping_profiles_share_the_tracer():
+	outer = profiler.ExecutionProfile('Outer', track_memory=True)
+	data = [str(i) * 10 for i in range(20000)]
+	inner = profiler.ExecutionProfile('Inner', track_memory=True)
+	inner.stop()
+	# The inner profile neither stops the tracer nor resets the outer peak
+	assert tracemalloc.is_tracing()
+	del data
+	outer.stop()
+	assert outer.peak_memory > 100000
+	assert not tracemalloc.is_tracing()
+
+def test_tracer_started_elsewhere_is_left_running():
+	tracemalloc.start()
+	try:
+		profile = profiler.ExecutionProfile('Sales', track_memory=True)
+		profile.stop()
+		assert tracemalloc.is_tracing()
+	finally:
+		tracemalloc.stop()
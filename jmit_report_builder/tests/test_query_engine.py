@@ -0,0 +1,85 @@
+import datasets
+import frappe
+
+from jmit_report_builder.api import query_engine
+
+def run(**config):
+	result = query_engine.execute_query(dict({'query': datasets.get_query()}, **config))
+	assert result['success'], result.get('message')
+	return result
+
+def test_streaming_returns_the_buffered_rows(sales):
+	buffered = run()
+	streamed = run(stream=True, batch_size=7)
+	assert streamed['count'] == buffered['count'] == len(sales)
+	assert streamed['data'] == buffered['data']
+
+def test_streaming_applies_filters(sales):
+	filters = [{'field': 'status', 'operator': '=', 'value': 'Paid'}]
+	result = run(stream=True, batch_size=10, filters=filters)
+	assert result['count'] == sum(1 for row in sales if row['status'] == 'Paid')
+	assert {row['status'] for row in result['data']} == {'Paid'}
+
+def test_query_batches_hold_at_most_batch_size_rows(sales):
+	batches = list(query_engine.iter_query_batches(datasets.get_query(), batch_size=64))
+	assert [len(batch) for batch in batches] == [64, 64, 64, 8]
+
+def test_streaming_groups_like_the_buffered_run(sales):
+	config = {
+		'grouping_fields': ['region'],
+		'subtotal_fields': [{'field': 'qty', 'operation': 'SUM'}]
+	}
+	assert run(stream=True, batch_size=16, **config)['data'] == run(**config)['data']
+
+def test_ordered_queries_group_like_the_legacy_engine_unless_presorted():
+	frappe.db.sql("CREATE TABLE `tabOrders` (customer, qty)")
+	frappe.db.executemany("INSERT INTO `tabOrders` VALUES (%s, %s)", [('ACME', 1), ('acme', 2), ('ACME', 4)])
+	config = {
+		'query': 'SELECT customer, qty FROM `tabOrders` ORDER BY customer COLLATE NOCASE',
+		'grouping_fields': ['customer'],
+		'subtotal_fields': [{'field': 'qty', 'operation': 'SUM'}]
+	}
+	# A case-insensitive order interleaves keys that Python tells apart
+	subtotals = [row for row in run(**config)['data'] if row.get('_type') == 'SUBTOTAL']
+	assert [(row['_group_key']['customer'], row['qty_subtotal']) for row in subtotals] == [('ACME', 5), ('acme', 2)]
+	presorted = [row for row in run(presorted=True, **config)['data'] if row.get('_type') == 'SUBTOTAL']
+	assert len(presorted) == 3
+
+def test_stream_of_an_empty_result():
+	frappe.db.sql("CREATE TABLE `tabEmpty` (name)")
+	result = query_engine.execute_query({'query': 'SELECT name FROM `tabEmpty`', 'stream': True})
+	assert result == {'success': True, 'data': [], 'count': 0}
+
+class InterruptedStatement(Exception):
+	"""A driver error of a statement stopped by max_statement_time"""
+
+def interrupt_after(monkeypatch, batches):
+	read_batches = query_engine.iter_record_batches
+
+	def iter_record_batches(*args, **kwargs):
+		for index, batch in enumerate(read_batches(*args, **kwargs)):
+			if index == batches:
+				raise InterruptedStatement(1969, 'Query execution was interrupted (max_statement_time exceeded)')
+			yield batch
+
+	monkeypatch.setattr(query_engine, 'iter_record_batches', iter_record_batches)
+
+def test_interrupted_stream_returns_the_rows_read(monkeypatch, sales):
+	interrupt_after(monkeypatch, 3)
+	result = run(stream=True, batch_size=20)
+	assert result['partial'] is True
+	assert result['limit']['reason'] == 'max_execution_time'
+	assert result['limit']['rows_fetched'] == 60
+	assert result['count'] == 60
+	assert result['data'] == run(limits={'max_rows': 60})['data']
+
+def test_interrupted_stream_groups_the_rows_read(monkeypatch, sales):
+	config = {
+		'grouping_fields': ['region'],
+		'subtotal_fields': [{'field': 'qty', 'operation': 'SUM'}]
+	}
+	expected = run(limits={'max_rows': 40}, **config)['data']
+	interrupt_after(monkeypatch, 2)
+	result = run(stream=True, batch_size=20, **config)
+	assert result['partial'] is True
+	assert result['data'] == expected
@@ -0,0 +1,91 @@
+import random
+
+import datasets
+import frappe
+import frappe_stub
+import pytest
+
+from jmit_report_builder.api import routing
+from jmit_report_builder.api.query_engine import execute_query
+
+CONNECTOR = 'frappe_stub.connect_replica'
+
+@pytest.fixture
+def replicas(tmp_path):
+	"""Two SQLite replicas holding fewer rows than the primary"""
+	def add(name, lag, rows):
+		path = str(tmp_path / f'{name}.db')
+		db = frappe_stub.Database(path)
+		datasets.load_table(db, datasets.generate_rows(rows, cardinality=3, seed=1))
+		db.close()
+		return {'name': name, 'path': path, 'lag': lag}
+
+	entries = [add('replica-1', 0, 10), add('replica-2', 120, 20)]
+	frappe.conf.update(jmit_report_replicas=entries, jmit_report_replica_connector=CONNECTOR)
+	return entries
+
+def count_rows(**config):
+	result = execute_query(dict({'query': datasets.get_query()}, **config))
+	assert result['success'], result.get('message')
+	return result['count']
+
+def test_queries_read_from_a_fresh_replica(sales, replicas):
+	primary = frappe.local.db
+	assert count_rows() == 10
+	assert frappe.local.db is primary
+	assert routing.get_current_replica() is None
+
+def test_lagging_replicas_fall_back_to_the_primary(sales, replicas):
+	frappe.conf.update(jmit_report_replicas=replicas[1:])
+	assert count_rows() == len(sales)
+	assert frappe.cache().get_value(f"{routing.HEALTH_KEY}:replica-2") == {'healthy': True, 'lag': 120.0}
+	# A query can tolerate more lag than the site default
+	assert count_rows(max_replica_lag=300) == 20
+	frappe.conf.update(jmit_report_replicas=replicas[:1])
+	replicas[0]['lag'] = 5
+	frappe.cache().data.clear()
+	assert count_rows(max_replica_lag=1) == len(sales)
+
+def test_unreachable_replicas_are_skipped_until_the_next_check(sales, replicas, monkeypatch):
+	attempts = []
+
+	def connect_replica(replica):
+		attempts.append(replica['name'])
+		raise ConnectionError('connection refused')
+
+	monkeypatch.setattr(routing, 'connect_replica', connect_replica)
+	frappe.conf.update(jmit_report_replicas=replicas[:1])
+	assert count_rows() == len(sales)
+	assert count_rows() == len(sales)
+	assert attempts == ['replica-1']
+	assert frappe.cache().get_value(f"{routing.HEALTH_KEY}:replica-1")['healthy'] is False
+
+def test_nested_routing_keeps_the_chosen_connection(replicas):
+	with routing.read_replica() as name:
+		assert name == 'replica-1'
+		db = frappe.local.db
+		with routing.read_replica() as nested:
+			assert nested == 'replica-1'
+			assert frappe.local.db is db
+		assert routing.get_current_replica() == 'replica-1'
+	assert routing.get_current_replica() is None
+
+def test_without_replicas_the_primary_is_used():
+	primary = frappe.local.db
+	with routing.read_replica() as name:
+		assert name is None
+		assert frappe.local.db is primary
+
+def test_heavier_replicas_come_first_more_often():
+	random.seed(3)
+	replicas = [{'name': 'small', 'weight': 1}, {'name': 'large', 'weight': 9}]
+	first = [routing.order_replicas(replicas)[0]['name'] for _ in range(2000)]
+	assert 0.85 < first.count('large') / len(first) < 0.95
+
+def test_replica_status(replicas):
+	status = routing.get_replica_status(refresh=1)
+	assert status['success']
+	assert status['max_lag'] == routing.DEFAULT_MAX_REPLICA_LAG
+	assert [(r['name'], r['healthy'], r['lag']) for r in status['replicas']] == [
+		('replica-1', True, 0.0), ('replica-2', True, 120.0)
+	]
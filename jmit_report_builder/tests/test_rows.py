@@ -0,0 +1,68 @@
+import io
+import json
+import pickle
+
+import pytest
+
+from jmit_report_builder.api.jobs import write_json
+from jmit_report_builder.api.rows import Record, format_result, to_records
+from jmit_report_builder.api.wire import WireFormat, encode_result
+
+FIELDS = ['region', 'qty']
+
+def grouped_result():
+	records = to_records(FIELDS, [('East', 2), ('East', 3)])
+	return {
+		'success': True,
+		'data': [
+			{'_type': 'GROUP_HEADER', '_group_key': 'East', '_record_count': 2},
+			*records,
+			{'_type': 'SUBTOTAL', '_group_key': 'East', 'qty_subtotal': 5}
+		],
+		'count': 4,
+		'result_sets': [{'data': to_records(['name'], [('A',)]), 'count': 1}]
+	}
+
+def contains_record(value):
+	if isinstance(value, Record):
+		return True
+	if isinstance(value, dict):
+		return any(contains_record(item) for item in value.values())
+	if isinstance(value, list):
+		return any(contains_record(item) for item in value)
+	return False
+
+def test_record_reads_like_a_dict_and_pickles():
+	record = to_records(FIELDS, [('East', 2)])[0]
+	assert list(record) == FIELDS
+	assert dict(record) == record.as_dict() == {'region': 'East', 'qty': 2}
+	assert record['qty'] == record[1] == record.qty == 2
+	assert pickle.loads(pickle.dumps(record)) == record
+
+@pytest.mark.parametrize('row_format', ['dict', 'compact', 'columnar'])
+def test_formatted_results_hold_no_records(row_format):
+	assert not contains_record(format_result(grouped_result(), row_format))
+
+def test_json_output_of_each_row_format():
+	decoded = json.loads(encode_result(format_result(grouped_result()), WireFormat('dict', 'json', None)))
+	assert decoded['data'][1:3] == [{'region': 'East', 'qty': 2}, {'region': 'East', 'qty': 3}]
+	assert decoded['result_sets'] == [{'data': [{'name': 'A'}], 'count': 1}]
+
+	decoded = json.loads(encode_result(format_result(grouped_result(), 'compact'), WireFormat('compact', 'json', None)))
+	assert decoded['columns'] == FIELDS
+	assert decoded['data'][1:3] == [['East', 2], ['East', 3]]
+	assert decoded['data'][0] == {'_type': 'GROUP_HEADER', '_group_key': 'East', '_record_count': 2}
+
+def test_msgpack_output_is_columnar():
+	msgpack = pytest.importorskip('msgpack')
+	body = encode_result(format_result(grouped_result(), 'columnar'), WireFormat('columnar', 'msgpack', None))
+	decoded = msgpack.unpackb(body)
+	assert decoded['columns'] == FIELDS
+	assert decoded['values'] == [['East', 'East'], [2, 3]]
+	assert decoded['markers']['positions'] == [0, 2]
+	assert decoded['result_sets'] == [{'columns': ['name'], 'values': [['A']], 'markers': {'positions': [], 'rows': []}, 'count': 1}]
+
+def test_json_export_writes_records_as_objects():
+	fileobj = io.BytesIO()
+	assert write_json([to_records(FIELDS, [('East', 2)]), [{'_type': 'SUBTOTAL', 'qty_subtotal': 2}]], fileobj) == 2
+	assert json.loads(fileobj.getvalue()) == [{'region': 'East', 'qty': 2}, {'_type': 'SUBTOTAL', 'qty_subtotal': 2}]
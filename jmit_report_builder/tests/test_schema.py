@@ -0,0 +1,69 @@
+import frappe
+import pytest
+
+from jmit_report_builder.api import query_engine, schema
+
+ROWS = [
+	{'table_name': 'tabCustomer', 'table_type': 'BASE TABLE', 'column_name': 'name', 'data_type': 'varchar', 'is_nullable': 'NO'},
+	{'table_name': 'tabCustomer', 'table_type': 'BASE TABLE', 'column_name': 'customer_group', 'data_type': 'varchar', 'is_nullable': 'YES'},
+	{'table_name': 'tabCustomer Group', 'table_type': 'BASE TABLE', 'column_name': 'name', 'data_type': 'varchar', 'is_nullable': 'NO'},
+	{'table_name': 'tabSales Invoice', 'table_type': 'BASE TABLE', 'column_name': 'customer', 'data_type': 'varchar', 'is_nullable': 'YES'},
+	{'table_name': 'tabSales Invoice', 'table_type': 'BASE TABLE', 'column_name': 'grand_total', 'data_type': 'decimal', 'is_nullable': 'YES'},
+	{'table_name': 'sales_by_customer', 'table_type': 'VIEW', 'column_name': None, 'data_type': None, 'is_nullable': None}
+]
+
+@pytest.fixture(autouse=True)
+def loads(monkeypatch):
+	calls = []
+
+	def load_schema_rows():
+		calls.append(1)
+		return ROWS
+
+	monkeypatch.setattr(schema, 'load_schema_rows', load_schema_rows)
+	monkeypatch.setattr(schema, '_catalogs', {})
+	return calls
+
+def test_catalog_is_loaded_once_until_invalidated(loads):
+	catalog = schema.get_schema_catalog()
+	assert schema.get_schema_catalog() is catalog
+	assert catalog.get_columns('tabCustomer') == [
+		{'COLUMN_NAME': 'name', 'DATA_TYPE': 'varchar', 'IS_NULLABLE': 'NO'},
+		{'COLUMN_NAME': 'customer_group', 'DATA_TYPE': 'varchar', 'IS_NULLABLE': 'YES'}
+	]
+	assert catalog.get_columns('sales_by_customer') == []
+	assert len(loads) == 1
+
+	schema.invalidate_schema_cache()
+	assert schema.get_schema_catalog() is not catalog
+	assert len(loads) == 2
+
+def test_other_workers_reload_after_a_generation_bump(loads):
+	schema.get_schema_catalog()
+	# Another worker invalidated the cache: only the shared generation changed
+	frappe.cache().set_value(schema.GENERATION_KEY, 5)
+	assert schema.get_schema_catalog().generation == 5
+	assert len(loads) == 2
+
+def test_catalog_expires_after_the_ttl(loads):
+	frappe.conf.update(jmit_report_schema_cache_ttl=1)
+	catalog = schema.get_schema_catalog()
+	catalog.loaded_at -= 2
+	assert schema.get_schema_catalog() is not catalog
+
+def test_tables_are_ranked_without_their_prefix():
+	catalog = schema.get_schema_catalog()
+	assert catalog.search_tables('customer') == ['tabCustomer', 'tabCustomer Group', 'sales_by_customer']
+	assert catalog.search_tables('tabSales') == ['tabSales Invoice', 'sales_by_customer']
+	assert catalog.search_tables('sinv') == ['tabSales Invoice']
+	assert catalog.search_tables('') == catalog.table_names[:schema.DEFAULT_SEARCH_LIMIT]
+
+def test_column_search_and_designer_endpoints():
+	result = schema.search_schema('cust')
+	assert result['columns'] == [
+		{'table': 'tabSales Invoice', 'column': 'customer', 'data_type': 'varchar'},
+		{'table': 'tabCustomer', 'column': 'customer_group', 'data_type': 'varchar'}
+	]
+	assert schema.search_schema('name', table_name='tabCustomer')['tables'] == []
+	assert query_engine.get_available_tables('inv')['data'] == ['tabSales Invoice']
+	assert [c['COLUMN_NAME'] for c in query_engine.get_table_columns('tabSales Invoice')['data']] == ['customer', 'grand_total']
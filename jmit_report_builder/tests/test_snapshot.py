@@ -0,0 +1,86 @@
+import frappe
+import pytest
+
+from jmit_report_builder.api import snapshot
+
+QUERY = """
+	SELECT region, SUM(amount) AS total, COUNT(*) AS entries
+	FROM `tabSales Entry`
+	GROUP BY region
+	ORDER BY region DESC
+"""
+
+@pytest.fixture
+def report(monkeypatch):
+	frappe.db.sql("CREATE TABLE `tabSales Entry` (name, region, amount, modified)")
+	frappe.db.executemany(
+		"INSERT INTO `tabSales Entry` VALUES (%s, %s, %s, %s)",
+		[(f'SE-{i}', region, 10, '2024-01-01') for i, region in enumerate(['East', 'West', 'North'] * 2)]
+	)
+	doc = frappe.get_doc({
+		'doctype': 'JMIT Report',
+		'name': 'Regional Sales',
+		'materialized': 1,
+		'query_type': 'SQL',
+		'report_query': QUERY,
+		'source_table': 'tabSales Entry',
+		'partition_field': 'region',
+		'snapshot_table': None,
+		'last_watermark': None
+	})
+	monkeypatch.setattr(frappe, 'get_doc', lambda doctype, name=None: doc)
+	# Refreshes store their state on the report
+	monkeypatch.setattr(frappe.local.db, 'set_value', lambda doctype, name, values, **kwargs: doc.update(values))
+	return doc
+
+def read_snapshot(doc):
+	return frappe.db.sql(snapshot.get_snapshot_query(doc))
+
+def test_first_refresh_rebuilds_the_snapshot(report):
+	assert snapshot.refresh_snapshot(report.name) is None
+	assert report.snapshot_table == snapshot.get_snapshot_table(report.name)
+	assert report.last_watermark == '2024-01-01'
+	assert read_snapshot(report) == [('West', 20, 2), ('North', 20, 2), ('East', 20, 2)]
+
+def test_later_refreshes_replace_only_changed_partitions(report):
+	snapshot.refresh_snapshot(report.name)
+	frappe.db.sql("UPDATE `tabSales Entry` SET amount = 15, modified = '2024-02-01' WHERE name = 'SE-1'")
+	frappe.db.sql("INSERT INTO `tabSales Entry` VALUES ('SE-9', 'South', 5, '2024-02-02')")
+	# Changes older than the watermark are not picked up until a full rebuild
+	frappe.db.sql("UPDATE `tabSales Entry` SET amount = 99 WHERE name = 'SE-0'")
+
+	assert snapshot.refresh_snapshot(report.name) == 2
+	assert report.last_watermark == '2024-02-02'
+	assert read_snapshot(report) == [('West', 25, 2), ('South', 5, 1), ('North', 20, 2), ('East', 20, 2)]
+
+	assert snapshot.refresh_snapshot(report.name, full=True) is None
+	assert ('East', 109, 2) in read_snapshot(report)
+
+def test_moved_and_deleted_rows_refresh_their_old_partition(report):
+	snapshot.refresh_snapshot(report.name)
+	frappe.db.sql("UPDATE `tabSales Entry` SET region = 'West', modified = '2024-02-01' WHERE name = 'SE-0'")
+	frappe.db.sql("DELETE FROM `tabSales Entry` WHERE region = 'North'")
+
+	assert snapshot.refresh_snapshot(report.name) == 3
+	assert read_snapshot(report) == [('West', 30, 3), ('East', 10, 1)]
+	# The stored counts now match the source, so nothing is refreshed again
+	assert snapshot.refresh_snapshot(report.name) == 0
+
+def test_refreshing_needs_write_permission(report, monkeypatch):
+	def deny(*args, **kwargs):
+		raise frappe.PermissionError('Not permitted')
+
+	monkeypatch.setattr(frappe, 'has_permission', deny)
+	assert snapshot.refresh_report_snapshot(report.name) == {'success': False, 'message': 'Not permitted'}
+	assert report.snapshot_table is None
+
+def test_refresh_requires_a_partitioned_sql_report(report):
+	report.partition_field = None
+	with pytest.raises(frappe.ValidationError):
+		snapshot.refresh_snapshot(report.name)
+
+def test_snapshot_order_follows_the_output_columns():
+	assert snapshot.get_output_order_by("SELECT r.region AS area, SUM(amount) AS total FROM t r GROUP BY r.region ORDER BY area DESC, total") == '`area` DESC, `total` ASC'
+	# Terms after an expression that is not an output column are dropped
+	assert snapshot.get_output_order_by("SELECT region FROM t ORDER BY region, LENGTH(name)") == '`region` ASC'
+	assert snapshot.get_snapshot_filters([{'field': 'r.region', 'value': 'East'}]) == [{'field': 'region', 'value': 'East'}]
@@ -0,0 +1,108 @@
+import frappe
+import pytest
+import re
+
+from jmit_report_builder.api.filters import compile_query
+from jmit_report_builder.api.sql_parser import ParsedQuery, add_row_limit
+
+@pytest.fixture(autouse=True)
+def orders():
+	frappe.db.sql("CREATE TABLE `tabOrder` (name, region, qty)")
+	frappe.db.executemany("INSERT INTO `tabOrder` VALUES (%s, %s, %s)", [
+		('A', 'North', 1), ('B', 'North', 5), ('C', 'South', 10)
+	])
+
+def compile_sql(query, field, value=1, operator='='):
+	sql, values = compile_query(query, [{'field': field, 'operator': operator, 'value': value}])
+	return ' '.join(sql.split()), values
+
+def run(query, field, value=1, operator='='):
+	sql, values = compile_sql(query, field, value, operator)
+	return frappe.db.sql(sql, values)
+
+@pytest.mark.parametrize('query', [
+	"SELECT name, CASE WHEN qty > 2 THEN 1 ELSE 0 END flag FROM `tabOrder`",
+	"SELECT name, CASE WHEN qty > 2 THEN 1 ELSE 0 END AS flag FROM `tabOrder`",
+	"SELECT name, (CASE WHEN qty > 2 THEN 1 ELSE 0 END) flag FROM `tabOrder`"
+])
+def test_case_alias_is_replaced_by_its_expression(query):
+	sql, _ = compile_sql(query, 'flag')
+	assert re.search(r"WHERE \(+CASE WHEN qty > 2 THEN 1 ELSE 0 END\)+ = %s$", sql)
+	assert [row[0] for row in run(query, 'flag')] == ['B', 'C']
+
+@pytest.mark.parametrize('item, name', [
+	("qty AS `Order Qty`", 'order qty'),
+	("qty `Order Qty`", 'order qty'),
+	('qty AS "Order Qty"', 'order qty'),
+	("CASE WHEN qty > 2 THEN 'big' END size", 'size'),
+	("NULL placeholder", 'placeholder'),
+	("o.qty", 'qty')
+])
+def test_select_item_names(item, name):
+	parsed = ParsedQuery(f"SELECT {item} FROM `tabOrder` o")
+	assert list(parsed.select_items) == [name]
+
+@pytest.mark.parametrize('item', [
+	"qty DIV 2",
+	"qty IS NOT NULL",
+	"CASE WHEN qty THEN 1 END",
+	"region COLLATE utf8mb4_bin"
+])
+def test_operands_are_not_read_as_aliases(item):
+	assert ParsedQuery(f"SELECT {item} FROM `tabOrder`").select_items == {}
+
+def test_quoted_alias_filter():
+	query = "SELECT name, qty * 2 AS `Double Qty` FROM `tabOrder`"
+	sql, _ = compile_sql(query, '`Double Qty`', 10, '>=')
+	assert sql.endswith("WHERE (qty * 2) >= %s")
+	assert [row[0] for row in run(query, '`Double Qty`', 10, '>=')] == ['B', 'C']
+
+def test_subquery_clauses_are_left_alone():
+	query = (
+		"SELECT name, (SELECT COUNT(*) FROM `tabOrder` i WHERE i.region = o.region) AS peers "
+		"FROM (SELECT * FROM `tabOrder` WHERE qty > 0 ORDER BY qty) o ORDER BY name"
+	)
+	sql, _ = compile_sql(query, 'region', 'North')
+	assert sql.endswith(") o WHERE region = %s ORDER BY name")
+	assert run(query, 'region', 'North') == [('A', 2), ('B', 2)]
+
+def test_subquery_alias_goes_into_where():
+	query = "SELECT name, (SELECT MAX(qty) FROM `tabOrder`) AS top FROM `tabOrder` o"
+	sql, _ = compile_sql(query, 'top', 10)
+	assert sql.endswith("o WHERE ((SELECT MAX(qty) FROM `tabOrder`)) = %s")
+	assert len(run(query, 'top', 10)) == 3
+
+def test_aggregate_alias_goes_into_having():
+	query = "SELECT region, SUM(qty) AS total FROM `tabOrder` GROUP BY region ORDER BY region"
+	sql, _ = compile_sql(query, 'total', 6, '>=')
+	assert ParsedQuery(query).select_items['total'].aggregate
+	assert sql == "SELECT region, SUM(qty) AS total FROM `tabOrder` GROUP BY region HAVING total >= %s ORDER BY region"
+	assert run(query, 'total', 6, '>=') == [('North', 6), ('South', 10)]
+
+def test_cte_column_is_filtered_inside_the_cte():
+	query = "WITH big AS (SELECT * FROM `tabOrder`) SELECT name FROM big"
+	sql, _ = compile_sql(query, 'big.qty', 5, '>')
+	assert sql == "WITH big AS (SELECT * FROM `tabOrder` WHERE qty > %s) SELECT name FROM big"
+
+def test_window_alias_is_filtered_on_the_output():
+	query = "SELECT name, ROW_NUMBER() OVER (ORDER BY qty DESC) AS position FROM `tabOrder`"
+	sql, _ = compile_sql(query, 'position', 1)
+	assert sql.endswith("AS _jmit_filtered WHERE position = %s")
+	assert run(query, 'position', 1) == [('C', 1)]
+
+def test_compound_queries_are_wrapped():
+	query = "SELECT name FROM `tabOrder` UNION SELECT region FROM `tabOrder`"
+	sql, _ = compile_sql(query, 'name', 'North')
+	assert sql.startswith("SELECT * FROM (SELECT name") and sql.endswith("AS _jmit_filtered WHERE name = %s")
+	assert run(query, 'name', 'North') == [('North',)]
+
+def test_existing_where_is_kept():
+	query = "SELECT name FROM `tabOrder` WHERE region = 'North' OR qty > 5"
+	assert [row[0] for row in run(query, 'qty', 5, '<')] == ['A']
+
+@pytest.mark.parametrize('query, expected', [
+	("SELECT name FROM `tabOrder` ORDER BY qty", "SELECT name FROM `tabOrder` ORDER BY qty LIMIT 2"),
+	("SELECT name FROM `tabOrder` LIMIT 10;", "SELECT * FROM (SELECT name FROM `tabOrder` LIMIT 10) AS _jmit_limited LIMIT 2")
+])
+def test_row_limit(query, expected):
+	assert add_row_limit(ParsedQuery(query), 2) == expected
@@ -0,0 +1,96 @@
+import random
+from collections import Counter
+
+import datasets
+import pytest
+
+from jmit_report_builder.api.rows import to_records
+from jmit_report_builder.api.statistics import (
+	HyperLogLog, NumericStats, SpaceSaving, TextStats, get_batch_statistics
+)
+
+def test_space_saving_keeps_heavy_hitters_through_evictions():
+	rng = random.Random(5)
+	stream = ['heavy-%d' % (i % 3) for i in range(3000)] + ['rare-%d' % i for i in range(5000)]
+	rng.shuffle(stream)
+	sketch = SpaceSaving(capacity=20)
+	for value in stream:
+		sketch.add(value)
+
+	truth = Counter(stream)
+	assert len(sketch.counts) == 20
+	assert len(sketch.heap) == 20
+	top = sketch.top(3)
+	assert sorted(entry['value'] for entry in top) == ['heavy-0', 'heavy-1', 'heavy-2']
+	for value, count in sketch.counts.items():
+		# Counts are upper bounds that overestimate by at most N / capacity
+		assert truth[value] <= count <= truth[value] + len(stream) // 20
+
+def test_space_saving_weighted_batches_match_unit_adds_without_eviction():
+	values = ['a', 'b', 'a', 'c', 'a', 'b']
+	single, batched = SpaceSaving(), SpaceSaving()
+	for value in values:
+		single.add(value)
+	batched.update(Counter(values))
+	assert single.top() == batched.top() == [
+		{'value': 'a', 'count': 3}, {'value': 'b', 'count': 2}, {'value': 'c', 'count': 1}
+	]
+
+def test_hyperloglog_estimate_is_close():
+	sketch = HyperLogLog()
+	sketch.update('value-%d' % i for i in range(20000))
+	# Repeated values do not change the registers
+	sketch.update('value-%d' % i for i in range(5000))
+	assert sketch.count() == pytest.approx(20000, rel=0.05)
+	# The hash does not depend on PYTHONHASHSEED, so every process agrees
+	assert sketch.count() == 20402
+
+	small = HyperLogLog()
+	small.update(['x', 'y', 'z', 'x'])
+	assert small.count() == 3
+
+def test_text_stats_count_nulls_and_stringify_values():
+	stats = TextStats()
+	stats.update(['a', None, '', 'a', 1, '1'])
+	result = stats.as_dict()
+	assert result['count'] == 4
+	assert result['null_count'] == 2
+	assert result['approx_distinct'] == 2
+	assert result['top_values'] == [{'value': 'a', 'count': 2}, {'value': '1', 'count': 2}]
+
+def test_numeric_stats_update_and_merge_agree():
+	values = [3, None, '4.5', 10, '', -2]
+	whole = NumericStats()
+	whole.update(values)
+	halves = NumericStats()
+	halves.update(values[:3])
+	other = NumericStats()
+	other.update(values[3:])
+	halves.merge(other.count, other.sum, other.min, other.max, other.mean, other.m2, other.null_count)
+
+	assert whole.as_dict() == pytest.approx(halves.as_dict())
+	assert whole.as_dict() == pytest.approx({
+		'min': -2.0, 'max': 10.0, 'sum': 15.5, 'count': 4, 'null_count': 2,
+		'avg': 3.875, 'variance': 73.1875 / 3
+	})
+
+@pytest.mark.parametrize('convert', [list, lambda rows: to_records(list(rows[0]), [list(row.values()) for row in rows])])
+def test_batch_statistics_skip_group_rows(convert):
+	rows = convert(datasets.generate_rows(300, cardinality=5, seed=3))
+	marked = [{'_type': 'GROUP_HEADER', '_group_key': 'x', '_record_count': 300}] + list(rows[:150])
+	marked += [{'_type': 'SUBTOTAL', '_group_key': 'x', 'qty_subtotal': 1}] + list(rows[150:])
+
+	stats = get_batch_statistics([marked[:100], marked[100:]])
+	assert stats['total_rows'] == 300
+	assert stats == dict(get_batch_statistics([rows]), generated_at=stats['generated_at'])
+	assert stats['numeric_fields']['qty']['count'] + stats['numeric_fields']['qty']['null_count'] == 300
+	assert 'region' in stats['text_fields']
+
+def test_columnar_numeric_summary_matches_row_statistics():
+	pytest.importorskip('numpy')
+	rows = datasets.generate_rows(400, cardinality=9, seed=8)
+	plain = get_batch_statistics([rows[:250], rows[250:]])
+	columnar = get_batch_statistics([rows[:250], rows[250:]], backend='columnar')
+	for field, field_stats in plain['numeric_fields'].items():
+		assert columnar['numeric_fields'][field] == pytest.approx(field_stats)
+	assert columnar['text_fields'] == plain['text_fields']
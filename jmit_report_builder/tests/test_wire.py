@@ -0,0 +1,85 @@
+import gzip
+
+import frappe
+import pytest
+
+from jmit_report_builder.api import wire
+from jmit_report_builder.api.query_engine import execute_query
+
+@pytest.fixture
+def installed(monkeypatch):
+	"""Treat every optional encoding and compression as installed"""
+	monkeypatch.setattr(wire, 'is_available', lambda name: True)
+
+@pytest.fixture
+def headers(monkeypatch):
+	values = {}
+	monkeypatch.setattr(frappe, 'get_request_header', lambda key, default=None: values.get(key, default))
+	return values
+
+@pytest.mark.parametrize('accept, expected', [
+	(None, 'json'),
+	('text/html, */*', 'json'),
+	('application/json;q=0.5, application/msgpack', 'msgpack'),
+	('application/vnd.apache.arrow.stream;q=0.9, application/x-msgpack;q=0.8', 'arrow'),
+	('application/msgpack;q=0', 'json')
+])
+def test_encoding_follows_the_accept_qualities(installed, accept, expected):
+	assert wire.negotiate_encoding(accept) == expected
+
+def test_compression_prefers_zstd(installed):
+	assert wire.negotiate_compression('gzip, deflate, br, zstd') == 'zstd'
+	assert wire.negotiate_compression('gzip;q=1, zstd;q=0') == 'gzip'
+	assert wire.negotiate_compression('identity') is None
+
+def test_auto_negotiation_reads_the_request_headers(installed, headers):
+	headers.update({'Accept': 'application/msgpack', 'Accept-Encoding': 'gzip'})
+	assert wire.negotiate_wire_format({'encoding': 'auto', 'compression': 'auto'}) == ('columnar', 'msgpack', 'gzip')
+	assert wire.negotiate_wire_format({}) == ('dict', 'json', None)
+
+def test_unsupported_and_missing_formats_are_rejected(monkeypatch):
+	with pytest.raises(frappe.ValidationError):
+		wire.negotiate_wire_format({'encoding': 'xml'})
+	with pytest.raises(frappe.ValidationError):
+		wire.negotiate_wire_format({'compression': 'brotli'})
+	monkeypatch.setattr(wire, 'get_optional_module', lambda name: None)
+	with pytest.raises(frappe.ValidationError, match='requires the pyarrow package'):
+		wire.negotiate_wire_format({'encoding': 'arrow'})
+
+def test_arrow_needs_the_columnar_row_format(installed):
+	with pytest.raises(frappe.ValidationError):
+		wire.negotiate_wire_format({'encoding': 'arrow', 'row_format': 'compact'})
+
+def test_small_bodies_are_not_compressed():
+	assert wire.compress(b'x' * (wire.MIN_COMPRESS_BYTES - 1), 'gzip') is None
+	body = b'{"data": []}' * 200
+	assert gzip.decompress(wire.compress(body, 'gzip')) == body
+
+@pytest.mark.parametrize('row_format', ['compact', 'columnar'])
+def test_row_formats_hold_the_dict_rows(sales, row_format):
+	config = {
+		'query': 'SELECT region, qty FROM `tabBenchmark Sales`',
+		'grouping_fields': ['region'],
+		'subtotal_fields': [{'field': 'qty', 'operation': 'SUM'}]
+	}
+	rows = execute_query(config)['data']
+	result = execute_query(dict(config, row_format=row_format))
+	details = [row for row in rows if '_type' not in row]
+	markers = [row for row in rows if '_type' in row]
+
+	assert result['count'] == len(rows)
+	if row_format == 'compact':
+		assert result['columns'] == ['region', 'qty']
+		assert [row for row in result['data'] if isinstance(row, list)] == [[row['region'], row['qty']] for row in details]
+		assert [row for row in result['data'] if isinstance(row, dict)] == markers
+	else:
+		assert result['values'] == [[row['region'] for row in details], [row['qty'] for row in details]]
+		assert result['markers']['rows'] == markers
+		# Each group row is placed by the number of detail rows before it
+		positions, seen = [], 0
+		for row in rows:
+			if '_type' in row:
+				positions.append(seen)
+			else:
+				seen += 1
+		assert result['markers']['positions'] == positions
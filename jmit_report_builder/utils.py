@@ -47,60 +47,18 @@ def validate_sql_query(query):
 	
 	return True, "Query is valid"
 
-def get_report_statistics(data):
+def get_report_statistics(data, backend=None):
 	"""
 	Generate statistics for report data
+	data is a list of records; use api.statistics.get_batch_statistics for
+	streamed batches. backend='columnar' computes numeric fields with NumPy
+	when it is installed.
 	"""
 	if not data or len(data) == 0:
 		return {}
 	
-	stats = {
-		'total_rows': len(data),
-		'generated_at': datetime.now().isoformat(),
-		'numeric_fields': {},
-		'text_fields': {}
-	}
-	
-	# Analyze first record to determine field types
-	first_record = data[0]
-	
-	for key, value in first_record.items():
-		if not key.startswith('_'):
-			try:
-				float(value)
-				stats['numeric_fields'][key] = {
-					'min': None,
-					'max': None,
-					'sum': 0,
-					'count': 0
-				}
-			except (TypeError, ValueError):
-				stats['text_fields'][key] = {
-					'unique_values': set()
-				}
-	
-	# Calculate statistics
-	for record in data:
-		for field in stats['numeric_fields']:
-			try:
-				val = float(record.get(field, 0) or 0)
-				stats['numeric_fields'][field]['sum'] += val
-				stats['numeric_fields'][field]['count'] += 1
-				
-				if stats['numeric_fields'][field]['min'] is None or val < stats['numeric_fields'][field]['min']:
-					stats['numeric_fields'][field]['min'] = val
-				
-				if stats['numeric_fields'][field]['max'] is None or val > stats['numeric_fields'][field]['max']:
-					stats['numeric_fields'][field]['max'] = val
-			except (TypeError, ValueError):
-				pass
-	
-	# Calculate averages
-	for field in stats['numeric_fields']:
-		if stats['numeric_fields'][field]['count'] > 0:
-			stats['numeric_fields'][field]['avg'] = stats['numeric_fields'][field]['sum'] / stats['numeric_fields'][field]['count']
-	
-	return stats
+	from jmit_report_builder.api.statistics import get_batch_statistics
+	return get_batch_statistics([data], backend)
 
 def export_report_config(report_doc):
 	"""